@@ -0,0 +1,303 @@
+"""
+Control de admisión de la API: se rechaza pronto y barato lo que no cabe.
+
+- BodyLimit: tamaño máximo del cuerpo de la petición, comprobado con
+  Content-Length y, mientras se recibe, contando los bytes; la subida se
+  corta en cuanto se pasa del límite, sin leer el resto.
+- TokenBuckets: límite de peticiones por cliente (clave de API o IP) con un
+  cubo de tokens por cliente.
+- PixelBudget: presupuesto global de píxeles en curso. Cada imagen reserva
+  los píxeles que va a ocupar decodificada (leídos de la cabecera) antes de
+  decodificarla; si no caben, se responde 503 en lugar de arriesgarse a
+  quedarse sin memoria.
+
+Los dos primeros los aplica AdmissionMiddleware antes de que la petición
+llegue a FastAPI; el presupuesto de píxeles lo reserva quien procesa la
+imagen, porque hace falta la cabecera para estimar el coste.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from starlette.responses import JSONResponse
+
+# Cabecera con la clave de API del cliente; sin ella se limita por IP
+API_KEY_HEADER = b"x-api-key"
+
+
+class RateLimited(Exception):
+    """
+    El cliente ha agotado sus tokens; debe reintentar más tarde
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"Demasiadas peticiones, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    """
+    Las imágenes en curso ya ocupan todo el presupuesto de píxeles
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"Servidor ocupado, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class BodyTooLarge(Exception):
+    """
+    El cuerpo de la petición supera el tamaño máximo
+    """
+
+
+class BodyLimit:
+    """
+    Tamaño máximo del cuerpo de las peticiones y rechazos por superarlo
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        OCR_MAX_UPLOAD_MB (0 lo desactiva)
+        """
+        max_mb = float(os.getenv("OCR_MAX_UPLOAD_MB", "50"))
+        if max_mb <= 0:
+            return None
+        return cls(int(max_mb * 2**20))
+
+    def stats(self):
+        return {"max_bytes": self.max_bytes, "rejected": self.rejected}
+
+
+class TokenBuckets:
+    """
+    Un cubo de `burst` tokens por cliente que se rellena a `rate` tokens por
+    segundo; cada petición gasta uno. Se guardan como mucho `max_clients`
+    cubos: los de los clientes que llevan más tiempo sin pedir nada se
+    descartan (un cubo descartado vuelve lleno, como si hubiera esperado).
+    """
+
+    def __init__(self, rate, burst, max_clients=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clock = clock
+        self._lock = threading.Lock()
+        # cliente -> (tokens, instante de la última actualización)
+        self._buckets = OrderedDict()
+        self._allowed = 0
+        self._rejected = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        OCR_RATE_LIMIT (peticiones por segundo y cliente; 0, por defecto, lo
+        desactiva) y OCR_RATE_BURST
+        """
+        rate = float(os.getenv("OCR_RATE_LIMIT", "0"))
+        if rate <= 0:
+            return None
+        return cls(rate, max(1.0, float(os.getenv("OCR_RATE_BURST", "10"))))
+
+    def take(self, client):
+        """
+        Gasta un token del cliente o lanza RateLimited con la espera hasta el siguiente
+        """
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+                self._allowed += 1
+            else:
+                self._rejected += 1
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            raise RateLimited(max(1, math.ceil((1 - tokens) / self.rate)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "clients": len(self._buckets),
+                "allowed": self._allowed,
+                "rejected": self._rejected,
+            }
+
+
+# Píxeles reservados y cuándo se reservaron
+Reservation = namedtuple("Reservation", "pixels started")
+
+
+class PixelBudget:
+    """
+    Presupuesto global de píxeles de las imágenes en curso.
+
+    Una reserva que no cabe se rechaza con Overloaded salvo que no haya nada
+    más en curso: una imagen mayor que todo el presupuesto se procesa sola.
+    El Retry-After se estima con la duración media de las reservas.
+    """
+
+    def __init__(self, max_pixels):
+        self.max_pixels = max_pixels
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._reservations = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._peak = 0
+        # Media móvil exponencial de la duración de las reservas
+        self._hold_seconds = 1.0
+
+    @classmethod
+    def from_env(cls):
+        """
+        OCR_INFLIGHT_MEGAPIXELS (0 lo desactiva)
+        """
+        megapixels = float(os.getenv("OCR_INFLIGHT_MEGAPIXELS", "150"))
+        if megapixels <= 0:
+            return None
+        return cls(int(megapixels * 1_000_000))
+
+    def acquire(self, pixels):
+        """
+        Reserva `pixels` del presupuesto o lanza Overloaded si no caben
+        """
+        with self._lock:
+            if self._reservations and self._in_flight + pixels > self.max_pixels:
+                self._rejected += 1
+                raise Overloaded(max(1, math.ceil(self._hold_seconds)))
+            self._in_flight += pixels
+            self._reservations += 1
+            self._admitted += 1
+            self._peak = max(self._peak, self._in_flight)
+        return Reservation(pixels, time.monotonic())
+
+    def release(self, reservation):
+        held = time.monotonic() - reservation.started
+        with self._lock:
+            self._in_flight -= reservation.pixels
+            self._reservations -= 1
+            self._hold_seconds += 0.2 * (held - self._hold_seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_pixels": self.max_pixels,
+                "in_flight_pixels": self._in_flight,
+                "in_flight": self._reservations,
+                "peak_pixels": self._peak,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "mean_hold_seconds": self._hold_seconds,
+            }
+
+
+def client_key(scope):
+    """
+    Clave de API del cliente o, si no la envía, su IP (detrás de un proxy,
+    arrancar uvicorn con --proxy-headers para que sea la del cliente)
+    """
+    for name, value in scope.get("headers", ()):
+        if name == API_KEY_HEADER and value:
+            return "key:" + value.decode("latin-1")
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def _content_length(scope):
+    for name, value in scope.get("headers", ()):
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI que aplica el límite por cliente y el tamaño máximo del
+    cuerpo a las peticiones POST antes de que se lean o se decodifiquen
+    """
+
+    def __init__(self, app, body_limit=None, rate_limiter=None):
+        self.app = app
+        self.body_limit = body_limit
+        self.rate_limiter = rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        if self.rate_limiter is not None:
+            try:
+                self.rate_limiter.take(client_key(scope))
+            except RateLimited as e:
+                await self._reject(scope, receive, send, 429, "Demasiadas peticiones, inténtalo de nuevo más tarde",
+                                   e.retry_after)
+                return
+
+        if self.body_limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.body_limit.max_bytes
+        length = _content_length(scope)
+        if length is not None and length > max_bytes:
+            self.body_limit.rejected += 1
+            await self._reject(scope, receive, send, 413, self._too_large_detail())
+            return
+
+        # Sin Content-Length (chunked) o con uno falso se cuenta al recibir
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    exceeded = True
+                    raise BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # La respuesta de error que genere la aplicación se sustituye por el 413
+            if exceeded and not started:
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            self.body_limit.rejected += 1
+            await self._reject(scope, receive, send, 413, self._too_large_detail())
+
+    def _too_large_detail(self):
+        return f"La petición supera el tamaño máximo de {self.body_limit.max_bytes / 2**20:g} MB"
+
+    @staticmethod
+    async def _reject(scope, receive, send, status_code, detail, retry_after=None):
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+        await JSONResponse({"detail": detail}, status_code=status_code, headers=headers)(scope, receive, send)
@@ -0,0 +1,70 @@
+"""
+Corpus fijo de imágenes sintéticas para los benchmarks.
+
+Fotos de texto impreso y manuscrito (fuentes Hershey de OpenCV) a varias
+resoluciones, generadas de forma determinista: el mismo nombre produce
+siempre los mismos píxeles, de modo que los resultados son comparables
+entre commits y máquinas sin guardar imágenes en el repositorio.
+"""
+import cv2
+import numpy as np
+
+PRINTED = cv2.FONT_HERSHEY_SIMPLEX
+HANDWRITTEN = cv2.FONT_HERSHEY_SCRIPT_SIMPLEX
+
+# (nombre, ancho, alto, fuente, texto)
+CORPUS = [
+    ("impreso_1mp", 1200, 900, PRINTED, "Factura numero 2024 total 1500 pesos"),
+    ("manuscrito_1mp", 1200, 900, HANDWRITTEN, "Hola mundo esto es una prueba"),
+    ("impreso_4mp", 2400, 1800, PRINTED, "Informe trimestral de ventas por region"),
+    ("manuscrito_4mp", 2400, 1800, HANDWRITTEN, "Lista de la compra pan leche huevos"),
+    ("impreso_12mp", 4000, 3000, PRINTED, "Acta de reunion del consejo directivo"),
+    ("manuscrito_12mp", 4000, 3000, HANDWRITTEN, "Notas de clase sobre procesamiento"),
+]
+
+
+def make_sample(width, height, font, text, seed=0):
+    """
+    Genera una foto sintética: papel con gradiente de luz, ruido y texto en varias líneas
+    """
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(170, 235, width, dtype=np.float32)
+    page = np.repeat(gradient[None, :], height, axis=0)
+    page += rng.normal(0, 6, size=(height, width)).astype(np.float32)
+    page = np.clip(page, 0, 255).astype(np.uint8)
+
+    scale = width / 700.0
+    thickness = max(1, int(scale * 1.5))
+    words = text.split()
+    lines = [" ".join(words[i:i + 3]) for i in range(0, len(words), 3)]
+    y = int(height * 0.2)
+    for line in lines:
+        cv2.putText(page, line, (int(width * 0.08), y), font, scale, 40, thickness, cv2.LINE_AA)
+        y += int(60 * scale)
+
+    image = cv2.cvtColor(page, cv2.COLOR_GRAY2RGB)
+    return image, "\n".join(lines)
+
+
+def encode_sample(image, extension=".jpg", quality=90):
+    """
+    Codifica la imagen RGB como la subiría un móvil (JPEG por defecto)
+    """
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if extension in (".jpg", ".jpeg") else []
+    ok, encoded = cv2.imencode(extension, cv2.cvtColor(image, cv2.COLOR_RGB2BGR), params)
+    if not ok:
+        raise ValueError(f"No se pudo codificar la imagen como {extension}")
+    return encoded.tobytes()
+
+
+def iter_corpus(max_pixels=None, names=None):
+    """
+    Recorre el corpus generando cada imagen bajo demanda: (nombre, imagen, texto esperado)
+    """
+    for index, (name, width, height, font, text) in enumerate(CORPUS):
+        if max_pixels is not None and width * height > max_pixels:
+            continue
+        if names is not None and name not in names:
+            continue
+        image, expected = make_sample(width, height, font, text, seed=index)
+        yield name, image, expected
@@ -0,0 +1,132 @@
+"""
+Benchmark de la decodificación de las imágenes subidas: latencia y memoria pico.
+
+Compara, sobre el corpus codificado como JPEG (y PNG):
+- pil: el camino anterior, Image.open + np.array (RGB) + conversión a gris
+- imdecode: cv2.imdecode directo a gris, a resolución completa
+- imdecode_governor: además decodifica reducido los JPEG que el gobernador
+  de resolución iba a reducir
+
+Ambos terminan en la imagen que recibe el recorte (el gobernador incluido,
+para que la comparación sea justa). La memoria pico se mide en un proceso
+nuevo por caso (VmHWM), porque tracemalloc no ve los buffers internos de
+PIL ni de libjpeg.
+
+Uso:
+    python benchmark_decode.py
+    python benchmark_decode.py --max-pixels 4000000 --json out.json
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmark_corpus import encode_sample, iter_corpus
+from image_decode import decode_gray
+from memory_stats import peak_rss
+from resolution import ResolutionGovernor
+
+METHODS = ("pil", "imdecode", "imdecode_governor")
+
+
+def decode(method, contents, governor):
+    """
+    Bytes subidos -> imagen en gris lista para recortar, con cada método
+    """
+    if method == "pil":
+        image_array = np.array(Image.open(io.BytesIO(contents)))
+        if image_array.ndim == 3:
+            image_array = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+        return governor.apply(image_array)[0]
+    decoded = decode_gray(contents, governor if method == "imdecode_governor" else None)
+    return governor.apply(decoded.image, decoded.text_height)[0]
+
+
+def measure_latency(method, contents, governor, repeat):
+    decode(method, contents, governor)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(method, contents, governor)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def peak_child(method, path):
+    """
+    Un caso en un proceso nuevo: RSS pico durante la decodificación
+    """
+    with open(path, "rb") as f:
+        contents = f.read()
+    governor = ResolutionGovernor()
+    before = peak_rss()
+    image_array = decode(method, contents, governor)
+    print(json.dumps({"peak_bytes": peak_rss() - before, "shape": list(image_array.shape)}))
+
+
+def measure_peak(method, path):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--peak-child", method, path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(max_pixels=None, repeat=5, formats=(".jpg", ".png")):
+    governor = ResolutionGovernor()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, image, _ in iter_corpus(max_pixels=max_pixels):
+            for extension in formats:
+                contents = encode_sample(image, extension)
+                path = os.path.join(directory, f"{name}{extension}")
+                with open(path, "wb") as f:
+                    f.write(contents)
+                for method in METHODS:
+                    peak = measure_peak(method, path)
+                    results[f"{name}{extension}.{method}"] = {
+                        "latency_ms": round(measure_latency(method, contents, governor, repeat) * 1000, 3),
+                        "peak_bytes": peak["peak_bytes"],
+                        "output_shape": peak["shape"],
+                    }
+    return results
+
+
+def report(results):
+    print(f"{'caso':<40} {'ms':>8} {'pico MB':>8}  salida")
+    for case, stats in results.items():
+        print(f"{case:<40} {stats['latency_ms']:>8.1f} {stats['peak_bytes'] / 2**20:>8.1f}  "
+              f"{'x'.join(str(side) for side in stats['output_shape'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-pixels", type=int, help="Imágenes del corpus con como mucho estos píxeles")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Guardar resultados en un fichero JSON")
+    parser.add_argument("--peak-child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.peak_child:
+        peak_child(*args.peak_child)
+        return
+
+    results = run(args.max_pixels, args.repeat)
+    report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Benchmark de la Lambda de Textract: latencia por imagen con contenedor frío y caliente.
+
+Usa un Textract local (fake_textract.FakeTextractServer) con el cliente real
+de boto3, de modo que se mide la creación del cliente y la reutilización de
+conexiones sin llamar a AWS.
+
+Uso:
+    python benchmark_lambda.py
+    python benchmark_lambda.py --latency-ms 150 --images 8 --json out.json
+    python benchmark_lambda.py --endpoint http://localhost:5000   # p.ej. moto_server
+    python benchmark_lambda.py --logging-only --log-image-kb 5120
+"""
+import argparse
+import base64
+import itertools
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from fake_textract import FakeTextractServer
+
+_counter = itertools.count()
+
+
+def make_image(size):
+    """
+    Imagen de prueba en base64; cada una distinta para no acertar en la caché
+    """
+    payload = next(_counter).to_bytes(8, "big") + os.urandom(max(0, size - 8))
+    return base64.b64encode(payload).decode("ascii")
+
+
+def event(body):
+    return {"httpMethod": "POST", "body": json.dumps(body)}
+
+
+def invoke(lambda_function, body):
+    start = time.perf_counter()
+    response = lambda_function.lambda_handler(event(body), None)
+    elapsed = time.perf_counter() - start
+    if response["statusCode"] != 200:
+        raise RuntimeError(f"Respuesta {response['statusCode']}: {response['body']}")
+    return elapsed
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def summarize(values):
+    return {
+        "p50_ms": round(statistics.median(values) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "mean_ms": round(statistics.mean(values) * 1000, 2),
+    }
+
+
+def cold_child(image_size):
+    """
+    Un contenedor frío: import del módulo y primera invocación en un proceso nuevo
+    """
+    start = time.perf_counter()
+    import lambda_function
+    imported = time.perf_counter() - start
+    first = invoke(lambda_function, {"image": make_image(image_size)})
+    print(json.dumps({"import_s": imported, "first_invocation_s": first}))
+
+
+def run_cold(image_kb, cold_runs, env):
+    runs = []
+    for _ in range(cold_runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--cold-child", "--image-kb", str(image_kb)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "import": summarize([run["import_s"] for run in runs]),
+        "first_invocation": summarize([run["first_invocation_s"] for run in runs]),
+    }
+
+
+def run_warm(image_kb, images_per_batch, repeat):
+    import lambda_function
+
+    size = image_kb * 1024
+    invoke(lambda_function, {"image": make_image(size)})
+
+    reused = [invoke(lambda_function, {"image": make_image(size)}) for _ in range(repeat)]
+
+    # Comportamiento anterior: un cliente nuevo en cada invocación
+    per_invocation = []
+    for _ in range(repeat):
+        lambda_function.set_textract_client(None)
+        per_invocation.append(invoke(lambda_function, {"image": make_image(size)}))
+
+    # Varias imágenes por invocación, con las llamadas a Textract en paralelo
+    batched = []
+    for _ in range(repeat):
+        images = [make_image(size) for _ in range(images_per_batch)]
+        batched.append(invoke(lambda_function, {"images": images}) / images_per_batch)
+
+    return {
+        "single_image_shared_client": summarize(reused),
+        "single_image_client_per_invocation": summarize(per_invocation),
+        f"per_image_in_batch_of_{images_per_batch}": summarize(batched),
+    }
+
+
+def legacy_event_log(lambda_function, event):
+    """
+    Lo que hacía el handler antes en cada invocación: el evento entero,
+    imagen en base64 incluida, serializado en el log
+    """
+    lambda_function.logger.info(f"Event received: {json.dumps(event)}")
+
+
+def run_logging(image_kb, repeat):
+    """
+    Sobrecoste del handler con una imagen grande, con el log del evento
+    completo de antes y con el registro acotado de ahora. La imagen es
+    siempre la misma: a partir de la segunda invocación sale de la caché y
+    no se mide Textract.
+    """
+    import lambda_function
+
+    # Los logs se formatean y escriben como en Lambda, pero a /dev/null. El
+    # logger de la Lambda es el raíz: sus otros manejadores (el de
+    # logging.basicConfig si ya se ha importado main) se retiran mientras
+    # tanto para no medir la escritura en la terminal
+    devnull = open(os.devnull, "w")
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    previous_handlers = lambda_function.logger.handlers[:]
+    lambda_function.logger.handlers[:] = [handler]
+    try:
+        body = {"image": make_image(image_kb * 1024)}
+        invoke(lambda_function, body)
+
+        def measure(before_handler):
+            times = []
+            peaks = []
+            for _ in range(repeat):
+                current = event(body)
+                tracemalloc.start()
+                start = time.perf_counter()
+                before_handler(current)
+                lambda_function.lambda_handler(current, None)
+                times.append(time.perf_counter() - start)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            return {**summarize(times), "peak_alloc_bytes": max(peaks)}
+
+        # tracemalloc encarece las asignaciones: los tiempos valen para comparar entre sí
+        return {
+            "full_event_log": measure(lambda current: legacy_event_log(lambda_function, current)),
+            "bounded_log": measure(lambda current: None),
+        }
+    finally:
+        lambda_function.logger.handlers[:] = previous_handlers
+        devnull.close()
+
+
+def prepare_environment():
+    # Sin caché en disco y con credenciales ficticias si no hay otras
+    os.environ.pop("OCR_CACHE_DB", None)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    # Sin las líneas EMF de cada invocación en la salida
+    os.environ.setdefault("OCR_EMF", "0")
+
+
+def run(latency_ms=80.0, image_kb=200, images_per_batch=8, repeat=20, cold_runs=5, endpoint=None,
+        log_image_kb=5120, logging_only=False):
+    """
+    Mide contenedor frío y caliente contra un Textract local (o `endpoint`)
+    y el sobrecoste del log de eventos con una imagen de `log_image_kb`
+    """
+    prepare_environment()
+    server = None
+    if not endpoint:
+        server = FakeTextractServer(latency=latency_ms / 1000).start()
+    os.environ["TEXTRACT_ENDPOINT_URL"] = endpoint or server.url
+
+    try:
+        results = {
+            "config": {
+                "latency_ms": latency_ms, "image_kb": image_kb,
+                "images_per_batch": images_per_batch, "repeat": repeat, "log_image_kb": log_image_kb,
+            },
+        }
+        if not logging_only:
+            results["cold"] = run_cold(image_kb, cold_runs, dict(os.environ))
+            results["warm"] = run_warm(image_kb, images_per_batch, repeat)
+        results["logging"] = run_logging(log_image_kb, repeat)
+        return results
+    finally:
+        if server is not None:
+            server.stop()
+
+
+def report(results):
+    for section in ("cold", "warm", "logging"):
+        if section not in results:
+            continue
+        print(f"{section}:")
+        for name, stats in results[section].items():
+            line = f"  {name:<40} p50 {stats['p50_ms']:>8.2f} ms   p95 {stats['p95_ms']:>8.2f} ms"
+            if "peak_alloc_bytes" in stats:
+                line += f"   pico {stats['peak_alloc_bytes'] / 2**20:>7.2f} MB"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=80.0,
+                        help="Latencia simulada de cada llamada a Textract")
+    parser.add_argument("--image-kb", type=int, default=200)
+    parser.add_argument("--images", type=int, default=8, help="Imágenes por petición en el modo por lotes")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--cold-runs", type=int, default=5)
+    parser.add_argument("--endpoint", help="Textract compatible ya arrancado (por defecto uno local)")
+    parser.add_argument("--log-image-kb", type=int, default=5120,
+                        help="Tamaño de la imagen con la que se mide el sobrecoste del log")
+    parser.add_argument("--logging-only", action="store_true", help="Medir solo el sobrecoste del log")
+    parser.add_argument("--json", help="Guardar los resultados en un fichero JSON")
+    parser.add_argument("--cold-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_child:
+        prepare_environment()
+        cold_child(args.image_kb * 1024)
+        return
+
+    results = run(args.latency_ms, args.image_kb, args.images, args.repeat, args.cold_runs, args.endpoint,
+                  args.log_image_kb, args.logging_only)
+
+    report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Generador de carga para la API de OCR: latencia p50/p95/p99, throughput y RSS pico.
+
+Sin --url arranca `uvicorn main:app` en un puerto libre, espera a que
+/health/ready responda 200 y mide el RSS máximo del servidor (VmHWM). Las
+imágenes salen del corpus sintético de benchmark_corpus; por defecto cada
+petición lleva bytes distintos para que no acierte en la caché de resultados.
+
+Uso:
+    python benchmark_load.py --concurrency 1,4,8 --requests 40
+    python benchmark_load.py --url http://localhost:8000 --concurrency 16
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+from benchmark_corpus import encode_sample, iter_corpus
+from memory_stats import peak_rss
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, env=None):
+    """
+    Lanza la API en un proceso aparte; la cola de trabajos no se arranca
+    """
+    env = dict(os.environ if env is None else env)
+    env.setdefault("OCR_JOB_WORKERS", "0")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+
+
+def wait_ready(url, timeout=600.0, process=None):
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"El servidor terminó con código {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=5)
+            connection.request("GET", "/health/ready")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} no estuvo listo en {timeout:.0f}s")
+
+
+def multipart_body(field, filename, content_type, data):
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    return head + data + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def run_level(url, path, payloads, concurrency, requests, unique=True):
+    """
+    Envía `requests` peticiones con `concurrency` clientes a la vez; cada
+    cliente usa su propia conexión keep-alive
+    """
+    parts = urlsplit(url)
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def client():
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=300)
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                break
+            name, data = payloads[index % len(payloads)]
+            if unique:
+                # Los bytes tras el final del JPEG se ignoran al decodificar, pero cambian el hash
+                data = data + uuid.uuid4().bytes
+            body, content_type = multipart_body("file", f"{name}.jpg", "image/jpeg", data)
+            start = time.perf_counter()
+            try:
+                connection.request("POST", path, body=body, headers={"Content-Type": content_type})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except OSError:
+                connection.close()
+                connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=300)
+                status = "error"
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+        connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+    }
+    if latencies:
+        result.update({
+            "p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        })
+    return result
+
+
+def run_load(url=None, concurrency=(1, 4), requests=20, profile="handwriting",
+             max_pixels=4_000_000, unique=True, warmup=2):
+    """
+    Ejecuta todos los niveles de concurrencia y devuelve los resultados
+    """
+    payloads = [(name, encode_sample(image)) for name, image, _ in iter_corpus(max_pixels=max_pixels)]
+    path = "/extract-text/?" + urlencode({"profile": profile})
+
+    process = None
+    if url is None:
+        url = f"http://127.0.0.1:{free_port()}"
+        process = start_server(urlsplit(url).port)
+    try:
+        started = time.perf_counter()
+        wait_ready(url, process=process)
+        ready_seconds = time.perf_counter() - started
+        if warmup:
+            run_level(url, path, payloads, 1, warmup, unique)
+
+        levels = {}
+        for level in concurrency:
+            levels[f"c{level}"] = run_level(url, path, payloads, level, requests, unique)
+            line = levels[f"c{level}"]
+            print(
+                f"  concurrencia {level:>3}: p50 {line.get('p50_ms', 0):>8.1f} ms  "
+                f"p95 {line.get('p95_ms', 0):>8.1f} ms  p99 {line.get('p99_ms', 0):>8.1f} ms  "
+                f"{line['throughput_rps']:>6.2f} req/s  {line['statuses']}"
+            )
+
+        result = {
+            "config": {
+                "url": url if process is None else "local", "profile": profile,
+                "requests_per_level": requests, "images": [name for name, _ in payloads],
+                "unique_payloads": unique,
+            },
+            "levels": levels,
+        }
+        if process is not None:
+            result["ready_seconds"] = round(ready_seconds, 3)
+            result["peak_rss_bytes"] = peak_rss(process.pid)
+        return result
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="API ya arrancada (por defecto se lanza una local)")
+    parser.add_argument("--concurrency", default="1,4,8", help="Niveles de concurrencia separados por comas")
+    parser.add_argument("--requests", type=int, default=40, help="Peticiones por nivel")
+    parser.add_argument("--profile", default="handwriting")
+    parser.add_argument("--max-pixels", type=int, default=4_000_000,
+                        help="Solo imágenes del corpus con como mucho estos píxeles")
+    parser.add_argument("--cache-hits", action="store_true",
+                        help="Repetir los mismos bytes para medir la caché de resultados")
+    parser.add_argument("--json", help="Guardar los resultados en un fichero JSON")
+    args = parser.parse_args()
+
+    results = run_load(
+        url=args.url,
+        concurrency=[int(level) for level in args.concurrency.split(",")],
+        requests=args.requests,
+        profile=args.profile,
+        max_pixels=args.max_pixels,
+        unique=not args.cache_hits,
+    )
+    if results.get("peak_rss_bytes"):
+        print(f"  RSS pico del servidor: {results['peak_rss_bytes'] / 2**20:.0f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
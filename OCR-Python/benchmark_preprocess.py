@@ -0,0 +1,89 @@
+"""
+Benchmark de los perfiles de preprocesado: latencia, memoria pico y precisión del OCR.
+
+Uso:
+    python benchmark_preprocess.py                 # latencia y memoria
+    python benchmark_preprocess.py --accuracy      # además ejecuta EasyOCR
+    python benchmark_preprocess.py --json out.json
+"""
+import argparse
+import difflib
+import json
+import statistics
+import time
+import tracemalloc
+
+from benchmark_corpus import iter_corpus
+from preprocessing import PROFILES, PreprocessBuffers, preprocess_image
+
+
+def measure(image, profile, buffers, repeat):
+    # Una pasada de calentamiento para que los buffers ya estén asignados
+    preprocess_image(image, profile, buffers)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        preprocess_image(image, profile, buffers)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    preprocess_image(image, profile, buffers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return statistics.median(timings), peak
+
+
+def accuracy(reader, processed, expected):
+    results = reader.readtext(processed)
+    text = " ".join(text for (_, text, _) in results)
+    expected = " ".join(expected.split())
+    return difflib.SequenceMatcher(None, text.lower(), expected.lower()).ratio()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--accuracy", action="store_true", help="Ejecutar EasyOCR y medir precisión")
+    parser.add_argument("--json", help="Guardar resultados en un fichero JSON")
+    args = parser.parse_args()
+
+    reader = None
+    if args.accuracy:
+        import easyocr
+        reader = easyocr.Reader(["es", "en"])
+
+    results = []
+    print(f"{'imagen':<16} {'perfil':<12} {'buffers':<8} {'ms':>8} {'pico MB':>8} {'precisión':>9}")
+    for name, image, expected in iter_corpus():
+        for profile in PROFILES:
+            for reuse in (False, True):
+                buffers = PreprocessBuffers() if reuse else None
+                latency, peak = measure(image, profile, buffers, args.repeat)
+                score = None
+                if reader is not None and reuse:
+                    score = accuracy(reader, preprocess_image(image, profile), expected)
+                results.append({
+                    "image": name,
+                    "pixels": image.shape[0] * image.shape[1],
+                    "profile": profile,
+                    "reuse_buffers": reuse,
+                    "latency_ms": latency * 1000,
+                    "peak_bytes": peak,
+                    "accuracy": score,
+                })
+                score_text = f"{score:.3f}" if score is not None else "-"
+                print(
+                    f"{name:<16} {profile:<12} {'sí' if reuse else 'no':<8} "
+                    f"{latency * 1000:>8.1f} {peak / 1e6:>8.1f} {score_text:>9}"
+                )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Suite de benchmarks sin conexión: microbenchmarks, carga sobre la API y Lambda.
+
+- micro: decodificación, preprocess_image y el recorte de página sobre el corpus sintético, y los bucles que
+  construyen las respuestas (filtrado de EasyOCR, respuestas de páginas,
+  maquetación en líneas y párrafos, conversión de bloques de Textract,
+  documento Word).
+- load: benchmark_load contra una API local, con p50/p95/p99, throughput
+  y RSS pico a varias concurrencias.
+- lambda: benchmark_lambda con un Textract local (contenedor frío y caliente
+  y sobrecoste del log con una imagen de 5 MB).
+
+Los resultados se guardan en JSON junto con el commit y la máquina; con
+--compare se comparan contra una ejecución anterior y el proceso termina con
+código 1 si alguna métrica empeora más que --threshold.
+
+Uso:
+    python benchmark_suite.py --json results/HEAD.json
+    python benchmark_suite.py --only micro,lambda --json new.json --compare base.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+SECTIONS = ("micro", "load", "lambda")
+
+
+def median_ms(fn, repeat=11, number=1):
+    """
+    Mediana del tiempo por llamada, en milisegundos
+    """
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return round(statistics.median(timings) * 1000, 4)
+
+
+def run_micro(max_pixels):
+    import benchmark_decode
+    from benchmark_corpus import iter_corpus
+    from benchmark_preprocess import measure
+    from page_crop import PageCropper
+    from preprocessing import PROFILES, PreprocessBuffers
+
+    results = {
+        "decode": benchmark_decode.run(max_pixels, formats=(".jpg",)),
+        "preprocess": {}, "crop": {}, "responses": {},
+    }
+    cropper = PageCropper()
+    for name, image, _ in iter_corpus(max_pixels=max_pixels):
+        cropped, _ = cropper.apply(image)
+        results["crop"][name] = {
+            "latency_ms": median_ms(lambda: cropper.apply(image)),
+            "kept_pixels_ratio": round(cropped.shape[0] * cropped.shape[1] / (image.shape[0] * image.shape[1]), 3),
+        }
+        for profile in PROFILES:
+            latency, peak = measure(image, profile, PreprocessBuffers(), repeat=15)
+            results["preprocess"][f"{name}.{profile}"] = {
+                "latency_ms": round(latency * 1000, 3),
+                "peak_bytes": peak,
+            }
+
+    # Bucles de construcción de respuestas con entradas sintéticas de tamaño fijo
+    import main
+    import lambda_function
+
+    easyocr_results = [
+        ([[0, i], [100, i], [100, i + 20], [0, i + 20]], f"palabra{i}", (i % 10) / 10)
+        for i in range(2000)
+    ]
+    accepted = main.filter_results(easyocr_results)
+    texts = [text for _, text, _ in accepted]
+    scores = [float(confidence) for _, _, confidence in accepted]
+    pages = [main.page_result(number, texts[:50], scores[:50]) for number in range(1, 201)]
+    docx_paragraphs = main.word_paragraphs("Documento OCR", [" ".join(texts)])
+    # Página a dos columnas de 1000 líneas, con un párrafo cada 8 líneas
+    column_results = [
+        ([[x, y], [x + 400, y], [x + 400, y + 24], [x, y + 24]], f"palabra{i}", 0.9)
+        for i, (x, y) in enumerate(
+            (column * 500, line * 32 + line // 8 * 24) for column in (0, 1) for line in range(1000)
+        )
+    ]
+    blocks = {"Blocks": [{"BlockType": "PAGE"}] + [
+        {
+            "BlockType": "LINE", "Text": f"Linea de texto numero {i}", "Confidence": 90.0 + i % 10,
+            "Geometry": {"BoundingBox": {"Left": 0.1, "Top": i * 0.001, "Width": 0.8, "Height": 0.0008}},
+        }
+        for i in range(1000)
+    ]}
+
+    results["responses"] = {
+        "filter_results_2000": {"latency_ms": median_ms(lambda: main.filter_results(easyocr_results), number=50)},
+        "layout_results_2000": {"latency_ms": median_ms(lambda: main.layout_results(column_results), number=5)},
+        "text_response_2000": {"latency_ms": median_ms(lambda: main.text_response(texts, scores), number=50)},
+        "document_response_200_pages": {"latency_ms": median_ms(lambda: main.document_response(pages), number=50)},
+        "textract_result_1000_lines": {"latency_ms": median_ms(lambda: lambda_function.textract_result(blocks), number=50)},
+        "docx_render_2000_words": {"latency_ms": median_ms(lambda: main.docx_template.render(docx_paragraphs).close(), number=50)},
+    }
+    return results
+
+
+def run_load(args):
+    from benchmark_load import run_load
+
+    return run_load(
+        url=args.url,
+        concurrency=[int(level) for level in args.concurrency.split(",")],
+        requests=args.requests,
+        max_pixels=args.max_pixels,
+    )
+
+
+def run_lambda(args):
+    import benchmark_lambda
+
+    results = benchmark_lambda.run(repeat=args.lambda_repeat, cold_runs=args.cold_runs)
+    benchmark_lambda.report(results)
+    return results
+
+
+def environment():
+    def git(*command):
+        try:
+            return subprocess.run(
+                ["git", *command], capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def flatten(data, prefix=""):
+    """
+    {"a": {"b_ms": 1}} -> {"a.b_ms": 1}, solo con valores numéricos
+    """
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def lower_is_better(path):
+    name = path.rsplit(".", 1)[-1]
+    if "throughput" in name:
+        return False
+    if name.endswith(("_ms", "_bytes", "_seconds")):
+        return True
+    return None
+
+
+def compare(current, baseline, threshold):
+    """
+    Imprime las diferencias por métrica y devuelve las regresiones
+    """
+    now = flatten({section: current.get(section, {}) for section in SECTIONS})
+    before = flatten({section: baseline.get(section, {}) for section in SECTIONS})
+    regressions = []
+    print(f"\nComparación con {baseline.get('environment', {}).get('commit') or 'la referencia'}:")
+    for path in sorted(now.keys() & before.keys()):
+        direction = lower_is_better(path)
+        if direction is None or not before[path]:
+            continue
+        change = (now[path] - before[path]) / before[path]
+        worse = change > threshold if direction else change < -threshold
+        if worse:
+            regressions.append(path)
+        if worse or abs(change) > threshold:
+            print(f"  {'PEOR ' if worse else 'mejor'} {path:<60} {before[path]:>12.3f} -> {now[path]:>12.3f} ({change:+.1%})")
+    print(f"{len(regressions)} regresiones por encima del {threshold:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", default=",".join(SECTIONS), help="Secciones a ejecutar: micro,load,lambda")
+    parser.add_argument("--max-pixels", type=int, default=4_000_000,
+                        help="Imágenes del corpus con como mucho estos píxeles")
+    parser.add_argument("--url", help="API ya arrancada para la prueba de carga")
+    parser.add_argument("--concurrency", default="1,4")
+    parser.add_argument("--requests", type=int, default=20, help="Peticiones por nivel de concurrencia")
+    parser.add_argument("--lambda-repeat", type=int, default=20)
+    parser.add_argument("--cold-runs", type=int, default=3)
+    parser.add_argument("--json", help="Guardar los resultados en un fichero JSON")
+    parser.add_argument("--compare", help="Resultados JSON de referencia")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Empeoramiento relativo que se considera regresión")
+    args = parser.parse_args()
+
+    sections = [section.strip() for section in args.only.split(",") if section.strip()]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"Secciones desconocidas: {', '.join(sorted(unknown))}")
+
+    # Sin las líneas EMF de la Lambda en la salida
+    os.environ.setdefault("OCR_EMF", "0")
+
+    results = {"environment": environment()}
+    for section in sections:
+        print(f"== {section}")
+        started = time.perf_counter()
+        if section == "micro":
+            results["micro"] = run_micro(args.max_pixels)
+        elif section == "load":
+            results["load"] = run_load(args)
+        else:
+            results["lambda"] = run_lambda(args)
+        print(f"   {time.perf_counter() - started:.1f}s")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Resultados guardados en {args.json}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -45,6 +45,9 @@ def create_lambda_zip():
     """Crear ZIP con función Lambda"""
     with zipfile.ZipFile('lambda-deployment.zip', 'w') as zip_file:
         zip_file.write('lambda_function.py')
+        zip_file.write('layout.py')
+        zip_file.write('ocr_cache.py')
+        zip_file.write('ocr_metrics.py')
     print("✅ ZIP de Lambda creado")
 
 def create_iam_role(iam_client):
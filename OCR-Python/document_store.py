@@ -0,0 +1,332 @@
+"""
+Almacén de los documentos Word generados, con caducidad y límite de tamaño.
+
+- LocalDocumentStore: ficheros repartidos en subdirectorios por los dos
+  primeros caracteres del identificador (output/ab/documento_ab....docx), de
+  modo que ningún directorio crece sin límite. Las escrituras son atómicas
+  (fichero temporal + rename).
+- S3DocumentStore: objetos en un bucket bajo un prefijo. Funciona con el
+  cliente de boto3 o con fake_textract.FakeS3Client en pruebas.
+
+Un DocumentSweeper en segundo plano borra los documentos con más de `ttl`
+segundos y, si el total supera `max_bytes`, los más antiguos hasta volver
+por debajo del límite.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from docx_writer import DOCX_MEDIA_TYPE
+
+logger = logging.getLogger(__name__)
+
+DOCX_SUFFIX = ".docx"
+
+# Nombres que genera new_name(); cualquier otro se rechaza sin tocar el disco
+_NAME_PATTERN = re.compile(r"^documento_[0-9a-f]{8,32}\.docx$")
+
+
+class DocumentNotFound(Exception):
+    """
+    El documento no existe o ya ha caducado
+    """
+
+
+def new_name():
+    return f"documento_{uuid.uuid4().hex}{DOCX_SUFFIX}"
+
+
+def valid_name(name):
+    return bool(_NAME_PATTERN.match(name))
+
+
+def _shard(name):
+    return name[len("documento_"):len("documento_") + 2]
+
+
+class DocumentStore(ABC):
+    """
+    Interfaz común. Las subclases implementan _write, _open, _delete y
+    entries(); la limpieza por caducidad y tamaño es compartida.
+    """
+
+    def __init__(self, ttl_seconds=24 * 3600, max_bytes=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"stored": 0, "expired": 0, "evicted": 0, "files": 0, "bytes": 0,
+                       "last_sweep_seconds": 0.0}
+
+    def put(self, fileobj):
+        """
+        Guarda el contenido de `fileobj` y devuelve el nombre del documento
+        """
+        name = new_name()
+        self._write(name, fileobj)
+        with self._lock:
+            self._stats["stored"] += 1
+        return name
+
+    def open(self, name):
+        """
+        (fichero, tamaño) del documento; DocumentNotFound si no existe o ha caducado
+        """
+        if not valid_name(name):
+            raise DocumentNotFound(name)
+        fileobj, size, modified = self._open(name)
+        if self.ttl_seconds and modified < time.time() - self.ttl_seconds:
+            fileobj.close()
+            raise DocumentNotFound(name)
+        return fileobj, size
+
+    def delete(self, name):
+        if valid_name(name):
+            self._delete(name)
+
+    def sweep(self, now=None):
+        """
+        Borra los documentos caducados y, si hace falta, los más antiguos
+        hasta quedar por debajo de max_bytes
+        """
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        expired = evicted = 0
+        remaining = []
+        for name, size, modified in self.entries():
+            if self.ttl_seconds and modified < now - self.ttl_seconds:
+                self._delete(name)
+                expired += 1
+            else:
+                remaining.append((modified, name, size))
+
+        total = sum(size for _, _, size in remaining)
+        if self.max_bytes is not None and total > self.max_bytes:
+            remaining.sort()
+            while remaining and total > self.max_bytes:
+                _, name, size = remaining.pop(0)
+                self._delete(name)
+                total -= size
+                evicted += 1
+
+        with self._lock:
+            self._stats["expired"] += expired
+            self._stats["evicted"] += evicted
+            self._stats["files"] = len(remaining)
+            self._stats["bytes"] = total
+            self._stats["last_sweep_seconds"] = time.perf_counter() - started
+        if expired or evicted:
+            logger.info("Documentos borrados: %d caducados, %d por tamaño (%d restantes, %d bytes)",
+                        expired, evicted, len(remaining), total)
+        return {"expired": expired, "evicted": evicted, "files": len(remaining), "bytes": total}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    @abstractmethod
+    def _write(self, name, fileobj):
+        """
+        Guarda el contenido de `fileobj` con el nombre dado
+        """
+
+    @abstractmethod
+    def _open(self, name):
+        """
+        (fichero, tamaño, fecha de modificación en segundos); DocumentNotFound si no existe
+        """
+
+    @abstractmethod
+    def _delete(self, name):
+        """
+        Borra el documento si existe
+        """
+
+    @abstractmethod
+    def entries(self):
+        """
+        (nombre, tamaño, fecha de modificación en segundos) de cada documento
+        """
+
+
+class LocalDocumentStore(DocumentStore):
+
+    def __init__(self, root, ttl_seconds=24 * 3600, max_bytes=None):
+        super().__init__(ttl_seconds, max_bytes)
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.root, _shard(name), name)
+
+    def _write(self, name, fileobj):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = f"{path}.{os.getpid()}.part"
+        try:
+            with open(partial_path, "wb") as f:
+                while True:
+                    chunk = fileobj.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def _open(self, name):
+        for path in (self.path(name), os.path.join(self.root, name)):
+            try:
+                fileobj = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            stat = os.fstat(fileobj.fileno())
+            return fileobj, stat.st_size, stat.st_mtime
+        raise DocumentNotFound(name)
+
+    def _delete(self, name):
+        for path in (self.path(name), os.path.join(self.root, name)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def entries(self):
+        # Incluye los documentos de la raíz, de cuando output/ era un directorio plano
+        directories = [self.root]
+        with os.scandir(self.root) as items:
+            directories += [item.path for item in items if item.is_dir(follow_symlinks=False)]
+        for directory in directories:
+            try:
+                items = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for item in items:
+                if not item.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:
+                    continue
+                if valid_name(item.name):
+                    yield item.name, stat.st_size, stat.st_mtime
+                elif item.name.endswith(".part") and stat.st_mtime < time.time() - 3600:
+                    # Escrituras interrumpidas
+                    try:
+                        os.remove(item.path)
+                    except FileNotFoundError:
+                        pass
+
+
+class S3DocumentStore(DocumentStore):
+    """
+    Con una regla de ciclo de vida en el bucket la caducidad la aplica S3;
+    el barrido sigue siendo necesario para el límite de tamaño.
+    """
+
+    def __init__(self, client, bucket, prefix="documents/", ttl_seconds=24 * 3600, max_bytes=None):
+        super().__init__(ttl_seconds, max_bytes)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def key(self, name):
+        return f"{self.prefix}{_shard(name)}/{name}"
+
+    def _write(self, name, fileobj):
+        # put_object es atómico: el objeto no es visible hasta que está completo
+        self.client.put_object(
+            Bucket=self.bucket, Key=self.key(name), Body=fileobj.read(),
+            ContentType=DOCX_MEDIA_TYPE,
+        )
+
+    def _open(self, name):
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key(name))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise DocumentNotFound(name)
+            raise
+        modified = response.get("LastModified")
+        modified = modified.timestamp() if isinstance(modified, datetime) else time.time()
+        return response["Body"], response["ContentLength"], modified
+
+    def _delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+
+    def entries(self):
+        token = None
+        while True:
+            params = {"Bucket": self.bucket, "Prefix": self.prefix}
+            if token:
+                params["ContinuationToken"] = token
+            response = self.client.list_objects_v2(**params)
+            for item in response.get("Contents", []):
+                name = item["Key"].rsplit("/", 1)[-1]
+                if valid_name(name):
+                    yield name, item["Size"], item["LastModified"].timestamp()
+            if not response.get("IsTruncated"):
+                break
+            token = response["NextContinuationToken"]
+
+
+class DocumentSweeper:
+    """
+    Hilo que ejecuta store.sweep() cada `interval` segundos
+    """
+
+    def __init__(self, store, interval=300.0):
+        self.store = store
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="document-sweeper", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.store.sweep()
+            except Exception:
+                logger.exception("Error limpiando documentos generados")
+            if self._stop.wait(self.interval):
+                break
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def document_store_from_env(default_root="output"):
+    """
+    Configura el almacén con OCR_OUTPUT_BACKEND (local o s3), OCR_OUTPUT_DIR,
+    OCR_OUTPUT_BUCKET, OCR_OUTPUT_PREFIX, OCR_OUTPUT_TTL_HOURS y OCR_OUTPUT_MAX_MB
+    """
+    ttl_seconds = float(os.getenv("OCR_OUTPUT_TTL_HOURS", "24")) * 3600
+    max_mb = float(os.getenv("OCR_OUTPUT_MAX_MB", "1024"))
+    max_bytes = int(max_mb * 1024 * 1024) if max_mb > 0 else None
+    backend = os.getenv("OCR_OUTPUT_BACKEND", "local")
+    if backend == "s3":
+        import boto3
+
+        client = boto3.client("s3", endpoint_url=os.getenv("S3_ENDPOINT_URL") or None)
+        return S3DocumentStore(
+            client, os.environ["OCR_OUTPUT_BUCKET"], os.getenv("OCR_OUTPUT_PREFIX", "documents/"),
+            ttl_seconds, max_bytes,
+        )
+    if backend != "local":
+        raise ValueError(f"OCR_OUTPUT_BACKEND desconocido: {backend}")
+    return LocalDocumentStore(os.getenv("OCR_OUTPUT_DIR", default_root), ttl_seconds, max_bytes)
@@ -0,0 +1,148 @@
+"""
+Documentos de varias páginas (PDF y TIFF multipágina) y archivos zip.
+
+Las páginas se rasterizan de una en una y bajo demanda: render_page abre
+el documento y convierte solo la página pedida, de modo que un PDF de 200
+páginas nunca tiene todas sus páginas en memoria a la vez. Del mismo modo,
+las entradas de un zip se descomprimen solo cuando se van a procesar.
+"""
+import io
+import os
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+PDF = "pdf"
+TIFF = "tiff"
+
+# Resolución a la que se rasterizan los PDF
+DEFAULT_PDF_DPI = 200
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+# Entradas de un zip que se procesan; el resto se ignora
+ARCHIVE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp", ".tif", ".tiff", ".pdf")
+# Tamaño máximo descomprimido de cada entrada de un zip
+MAX_ARCHIVE_MEMBER_BYTES = 64 * 2**20
+
+
+class UnsupportedDocument(Exception):
+    """
+    El documento no se puede abrir (formato dañado o dependencia ausente)
+    """
+
+
+def document_kind(content_type, contents):
+    """
+    Devuelve PDF, TIFF o None según el tipo declarado y la firma del fichero
+    """
+    head = contents[:4]
+    if content_type == "application/pdf" or head == b"%PDF":
+        return PDF
+    if content_type in ("image/tiff", "image/tif") or head in (b"II*\x00", b"MM\x00*"):
+        return TIFF
+    return None
+
+
+def _open_pdf(contents):
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise UnsupportedDocument("Para procesar PDF es necesario instalar pypdfium2")
+    try:
+        return pdfium.PdfDocument(contents)
+    except pdfium.PdfiumError as e:
+        raise UnsupportedDocument(f"PDF no válido: {e}")
+
+
+def page_count(contents, kind):
+    if kind == PDF:
+        pdf = _open_pdf(contents)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    with Image.open(io.BytesIO(contents)) as image:
+        return getattr(image, "n_frames", 1)
+
+
+def is_multipage(contents, kind):
+    """
+    True si el documento se procesa página a página: siempre un PDF, y un
+    TIFF solo si tiene más de una página. Un TIFF de una página (o que PIL
+    no abre) se procesa como una imagen más
+    """
+    if kind == PDF:
+        return True
+    try:
+        return page_count(contents, kind) > 1
+    except Exception:
+        return False
+
+
+def render_page(contents, kind, index, dpi=DEFAULT_PDF_DPI):
+    """
+    Rasteriza una sola página y la devuelve como array numpy (gris o RGB)
+    """
+    if kind == PDF:
+        pdf = _open_pdf(contents)
+        try:
+            page = pdf[index]
+            bitmap = page.render(scale=dpi / 72.0, grayscale=True)
+            array = bitmap.to_numpy()
+            # to_numpy devuelve una vista sobre el buffer de pdfium; se copia antes de cerrarlo
+            array = np.array(array[:, :, 0] if array.ndim == 3 else array)
+            bitmap.close()
+            page.close()
+            return array
+        finally:
+            pdf.close()
+
+    with Image.open(io.BytesIO(contents)) as image:
+        image.seek(index)
+        frame = image
+        if frame.mode in ("1", "P", "LA"):
+            frame = frame.convert("L")
+        elif frame.mode not in ("L", "RGB"):
+            frame = frame.convert("RGB")
+        return np.array(frame)
+
+
+def is_archive(content_type, contents):
+    return content_type in ZIP_CONTENT_TYPES or (
+        not content_type.startswith("image/") and contents[:4] == b"PK\x03\x04"
+    )
+
+
+def open_archive(contents):
+    """
+    Abre un zip y devuelve el archivo y los nombres de las entradas con
+    imágenes o documentos, en el orden en que aparecen
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(contents))
+    except zipfile.BadZipFile as e:
+        raise UnsupportedDocument(f"Zip no válido: {e}")
+
+    names = []
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+            continue
+        if not name.lower().endswith(ARCHIVE_EXTENSIONS):
+            continue
+        if info.file_size > MAX_ARCHIVE_MEMBER_BYTES:
+            archive.close()
+            raise UnsupportedDocument(f"La entrada {name} del zip supera el tamaño máximo")
+        names.append(name)
+    return archive, names
+
+
+def read_member(archive, name, lock):
+    """
+    Descomprime una entrada de un zip abierto con open_archive. Se llama
+    fuera del event loop; `lock` serializa el acceso al ZipFile, que comparten
+    las imágenes del lote en curso
+    """
+    with lock:
+        return archive.read(name)
@@ -0,0 +1,150 @@
+"""
+Documentos Word generados a partir de una plantilla cargada una sola vez.
+
+Un DOCX es un zip en el que casi todo es fijo (estilos, tema, numeración,
+fuentes...). La plantilla se lee al arrancar y esas partes se guardan ya
+comprimidas en un zip base; en cada petición solo se genera el XML del
+cuerpo (word/document.xml) y las propiedades (docProps/core.xml), que se
+añaden a una copia del zip base. No se usa el modelo de objetos de
+python-docx ni se pasa por disco: el resultado queda en un buffer
+(SpooledTemporaryFile) listo para enviarse en la respuesta.
+"""
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Estilos de la plantilla por defecto de python-docx (add_heading(..., 0) y add_heading(..., 1))
+TITLE = "Title"
+HEADING_1 = "Heading1"
+
+# Documentos más grandes se vuelcan a un fichero temporal en lugar de quedarse en memoria
+SPOOL_MAX_BYTES = 4 * 2**20
+
+# Caracteres de control que XML 1.0 no admite
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_CORE_XML = (
+    "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+    '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+    'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    "<dc:title>{title}</dc:title>"
+    "<dc:creator>OCR API</dc:creator>"
+    "<cp:revision>1</cp:revision>"
+    '<dcterms:created xsi:type="dcterms:W3CDTF">{now}</dcterms:created>'
+    '<dcterms:modified xsi:type="dcterms:W3CDTF">{now}</dcterms:modified>'
+    "</cp:coreProperties>"
+)
+
+
+def default_template_path():
+    """
+    Plantilla que usa python-docx para Document()
+    """
+    import docx
+
+    return os.path.join(os.path.dirname(docx.__file__), "templates", "default.docx")
+
+
+def _text(value):
+    return escape(_INVALID_XML_CHARS.sub("", value))
+
+
+def paragraph_xml(style, text):
+    """
+    Párrafo con un único run; los saltos de línea y tabuladores se convierten
+    en <w:br/> y <w:tab/>, igual que hace python-docx
+    """
+    parts = []
+    for line_index, line in enumerate(text.replace("\r\n", "\n").replace("\r", "\n").split("\n")):
+        if line_index:
+            parts.append("<w:br/>")
+        for chunk_index, chunk in enumerate(line.split("\t")):
+            if chunk_index:
+                parts.append("<w:tab/>")
+            if chunk:
+                parts.append(f'<w:t xml:space="preserve">{_text(chunk)}</w:t>')
+    properties = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    run = f"<w:r>{''.join(parts)}</w:r>" if parts else ""
+    return f"<w:p>{properties}{run}</w:p>"
+
+
+class DocxTemplate:
+    """
+    Plantilla DOCX preprocesada. render() devuelve un fichero en memoria con
+    el documento; `paragraphs` es una lista de (estilo o None, texto).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as source:
+            document = source.read("word/document.xml").decode("utf-8")
+            base = io.BytesIO()
+            with zipfile.ZipFile(base, "w", zipfile.ZIP_DEFLATED) as target:
+                for info in source.infolist():
+                    if info.filename in ("word/document.xml", "docProps/core.xml"):
+                        continue
+                    target.writestr(info.filename, source.read(info.filename))
+        self._base = base.getvalue()
+
+        # El contenido que ya tenga la plantilla se conserva; los párrafos
+        # nuevos van justo antes del sectPr final del cuerpo
+        if "<w:sectPr" in document:
+            split = document.rindex("<w:sectPr")
+        else:
+            split = document.rindex("</w:body>")
+        self._head = document[:split]
+        self._tail = document[split:]
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("OCR_DOCX_TEMPLATE") or default_template_path())
+
+    def document_xml(self, paragraphs):
+        body = "".join(paragraph_xml(style, text) for style, text in paragraphs)
+        return self._head + body + self._tail
+
+    def write(self, fileobj, paragraphs, title=""):
+        """
+        Escribe el documento en `fileobj`, que debe estar vacío, admitir
+        lectura, escritura y seek
+        """
+        fileobj.write(self._base)
+        fileobj.seek(0)
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        with zipfile.ZipFile(fileobj, "a", zipfile.ZIP_DEFLATED) as package:
+            package.writestr("word/document.xml", self.document_xml(paragraphs))
+            package.writestr("docProps/core.xml", _CORE_XML.format(title=_text(title), now=now))
+        fileobj.seek(0)
+        return fileobj
+
+    def render(self, paragraphs, title=""):
+        return self.write(tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES), paragraphs, title)
+
+
+def file_size(fileobj):
+    position = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(position)
+    return size
+
+
+def iter_file(fileobj, chunk_size=64 * 1024):
+    """
+    Recorre el fichero por bloques y lo cierra al terminar
+    """
+    try:
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
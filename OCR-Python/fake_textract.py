@@ -0,0 +1,227 @@
+"""
+Textract y S3 simulados para pruebas y benchmarks de la Lambda sin cuenta de AWS.
+
+- StubTextractClient: sustituye al cliente de boto3 dentro del proceso
+  (lambda_function.set_textract_client(StubTextractClient())).
+- FakeTextractServer: servidor HTTP local que habla el protocolo JSON de
+  Textract. Con TEXTRACT_ENDPOINT_URL apuntando a él se usa el cliente real
+  de boto3, con su pool de conexiones, reintentos y timeouts.
+- FakeS3Client: S3 en memoria (lambda_function.set_s3_client). Los dos
+  Textract simulados lo usan para resolver las entradas S3Object; también
+  sirve como backend de document_store.S3DocumentStore en pruebas.
+"""
+import base64
+import hashlib
+import io
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from botocore.exceptions import ClientError
+
+
+def fake_blocks(image_bytes, lines=3):
+    """
+    Bloques LINE deterministas a partir del tamaño de la imagen
+    """
+    blocks = [{"BlockType": "PAGE", "Id": "page-1"}]
+    for index in range(lines):
+        blocks.append({
+            "BlockType": "LINE",
+            "Id": f"line-{index + 1}",
+            "Text": f"Linea {index + 1} de una imagen de {len(image_bytes)} bytes",
+            "Confidence": 99.0 - index,
+            "Geometry": {"BoundingBox": {"Left": 0.1, "Top": 0.1 + 0.06 * index, "Width": 0.6, "Height": 0.04}},
+        })
+    return blocks
+
+
+def document_bytes(document, s3):
+    """
+    Bytes de un Document de Textract: directos o leídos del S3 simulado
+    """
+    if "S3Object" not in document:
+        return document.get("Bytes", b"")
+    s3_object = document["S3Object"]
+    if s3 is None:
+        raise ClientError(
+            {"Error": {"Code": "InvalidS3ObjectException", "Message": "S3 no configurado"}},
+            "DetectDocumentText",
+        )
+    try:
+        response = s3.get_object(Bucket=s3_object["Bucket"], Key=s3_object["Name"])
+    except ClientError:
+        raise ClientError(
+            {"Error": {"Code": "InvalidS3ObjectException", "Message": "Unable to get object metadata from S3"}},
+            "DetectDocumentText",
+        )
+    return response["Body"].read()
+
+
+class FakeS3Client:
+    """
+    Subconjunto en memoria del cliente de S3: put_object, head_object,
+    get_object, delete_object y list_objects_v2
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = {"put_object": 0, "head_object": 0, "get_object": 0,
+                      "delete_object": 0, "list_objects_v2": 0}
+
+    def _lookup(self, operation, Bucket, Key):
+        self.calls[operation] += 1
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, operation)
+        return self.objects[(Bucket, Key)]
+
+    def put_object(self, Bucket, Key, Body, ContentType="binary/octet-stream"):
+        self.calls["put_object"] += 1
+        body = Body if isinstance(Body, bytes) else Body.read()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        self.objects[(Bucket, Key)] = {"Body": body, "ETag": etag, "ContentType": ContentType,
+                                       "LastModified": datetime.now(timezone.utc)}
+        return {"ETag": etag}
+
+    def head_object(self, Bucket, Key, VersionId=None):
+        stored = self._lookup("head_object", Bucket, Key)
+        return {"ContentLength": len(stored["Body"]), "ETag": stored["ETag"],
+                "ContentType": stored["ContentType"]}
+
+    def get_object(self, Bucket, Key, VersionId=None):
+        stored = self._lookup("get_object", Bucket, Key)
+        return {"Body": io.BytesIO(stored["Body"]), "ContentLength": len(stored["Body"]),
+                "ETag": stored["ETag"], "ContentType": stored["ContentType"]}
+
+    def delete_object(self, Bucket, Key):
+        self.calls["delete_object"] += 1
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=1000):
+        self.calls["list_objects_v2"] += 1
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + MaxKeys]
+        response = {
+            "KeyCount": len(page),
+            "IsTruncated": start + MaxKeys < len(keys),
+            "Contents": [{
+                "Key": key, "Size": len(self.objects[(Bucket, key)]["Body"]),
+                "LastModified": self.objects[(Bucket, key)]["LastModified"],
+                "ETag": self.objects[(Bucket, key)]["ETag"],
+            } for key in page],
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + MaxKeys)
+        return response
+
+
+class StubTextractClient:
+    """
+    Cliente en proceso con la misma interfaz que boto3 para detect_document_text.
+    Con `error` (un código de Textract) todas las llamadas fallan con ese ClientError
+    """
+
+    def __init__(self, latency=0.0, lines=3, s3=None, error=None):
+        self.latency = latency
+        self.lines = lines
+        self.s3 = s3
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def detect_document_text(self, Document):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error:
+            raise ClientError({"Error": {"Code": self.error, "Message": self.error}}, "DetectDocumentText")
+        image_bytes = document_bytes(Document, self.s3)
+        return {"Blocks": fake_blocks(image_bytes, self.lines), "DocumentMetadata": {"Pages": 1}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeceras y cuerpo en un solo envío: con keep-alive, Nagle + ACK retrasado añadiría ~40 ms
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        target = self.headers.get("X-Amz-Target", "")
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        if target.endswith("DetectDocumentText"):
+            document = json.loads(body or b"{}").get("Document", {})
+            if "Bytes" in document:
+                document = {"Bytes": base64.b64decode(document["Bytes"])}
+            try:
+                image_bytes = document_bytes(document, server.s3)
+                status, payload = 200, {"Blocks": fake_blocks(image_bytes, server.lines),
+                                        "DocumentMetadata": {"Pages": 1}}
+            except ClientError as e:
+                error = e.response["Error"]
+                status, payload = 400, {"__type": error["Code"], "message": error["Message"]}
+        else:
+            status, payload = 400, {"__type": "UnknownOperationException", "message": target}
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-amz-json-1.1")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTextractServer:
+    """
+    Textract local en un hilo. Uso:
+
+        with FakeTextractServer(latency=0.05) as server:
+            os.environ["TEXTRACT_ENDPOINT_URL"] = server.url
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, lines=3, s3=None):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.latency = latency
+        self._server.lines = lines
+        self._server.s3 = s3
+        self._server.requests = 0
+        self._server.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self._server.requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,245 @@
+"""
+Decodificación de las imágenes subidas directamente a escala de grises.
+
+Todo el pipeline trabaja en gris, así que no hace falta pasar por PIL ni
+por un array RGB: cv2.imdecode lee el buffer subido (bytes o un mmap del
+fichero temporal, sin copiarlo) y devuelve ya un array uint8 de un canal.
+
+- La cabecera (formato, tamaño, transparencia, orientación EXIF) se lee con
+  PIL sin decodificar los píxeles.
+- La orientación EXIF se aplica siempre, también en PNG y WebP: las cajas
+  quedan en el encuadre tal como se ve la foto.
+- Las imágenes con transparencia se componen sobre blanco; sin esto el texto
+  oscuro sobre fondo transparente (RGB 0) quedaría negro sobre negro.
+- Los JPEG grandes se decodifican a 1/2, 1/4 u 1/8 (IMREAD_REDUCED_*, el
+  escalado DCT de libjpeg) cuando el gobernador de resolución los iba a
+  reducir igualmente: primero a la resolución que necesita para estimar la
+  altura del texto y solo si hace falta más, otra vez a mayor resolución.
+- Los formatos que OpenCV no decodifica (GIF...) pasan por PIL.
+"""
+import io
+import mmap
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+_GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+_ALPHA_MODES = ("RGBA", "RGBa", "LA", "La", "PA")
+
+# Orientación EXIF -> operaciones de OpenCV que la deshacen, como ImageOps.exif_transpose
+_ORIENTATIONS = {
+    2: lambda image: cv2.flip(image, 1),
+    3: lambda image: cv2.rotate(image, cv2.ROTATE_180),
+    4: lambda image: cv2.flip(image, 0),
+    5: lambda image: cv2.transpose(image),
+    6: lambda image: cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda image: cv2.flip(cv2.transpose(image), -1),
+    8: lambda image: cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+
+# Imagen en gris, escala a la que se ha decodificado (1.0, 1/2, 1/4, 1/8) y
+# altura del texto en píxeles de la imagen si ya se ha estimado (None si no
+# se ha estimado, 0 si no se encontró texto)
+DecodedImage = namedtuple("DecodedImage", "image scale text_height")
+
+
+class ImageDecodeError(ValueError):
+    """
+    Los bytes subidos no son una imagen que se pueda decodificar
+    """
+
+
+class ImageTooLarge(ImageDecodeError):
+    """
+    La imagen tiene más píxeles de los que PIL acepta abrir (posible bomba de descompresión)
+    """
+
+
+def map_upload(fileobj):
+    """
+    mmap de solo lectura de una subida que el servidor ya ha volcado a disco
+    (SpooledTemporaryFile por encima de su max_size), o None si sigue en
+    memoria y hay que leerla
+    """
+    if not getattr(fileobj, "_rolled", False):
+        return None
+    try:
+        return mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        # Fichero vacío o sin descriptor
+        return None
+
+
+def _open_header(buffer):
+    # BytesIO comparte el buffer de bytes sin copiarlo; un mmap ya es un fichero
+    fileobj = buffer if isinstance(buffer, mmap.mmap) else io.BytesIO(buffer)
+    try:
+        return Image.open(fileobj)
+    except UnidentifiedImageError:
+        return None
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+
+
+def image_size(buffer):
+    """
+    (ancho, alto) leídos de la cabecera sin decodificar los píxeles, o None
+    si PIL no reconoce el formato
+    """
+    header = _open_header(buffer)
+    if header is None:
+        return None
+    with header:
+        return header.size
+
+
+def _orientation(header):
+    raw = header.info.get("exif")
+    if not raw:
+        return 1
+    exif = Image.Exif()
+    try:
+        exif.load(raw)
+    except Exception:
+        return 1
+    return exif.get(0x0112, 1)
+
+
+def _orient(image_array, orientation):
+    transform = _ORIENTATIONS.get(orientation)
+    return image_array if transform is None else transform(image_array)
+
+
+def _to_uint8(image_array):
+    if image_array.dtype == np.uint8:
+        return image_array
+    return cv2.normalize(image_array, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+
+def flatten_alpha(image_array):
+    """
+    Imagen BGRA (o gris + alfa) compuesta sobre fondo blanco, en gris
+    """
+    if image_array.shape[2] == 2:
+        gray, alpha = image_array[:, :, 0], image_array[:, :, 1]
+    else:
+        gray = cv2.cvtColor(image_array, cv2.COLOR_BGRA2GRAY)
+        alpha = image_array[:, :, 3]
+    # gris * alfa + blanco * (1 - alfa), en uint8 con saturación
+    return cv2.add(cv2.multiply(gray, alpha, scale=1 / 255), cv2.bitwise_not(alpha))
+
+
+def _imdecode(data, flags):
+    try:
+        return cv2.imdecode(data, flags)
+    except cv2.error:
+        return None
+
+
+def _decode_gray(data, reduction, orientation):
+    image_array = _imdecode(data, _GRAYSCALE_FLAGS[reduction] | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image_array is None:
+        return None
+    return _orient(image_array, orientation)
+
+
+def _decode_alpha(data, orientation):
+    image_array = _imdecode(data, cv2.IMREAD_UNCHANGED)
+    if image_array is None:
+        return None
+    image_array = _to_uint8(image_array)
+    if image_array.ndim == 3:
+        if image_array.shape[2] in (2, 4):
+            image_array = flatten_alpha(image_array)
+        else:
+            image_array = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY)
+    return _orient(image_array, orientation)
+
+
+def _decode_pil(buffer):
+    fileobj = buffer if isinstance(buffer, mmap.mmap) else io.BytesIO(buffer)
+    try:
+        with Image.open(fileobj) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode in _ALPHA_MODES or "transparency" in image.info:
+                image = image.convert("RGBA")
+                background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+                image = Image.alpha_composite(background, image)
+            return np.asarray(image.convert("L"))
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImageDecodeError(f"No se pudo decodificar la imagen: {e}")
+
+
+def decode_gray(buffer, governor=None):
+    """
+    Decodifica los bytes (o el mmap) de una imagen a un array uint8 en gris.
+    Devuelve un DecodedImage; su escala es menor que 1 si el JPEG se ha
+    decodificado reducido porque `governor` lo iba a reducir igualmente.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    header = _open_header(buffer)
+    if header is None:
+        # Un formato que PIL no reconoce pero OpenCV quizá sí
+        image_array = _decode_gray(data, 1, 1)
+        if image_array is None:
+            raise ImageDecodeError("No se pudo decodificar la imagen: formato no reconocido")
+        return DecodedImage(image_array, 1.0, None)
+
+    with header:
+        image_format = header.format
+        long_side = max(header.size)
+        has_alpha = header.mode in _ALPHA_MODES or "transparency" in header.info
+        orientation = _orientation(header)
+
+    if has_alpha:
+        image_array = _decode_alpha(data, orientation)
+    elif governor is not None and image_format == "JPEG":
+        return _decode_jpeg(data, long_side, orientation, governor)
+    else:
+        image_array = _decode_gray(data, 1, orientation)
+    if image_array is None:
+        image_array = _decode_pil(buffer)
+    return DecodedImage(image_array, 1.0, None)
+
+
+def _decode_jpeg(data, long_side, orientation, governor):
+    """
+    JPEG decodificado a la menor resolución que el gobernador admite
+    """
+    probe_reduction = governor.probe_reduction(long_side)
+    if probe_reduction == 1 or long_side <= governor.min_long_side:
+        image_array = _decode_gray(data, 1, orientation)
+        if image_array is None:
+            raise ImageDecodeError("No se pudo decodificar la imagen: JPEG no válido")
+        return DecodedImage(image_array, 1.0, None)
+
+    probe = _decode_gray(data, probe_reduction, orientation)
+    if probe is None:
+        raise ImageDecodeError("No se pudo decodificar la imagen: JPEG no válido")
+    text_height = governor.estimate_text_height(probe)
+    if not text_height:
+        # Sin texto reconocible el gobernador no reduce: resolución completa
+        del probe
+        image_array = _decode_gray(data, 1, orientation)
+        if image_array is None:
+            raise ImageDecodeError("No se pudo decodificar la imagen: JPEG no válido")
+        return DecodedImage(image_array, 1.0, 0)
+
+    reduction = governor.decode_reduction(text_height * probe_reduction, long_side)
+    if reduction >= probe_reduction:
+        # El gobernador reducirá el resto después, sin volver a estimar
+        return DecodedImage(probe, 1.0 / probe_reduction, text_height)
+    del probe
+    image_array = _decode_gray(data, reduction, orientation)
+    if image_array is None:
+        raise ImageDecodeError("No se pudo decodificar la imagen: JPEG no válido")
+    return DecodedImage(image_array, 1.0 / reduction, text_height * probe_reduction / reduction)
@@ -0,0 +1,421 @@
+"""
+Cola persistente de trabajos de OCR.
+
+POST /jobs guarda la imagen en disco, registra el trabajo en SQLite y
+responde en el acto con su id. Un grupo de procesos worker reclama los
+trabajos por prioridad, los ejecuta y guarda el resultado, de modo que un
+escaneo grande no mantiene abierta la conexión HTTP del cliente.
+
+Los workers también pueden lanzarse aparte:
+    python jobs.py --workers 2
+"""
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINAL_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+PRIORITIES = {"low": 0, "normal": 5, "high": 9}
+
+
+class JobCancelled(Exception):
+    """
+    El trabajo se canceló mientras se ejecutaba
+    """
+
+
+class JobFailed(Exception):
+    """
+    Error definitivo (p.ej. un fichero que no se puede decodificar): el
+    trabajo se marca como fallido sin reintentarlo
+    """
+
+
+class JobStore:
+    """
+    Trabajos en SQLite y contenido subido en ficheros junto a la base
+    """
+
+    def __init__(self, db_path, payload_dir=None):
+        self.db_path = db_path
+        self.payload_dir = payload_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), "payloads")
+        os.makedirs(self.payload_dir, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " priority INTEGER NOT NULL,"
+                " params TEXT NOT NULL,"
+                " content_type TEXT,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " max_attempts INTEGER NOT NULL,"
+                " available_at REAL NOT NULL,"
+                " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+                " worker TEXT,"
+                " result TEXT,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at)"
+            )
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("OCR_JOBS_DB", os.path.join("jobs", "jobs.sqlite")))
+
+    def _connect(self):
+        # Una conexión por hilo y por proceso; SQLite no permite compartirlas tras un fork
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA busy_timeout=30000")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return _Transaction(db)
+
+    def payload_path(self, job_id):
+        return os.path.join(self.payload_dir, f"{job_id}.bin")
+
+    def submit(self, contents, params=None, priority=PRIORITIES["normal"], max_attempts=3,
+               content_type=None):
+        job_id = uuid.uuid4().hex
+        # Escritura atómica: el worker nunca ve un fichero a medias
+        path = self.payload_path(job_id)
+        with open(path + ".tmp", "wb") as f:
+            f.write(contents)
+        os.replace(path + ".tmp", path)
+
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, status, priority, params, content_type, max_attempts,"
+                " available_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, priority, json.dumps(params or {}), content_type,
+                 max_attempts, now, now),
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def read_payload(self, job_id):
+        with open(self.payload_path(job_id), "rb") as f:
+            return f.read()
+
+    def cancel(self, job_id):
+        """
+        Cancela un trabajo en cola de inmediato; si ya se está ejecutando se
+        marca y el worker lo descarta al terminar. Devuelve el trabajo o None.
+        """
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, now, job_id, QUEUED),
+            )
+            db.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?",
+                (job_id, RUNNING),
+            )
+        job = self.get(job_id)
+        if job is not None and job["status"] == CANCELLED:
+            self._remove_payload(job_id)
+        return job
+
+    def is_cancel_requested(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def claim(self, worker):
+        """
+        Reclama el siguiente trabajo disponible (mayor prioridad, más antiguo)
+        """
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT id FROM jobs WHERE status = ? AND available_at <= ?"
+                " ORDER BY priority DESC, created_at LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, started_at = ?"
+                " WHERE id = ?",
+                (RUNNING, worker, now, row["id"]),
+            )
+            db.execute("COMMIT")
+        return self.get(row["id"])
+
+    def complete(self, job_id, result):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = CASE WHEN cancel_requested THEN ? ELSE ? END,"
+                " result = CASE WHEN cancel_requested THEN NULL ELSE ? END,"
+                " finished_at = ?, worker = NULL WHERE id = ?",
+                (CANCELLED, SUCCEEDED, json.dumps(result, ensure_ascii=False), now, job_id),
+            )
+        self._remove_payload(job_id)
+
+    def fail(self, job_id, error, retry_backoff=2.0, retry=True):
+        """
+        Registra un error; el trabajo vuelve a la cola con espera exponencial
+        hasta agotar max_attempts (con retry=False, nunca)
+        """
+        job = self.get(job_id)
+        if job is None:
+            return
+        now = time.time()
+        with self._connect() as db:
+            if job["cancel_requested"]:
+                db.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, worker = NULL WHERE id = ?",
+                    (CANCELLED, now, job_id),
+                )
+            elif retry and job["attempts"] < job["max_attempts"]:
+                db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, available_at = ?, worker = NULL WHERE id = ?",
+                    (QUEUED, error, now + retry_backoff ** job["attempts"], job_id),
+                )
+                return
+            else:
+                db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ?, worker = NULL WHERE id = ?",
+                    (FAILED, error, now, job_id),
+                )
+        self._remove_payload(job_id)
+
+    def requeue_worker(self, worker, error="El worker terminó durante el trabajo"):
+        """
+        Trabajos de un worker que murió a mitad: cuentan como un intento
+        fallido, igual que con fail(). Vuelven a la cola con espera
+        exponencial y, agotados los intentos, se marcan como fallidos; un
+        trabajo que tumba al worker (p.ej. por memoria) no se repite sin fin.
+        Devuelve cuántos había.
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id FROM jobs WHERE status = ? AND worker = ?", (RUNNING, worker),
+            ).fetchall()
+        for (job_id,) in rows:
+            self.fail(job_id, error)
+        return len(rows)
+
+    def requeue_orphans(self, host):
+        """
+        Al arrancar, recupera los trabajos que quedaron en ejecución en
+        procesos de este host que ya no existen (con requeue_worker: cuentan
+        como un intento fallido)
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT DISTINCT worker FROM jobs WHERE status = ? AND worker LIKE ?",
+                (RUNNING, host + ":%"),
+            ).fetchall()
+        recovered = 0
+        for (worker,) in rows:
+            if not _pid_alive(int(worker.rsplit(":", 1)[1])):
+                recovered += self.requeue_worker(worker)
+        return recovered
+
+    def stats(self):
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in (QUEUED, RUNNING) + FINAL_STATUSES}
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
+
+    def _remove_payload(self, job_id):
+        try:
+            os.remove(self.payload_path(job_id))
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Transaction:
+    """
+    Context manager mínimo sobre una conexión en modo autocommit
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.db.in_transaction:
+            self.db.execute("ROLLBACK")
+        return False
+
+
+def load_handler(path):
+    """
+    Importa el manejador a partir de una ruta "modulo:funcion"
+    """
+    module_name, _, attr = path.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def worker_loop(db_path, payload_dir, handler_path, stop_event, poll_interval=0.5):
+    """
+    Bucle de un proceso worker: reclama, ejecuta y registra trabajos
+    """
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    store = JobStore(db_path, payload_dir)
+    handler = load_handler(handler_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info("Worker de trabajos %s listo", worker)
+
+    while not stop_event.is_set():
+        job = store.claim(worker)
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        def check_cancelled(job_id=job["id"]):
+            if store.is_cancel_requested(job_id):
+                raise JobCancelled(job_id)
+
+        started = time.perf_counter()
+        try:
+            result = handler(store.read_payload(job["id"]), job, check_cancelled)
+        except JobCancelled:
+            store.fail(job["id"], "cancelado")
+        except JobFailed as e:
+            logger.warning("El trabajo %s falló sin reintentos: %s", job["id"], e)
+            store.fail(job["id"], str(e), retry=False)
+        except Exception as e:
+            logger.exception("El trabajo %s falló (intento %d)", job["id"], job["attempts"])
+            store.fail(job["id"], str(e))
+        else:
+            store.complete(job["id"], result)
+            logger.info("Trabajo %s terminado en %.2fs", job["id"], time.perf_counter() - started)
+
+
+class JobWorkerPool:
+    """
+    Lanza y supervisa los procesos worker; si uno muere, sus trabajos se
+    reintentan (o fallan, agotados los intentos) y se lanza otro
+    """
+
+    def __init__(self, store, handler_path, processes=1):
+        self.store = store
+        self.handler_path = handler_path
+        self.processes = processes
+        # spawn: los workers no heredan hilos ni conexiones del proceso del servidor
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        self._workers = []
+        self._supervisor = None
+
+    def start(self):
+        recovered = self.store.requeue_orphans(socket.gethostname())
+        if recovered:
+            logger.info("%d trabajos interrumpidos recuperados", recovered)
+        self._workers = [self._spawn() for _ in range(self.processes)]
+        self._supervisor = threading.Thread(target=self._supervise, name="job-supervisor", daemon=True)
+        self._supervisor.start()
+
+    def _spawn(self):
+        process = self._context.Process(
+            target=worker_loop,
+            args=(self.store.db_path, self.store.payload_dir, self.handler_path, self._stop),
+            name="ocr-job-worker",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def _supervise(self):
+        while not self._stop.is_set():
+            for index, process in enumerate(self._workers):
+                if not process.is_alive() and not self._stop.is_set():
+                    worker = f"{socket.gethostname()}:{process.pid}"
+                    interrupted = self.store.requeue_worker(
+                        worker, f"El worker terminó durante el trabajo (código {process.exitcode})",
+                    )
+                    logger.warning(
+                        "Worker de trabajos %s terminó (código %s); %d trabajos interrumpidos",
+                        worker, process.exitcode, interrupted,
+                    )
+                    self._workers[index] = self._spawn()
+            self._stop.wait(1.0)
+
+    @property
+    def running(self):
+        return self._supervisor is not None and not self._stop.is_set()
+
+    def stats(self):
+        return {"processes": self.processes, "alive": sum(p.is_alive() for p in self._workers)}
+
+    def shutdown(self, timeout=10):
+        self._stop.set()
+        for process in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Workers de la cola de trabajos de OCR")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--handler", default="main:process_job")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    pool = JobWorkerPool(JobStore.from_env(), args.handler, processes=args.workers)
+    pool.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,422 @@
 import json
+import os
 import boto3
 import base64
+import binascii
 from io import BytesIO
 import uuid
 import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from layout import LayoutAnalyzer, layout_text, paragraph_dicts, textract_bounds
+from ocr_cache import OCRResultCache, make_cache_key
+from ocr_metrics import RequestLogger, StageTimings, emf_line, event_summary, fingerprint
 
 # Configurar logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Solo metadatos acotados de cada petición; los cuerpos se registran recortados
+# en una muestra (OCR_LOG_SAMPLE_RATE, por defecto ninguno)
+request_log = RequestLogger.from_env(logger)
+
+# Caché de resultados que se mantiene entre invocaciones del mismo contenedor.
+# OCR_CACHE_DB (p.ej. /tmp/ocr_cache.sqlite) añade un nivel en disco.
+result_cache = OCRResultCache.from_env()
+
+# Mismo análisis de maquetación que la API: las líneas de Textract se agrupan
+# en párrafos y columnas en orden de lectura (OCR_LAYOUT=0 lo desactiva)
+layout = LayoutAnalyzer.from_env()
+LAYOUT_PARAMS = layout.cache_params if layout is not None else None
+
+# Cliente de Textract compartido entre invocaciones: se crea en la primera
+# petición y reutiliza sus conexiones HTTPS mientras el contenedor siga vivo.
+# TEXTRACT_ENDPOINT_URL permite apuntarlo a un Textract local para pruebas.
+TEXTRACT_CONFIG = Config(
+    region_name=os.environ.get('TEXTRACT_REGION', 'us-east-1'),
+    max_pool_connections=int(os.environ.get('TEXTRACT_MAX_CONNECTIONS', '10')),
+    connect_timeout=float(os.environ.get('TEXTRACT_CONNECT_TIMEOUT', '2')),
+    read_timeout=float(os.environ.get('TEXTRACT_READ_TIMEOUT', '20')),
+    retries={
+        'max_attempts': int(os.environ.get('TEXTRACT_MAX_ATTEMPTS', '4')),
+        'mode': 'adaptive',
+    },
+)
+
+# Métricas por invocación en formato EMF: CloudWatch las extrae de los logs
+# (OCR_EMF=0 lo desactiva)
+EMF_ENABLED = os.environ.get('OCR_EMF', '1') != '0'
+METRICS_NAMESPACE = os.environ.get('OCR_METRICS_NAMESPACE', 'OCRScanner')
+
+# Número máximo de imágenes por petición en el formato {"images": [...]}
+MAX_IMAGES = int(os.environ.get('TEXTRACT_MAX_IMAGES', '20'))
+
+# Buckets que se aceptan en las referencias {"s3": {"bucket", "key"}}.
+# Deben estar en la misma región que Textract.
+ALLOWED_BUCKETS = set(filter(None, (
+    os.environ.get('OCR_S3_BUCKETS') or os.environ.get('BUCKET_NAME', '')
+).split(',')))
+
+# Tipos de contenido que se aceptan como cuerpo binario
+BINARY_CONTENT_TYPES = ('image/', 'application/pdf')
+
+_textract_client = None
+_s3_client = None
+_executor = None
+_lock = threading.Lock()
+
+def get_textract_client():
+    global _textract_client
+    if _textract_client is None:
+        with _lock:
+            if _textract_client is None:
+                _textract_client = boto3.client(
+                    'textract',
+                    config=TEXTRACT_CONFIG,
+                    endpoint_url=os.environ.get('TEXTRACT_ENDPOINT_URL') or None,
+                )
+    return _textract_client
+
+def set_textract_client(client):
+    """
+    Sustituye el cliente de Textract (p.ej. por un stub en pruebas y benchmarks).
+    Con None se vuelve a crear el cliente real en la siguiente llamada.
+    """
+    global _textract_client
+    _textract_client = client
+
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        with _lock:
+            if _s3_client is None:
+                _s3_client = boto3.client(
+                    's3',
+                    config=TEXTRACT_CONFIG,
+                    endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None,
+                )
+    return _s3_client
+
+def set_s3_client(client):
+    """
+    Sustituye el cliente de S3 (p.ej. por un S3 local en pruebas)
+    """
+    global _s3_client
+    _s3_client = client
+
+def get_executor():
+    """
+    Hilos para lanzar en paralelo las llamadas a Textract de una petición con varias imágenes
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=TEXTRACT_CONFIG.max_pool_connections,
+                    thread_name_prefix='textract',
+                )
+    return _executor
+
+class ImageError(Exception):
+    """
+    Error al procesar una imagen; lleva el código HTTP y el cuerpo de la respuesta
+    """
+    def __init__(self, status_code, error, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error = error
+        self.message = message
+
+    def body(self):
+        return {'error': self.error, 'message': self.message}
+
+def textract_result(response):
+    """
+    Convierte la respuesta de detect_document_text en el resultado de la API
+    """
+    # Extraer texto
+    lines = [block for block in response['Blocks'] if block['BlockType'] == 'LINE']
+    texts = [block['Text'] for block in lines]
+    confidence_scores = [block['Confidence'] for block in lines if 'Confidence' in block]
+    
+    # Líneas agrupadas en párrafos en orden de lectura; sin geometría, en el orden de Textract
+    boxes = [textract_bounds(block) for block in lines]
+    paragraphs = None
+    if layout is not None and None not in boxes:
+        paragraphs = paragraph_dicts(layout.analyze(boxes), texts)
+        extracted_text = layout_text(paragraphs)
+    else:
+        extracted_text = '\n'.join(texts)
+    
+    # Calcular confianza promedio
+    avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0
+    
+    # Si no se extrajo texto, devolver mensaje
+    if not extracted_text.strip():
+        extracted_text = "No se pudo extraer texto de la imagen. Asegúrate de que la imagen contenga texto legible."
+        avg_confidence = 0
+        paragraphs = None
+    
+    # Crear resultado
+    result = {
+        'text': extracted_text.strip(),
+        'metadata': {
+            'processing_method': 'AWS Textract',
+            'confidence': round(avg_confidence, 2),
+            'character_count': len(extracted_text.strip()),
+            'line_count': len([line for line in extracted_text.strip().split('\n') if line]),
+            'processing_type': 'document_text_detection'
+        },
+        'status': 'success'
+    }
+    if paragraphs is not None:
+        result['paragraphs'] = paragraphs
+        result['metadata']['paragraph_count'] = len(paragraphs)
+    return result
+
+# Caracteres base64 (múltiplo de 4) que se decodifican de cada vez al saltar un prefijo
+DECODE_CHUNK = 1 << 16
+
+def decode_base64(data, start=0):
+    """
+    Decodifica base64 en una sola pasada: binascii acepta el str ASCII sin
+    copiarlo a bytes, a diferencia de base64.b64decode.
+
+    Con `start` (p.ej. tras el prefijo de una data URL) se decodifica desde
+    ese punto por bloques, sin copiar la cadena entera: cada bloque de
+    DECODE_CHUNK caracteres se escribe directamente en el resultado. Si hay
+    espacios o saltos de línea que desalinean los bloques, se vuelve a
+    decodificar de una vez.
+    """
+    if not start:
+        return binascii.a2b_base64(data)
+    out = bytearray((len(data) - start) // 4 * 3 + 3)
+    view = memoryview(out)
+    size = 0
+    try:
+        for offset in range(start, len(data), DECODE_CHUNK):
+            chunk = binascii.a2b_base64(data[offset:offset + DECODE_CHUNK])
+            view[size:size + len(chunk)] = chunk
+            size += len(chunk)
+    except (binascii.Error, ValueError):
+        view.release()
+        return binascii.a2b_base64(data[start:])
+    view.release()
+    del out[size:]
+    return out
+
+def detect_text(document, timings):
+    """
+    Llama a detect_document_text y convierte la respuesta en el resultado de la API
+    """
+    try:
+        with timings.stage('textract'):
+            response = get_textract_client().detect_document_text(Document=document)
+        logger.info("Textract procesado exitosamente")
+    except Exception as e:
+        logger.error(f"Error en Textract: {str(e)}")
+        raise ImageError(500, 'Error procesando con Textract', str(e))
+    
+    with timings.stage('result'):
+        result = textract_result(response)
+    logger.info(f"Procesamiento completado: {result['metadata']['character_count']} caracteres extraídos")
+    return result
+
+def process_image(image_data, timings):
+    """
+    OCR de una imagen en base64 (con o sin prefijo data:image/...).
+    Devuelve el resultado o lanza ImageError.
+    """
+    if not isinstance(image_data, str):
+        raise ImageError(400, 'Imagen no válida', 'La imagen debe ser una cadena en base64')
+    
+    # Procesar imagen base64
+    start = 0
+    if image_data.startswith('data:image/'):
+        # Saltar el prefijo data:image/...;base64, sin copiar la cadena
+        comma = image_data.find(',')
+        if comma < 0:
+            raise ImageError(400, 'Error decodificando imagen', 'La data URL no contiene datos')
+        start = comma + 1
+    
+    # Decodificar imagen
+    try:
+        with timings.stage('decode'):
+            image_bytes = decode_base64(image_data, start)
+        logger.info(f"Imagen decodificada: {len(image_bytes)} bytes")
+    except Exception as e:
+        logger.error(f"Error decodificando imagen: {str(e)}")
+        raise ImageError(400, 'Error decodificando imagen', str(e))
+    
+    return process_bytes(image_bytes, timings)
+
+def process_bytes(image_bytes, timings):
+    """
+    OCR de una imagen ya decodificada, enviada a Textract directamente con bytes (sin S3)
+    """
+    timings.incr('images')
+    timings.incr('image_bytes', len(image_bytes))
+    # Un acierto de caché evita llamar a Textract
+    with timings.stage('cache'):
+        cache_key = make_cache_key(image_bytes, engine='textract', api='detect_document_text', layout=LAYOUT_PARAMS)
+        cached_result = result_cache.get(cache_key)
+    if cached_result is not None:
+        logger.info("Resultado obtenido de la caché")
+        timings.incr('cache_hits')
+        return cached_result
+    
+    result = detect_text({'Bytes': image_bytes}, timings)
+    result_cache.put(cache_key, result)
+    return result
+
+def process_s3(reference, timings):
+    """
+    OCR de una imagen guardada en S3. Textract la lee directamente del bucket
+    (S3Object): la imagen no pasa por la Lambda.
+    """
+    bucket = reference.get('bucket') if isinstance(reference, dict) else None
+    key = reference.get('key') if isinstance(reference, dict) else None
+    if not isinstance(bucket, str) or not isinstance(key, str) or not bucket or not key:
+        raise ImageError(400, 'Referencia S3 no válida', 'El campo "s3" debe contener "bucket" y "key"')
+    if bucket not in ALLOWED_BUCKETS:
+        raise ImageError(403, 'Bucket no permitido', f'No se aceptan imágenes del bucket {bucket}')
+    
+    s3_object = {'Bucket': bucket, 'Name': key}
+    head_args = {'Bucket': bucket, 'Key': key}
+    if reference.get('version'):
+        s3_object['Version'] = head_args['VersionId'] = reference['version']
+    
+    # El ETag identifica el contenido: sirve de clave de caché sin descargar la imagen
+    timings.incr('images')
+    try:
+        with timings.stage('s3_head'):
+            head = get_s3_client().head_object(**head_args)
+    except ClientError as e:
+        code = e.response.get('Error', {}).get('Code', '')
+        if code in ('404', 'NoSuchKey', 'NotFound'):
+            raise ImageError(404, 'Imagen no encontrada', f's3://{bucket}/{key} no existe')
+        if code in ('403', 'AccessDenied'):
+            raise ImageError(403, 'Acceso denegado', f'Sin permiso para leer s3://{bucket}/{key}')
+        raise ImageError(500, 'Error accediendo a S3', str(e))
+    
+    cache_key = make_cache_key(
+        f's3://{bucket}/{key}'.encode('utf-8'),
+        etag=head.get('ETag'), engine='textract', api='detect_document_text', layout=LAYOUT_PARAMS,
+    )
+    cached_result = result_cache.get(cache_key)
+    if cached_result is not None:
+        logger.info("Resultado obtenido de la caché")
+        timings.incr('cache_hits')
+        return cached_result
+    
+    result = detect_text({'S3Object': s3_object}, timings)
+    result_cache.put(cache_key, result)
+    return result
+
+def process_images(images, timings):
+    """
+    OCR de varias imágenes con las llamadas a Textract en paralelo;
+    los resultados se devuelven en el mismo orden
+    """
+    def process(item):
+        if not isinstance(item, (str, dict)):
+            return {'status': 'error', 'error': 'Imagen no válida',
+                    'message': 'Cada elemento de "images" debe ser una imagen en base64 o un objeto'}
+        image_data = item.get('image', '') if isinstance(item, dict) else item
+        s3_reference = item.get('s3') if isinstance(item, dict) else None
+        if not image_data and s3_reference is None:
+            return {'status': 'error', 'error': 'No se proporcionó imagen',
+                    'message': 'Cada elemento de "images" debe contener una imagen'}
+        try:
+            if s3_reference is not None:
+                return process_s3(s3_reference, timings)
+            return process_image(image_data, timings)
+        except ImageError as e:
+            return {'status': 'error', **e.body()}
+    
+    return list(get_executor().map(process, images))
+
+def binary_response(event, cors_headers, timings):
+    """
+    Respuesta para un cuerpo binario con la imagen
+    """
+    body = event.get('body') or ''
+    if not event.get('isBase64Encoded', False) or not body:
+        return {
+            'statusCode': 400,
+            'headers': cors_headers,
+            'body': json.dumps({
+                'error': 'No se proporcionó imagen',
+                'message': 'El cuerpo debe contener la imagen en binario'
+            })
+        }
+    try:
+        with timings.stage('decode'):
+            image_bytes = decode_base64(body)
+        logger.info(f"Imagen binaria recibida: {len(image_bytes)} bytes")
+        result = process_bytes(image_bytes, timings)
+    except ValueError as e:
+        # binascii.Error o cuerpo con caracteres no ASCII
+        return {
+            'statusCode': 400,
+            'headers': cors_headers,
+            'body': json.dumps({
+                'error': 'Error decodificando imagen',
+                'message': str(e)
+            })
+        }
+    except ImageError as e:
+        return {
+            'statusCode': e.status_code,
+            'headers': cors_headers,
+            'body': json.dumps(e.body())
+        }
+    return {
+        'statusCode': 200,
+        'headers': cors_headers,
+        'body': json.dumps(result, ensure_ascii=False)
+    }
+
 def lambda_handler(event, context):
     """
     Función Lambda para procesar imágenes con AWS Textract
     """
+    timings = StageTimings()
+    started = time.perf_counter()
+    response = handle_request(event, timings)
+    if EMF_ENABLED:
+        emit_metrics(event, context, response, timings, time.perf_counter() - started)
+    return response
+
+def emit_metrics(event, context, response, timings, duration):
+    """
+    Escribe una línea EMF con la duración total y por etapa de la invocación.
+    Va directamente a stdout: el prefijo del logger impediría que CloudWatch la reconozca.
+    """
+    metrics = {'duration_ms': (round(duration * 1000, 3), 'Milliseconds')}
+    for stage, seconds in timings.seconds.items():
+        metrics[f'{stage}_ms'] = (round(seconds * 1000, 3), 'Milliseconds')
+    metrics['request_bytes'] = (len(event.get('body') or ''), 'Bytes')
+    metrics['image_bytes'] = (timings.counters.get('image_bytes', 0), 'Bytes')
+    metrics['image_count'] = (timings.counters.get('images', 0), 'Count')
+    metrics['cache_hits'] = (timings.counters.get('cache_hits', 0), 'Count')
+    
+    properties = dict(timings.properties, status_code=response.get('statusCode'))
+    if context is not None:
+        properties['request_id'] = getattr(context, 'aws_request_id', None)
+    function_name = getattr(context, 'function_name', None) or 'local'
+    sys.stdout.write(emf_line(METRICS_NAMESPACE, metrics, {'Function': function_name}, properties) + '\n')
+    sys.stdout.flush()
+
+def handle_request(event, timings):
+    """
+    Atiende la petición de API Gateway y devuelve la respuesta
+    """
     
     # Headers CORS para todas las respuestas
     cors_headers = {
@@ -23,8 +427,9 @@ def lambda_handler(event, context):
     }
     
     try:
-        # Log del evento para debug
-        logger.info(f"Event received: {json.dumps(event)}")
+        # Log del evento: tamaños y huella, nunca la imagen
+        request_log.log("Event received", **event_summary(event))
+        request_log.payload("Event body", event.get('body'))
         
         # Manejar preflight OPTIONS request
         http_method = event.get('requestContext', {}).get('http', {}).get('method')
@@ -38,15 +443,29 @@ def lambda_handler(event, context):
                 'body': json.dumps({'message': 'CORS preflight successful'})
             }
         
+        # Cuerpo binario (Content-Type image/*): la imagen llega sin JSON ni data URL
+        # y API Gateway la entrega en base64, que se decodifica una sola vez
+        headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+        content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+        if content_type.startswith(BINARY_CONTENT_TYPES):
+            timings.properties['input'] = 'binary'
+            return binary_response(event, cors_headers, timings)
+        
         # Parsear el body de la request
         body_content = event.get('body', '{}')
-        if event.get('isBase64Encoded', False):
-            body_content = base64.b64decode(body_content).decode('utf-8')
-        
         try:
-            request_data = json.loads(body_content)
-        except json.JSONDecodeError:
-            logger.error(f"Invalid JSON in body: {body_content}")
+            with timings.stage('parse'):
+                if event.get('isBase64Encoded', False):
+                    # json.loads acepta bytes: no hace falta pasar por str
+                    body_content = decode_base64(body_content)
+                request_data = json.loads(body_content)
+        except json.JSONDecodeError as e:
+            request_log.log(
+                "Invalid JSON in body", logging.ERROR,
+                body_bytes=len(body_content), body_fingerprint=fingerprint(body_content),
+                error=str(e)[:200],
+            )
+            request_log.payload("Invalid JSON body", body_content, logging.ERROR)
             return {
                 'statusCode': 400,
                 'headers': cors_headers,
@@ -56,7 +475,16 @@ def lambda_handler(event, context):
                 })
             }
         
-        logger.info(f"Request data keys: {list(request_data.keys())}")
+        if not isinstance(request_data, dict):
+            return {
+                'statusCode': 400,
+                'headers': cors_headers,
+                'body': json.dumps({
+                    'error': 'Invalid JSON',
+                    'message': 'El cuerpo de la petición debe ser un objeto JSON'
+                })
+            }
+        request_log.log("Request data", keys=[str(key)[:64] for key in list(request_data)[:20]])
         
         # Si es solo una prueba, devolver respuesta simple
         if request_data.get('test'):
@@ -76,6 +504,51 @@ def lambda_handler(event, context):
                 })
             }
         
+        # Varias imágenes en una misma invocación: {"images": ["<base64>", ...]}
+        images = request_data.get('images')
+        if images is not None:
+            if not isinstance(images, list) or not images or len(images) > MAX_IMAGES:
+                return {
+                    'statusCode': 400,
+                    'headers': cors_headers,
+                    'body': json.dumps({
+                        'error': 'Lista de imágenes no válida',
+                        'message': f'El campo "images" debe ser una lista de 1 a {MAX_IMAGES} imágenes'
+                    })
+                }
+            timings.properties['input'] = 'images'
+            results = process_images(images, timings)
+            failed = sum(1 for result in results if result.get('status') != 'success')
+            return {
+                'statusCode': 200,
+                'headers': cors_headers,
+                'body': json.dumps({
+                    'results': results,
+                    'metadata': {
+                        'image_count': len(results),
+                        'failed_count': failed
+                    },
+                    'status': 'success' if not failed else 'partial'
+                }, ensure_ascii=False)
+            }
+        
+        # Imagen guardada en S3: {"s3": {"bucket": "...", "key": "..."}}
+        if request_data.get('s3') is not None:
+            try:
+                timings.properties['input'] = 's3'
+                result = process_s3(request_data['s3'], timings)
+            except ImageError as e:
+                return {
+                    'statusCode': e.status_code,
+                    'headers': cors_headers,
+                    'body': json.dumps(e.body())
+                }
+            return {
+                'statusCode': 200,
+                'headers': cors_headers,
+                'body': json.dumps(result, ensure_ascii=False)
+            }
+        
         # Extraer imagen base64
         image_data = request_data.get('image', '')
         title = request_data.get('title', f'documento_ocr_{uuid.uuid4().hex[:8]}')
@@ -90,80 +563,16 @@ def lambda_handler(event, context):
                 })
             }
         
-        # Procesar imagen base64
-        if image_data.startswith('data:image/'):
-            # Remover el prefijo data:image/...;base64,
-            image_data = image_data.split(',')[1]
-        
-        # Decodificar imagen
         try:
-            image_bytes = base64.b64decode(image_data)
-            logger.info(f"Imagen decodificada: {len(image_bytes)} bytes")
-        except Exception as e:
-            logger.error(f"Error decodificando imagen: {str(e)}")
+            timings.properties['input'] = 'json'
+            result = process_image(image_data, timings)
+        except ImageError as e:
             return {
-                'statusCode': 400,
+                'statusCode': e.status_code,
                 'headers': cors_headers,
-                'body': json.dumps({
-                    'error': 'Error decodificando imagen',
-                    'message': str(e)
-                })
+                'body': json.dumps(e.body())
             }
         
-        # Usar Textract directamente con bytes (sin S3)
-        textract = boto3.client('textract', region_name='us-east-1')
-        
-        try:
-            response = textract.detect_document_text(
-                Document={
-                    'Bytes': image_bytes
-                }
-            )
-            logger.info("Textract procesado exitosamente")
-        except Exception as e:
-            logger.error(f"Error en Textract: {str(e)}")
-            return {
-                'statusCode': 500,
-                'headers': cors_headers,
-                'body': json.dumps({
-                    'error': 'Error procesando con Textract',
-                    'message': str(e)
-                })
-            }
-        
-        # Extraer texto
-        extracted_text = ""
-        confidence_scores = []
-        
-        for block in response['Blocks']:
-            if block['BlockType'] == 'LINE':
-                extracted_text += block['Text'] + '\n'
-                if 'Confidence' in block:
-                    confidence_scores.append(block['Confidence'])
-        
-        # Calcular confianza promedio
-        avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0
-        
-        # Si no se extrajo texto, devolver mensaje
-        if not extracted_text.strip():
-            extracted_text = "No se pudo extraer texto de la imagen. Asegúrate de que la imagen contenga texto legible."
-            avg_confidence = 0
-        
-        # Crear resultado
-        result = {
-            'text': extracted_text.strip(),
-            'metadata': {
-                'processing_method': 'AWS Textract',
-                'confidence': round(avg_confidence, 2),
-                'character_count': len(extracted_text.strip()),
-                'line_count': len(extracted_text.strip().split('\n')),
-                'processing_type': 'document_text_detection'
-            },
-            'status': 'success'
-        }
-        
-        logger.info(f"Procesamiento completado: {len(extracted_text)} caracteres extraídos")
-        
         return {
             'statusCode': 200,
             'headers': cors_headers,
@@ -0,0 +1,258 @@
+"""
+Reconstrucción de la maquetación: cajas de texto -> líneas, párrafos y columnas.
+
+Los motores devuelven las cajas en su propio orden (EasyOCR, más o menos de
+arriba abajo; Textract, por bloques), que en páginas a varias columnas o
+manuscritas mezcla líneas. Aquí se ordenan en orden de lectura:
+
+1. Corte XY: se busca un hueco vertical (un canal entre columnas) que
+   atraviese todas las cajas y, si no lo hay, un hueco horizontal (entre
+   bloques); cada trozo se vuelve a cortar hasta que no queda ninguno.
+   Cada corte es un barrido sobre las cajas ordenadas por un eje, sin
+   comparar cajas por pares: O(n log n) por nivel.
+2. En cada bloque, un barrido por la altura agrupa las cajas que se solapan
+   verticalmente en líneas, y las líneas se separan en párrafos donde el
+   interlineado es claramente mayor que el habitual del bloque.
+
+Todas las distancias se miden en alturas de caja (la mediana), así que da
+igual que las coordenadas sean píxeles o estén normalizadas. Solo usa la
+biblioteca estándar: lo comparten la API y la Lambda.
+"""
+import os
+import re
+from collections import namedtuple
+
+# Líneas de un párrafo (cada una, índices de las cajas de izquierda a
+# derecha) y columna del párrafo en la página, de izquierda a derecha
+Paragraph = namedtuple("Paragraph", "lines column")
+
+_X, _Y = 0, 1
+
+# Forma parte de cache_params: cambia cuando cambia el resultado con los
+# mismos parámetros (2: columnas numeradas en toda la página)
+LAYOUT_VERSION = 2
+
+
+def points_bounds(points):
+    """
+    (x0, y0, x1, y1) de una caja de cuatro puntos [[x, y], ...]
+    """
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def textract_bounds(block):
+    """
+    (x0, y0, x1, y1) normalizados de un bloque de Textract, o None si no trae geometría
+    """
+    box = block.get("Geometry", {}).get("BoundingBox")
+    if not box:
+        return None
+    return box["Left"], box["Top"], box["Left"] + box["Width"], box["Top"] + box["Height"]
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def _span(boxes, items):
+    return min(boxes[index][0] for index in items), max(boxes[index][2] for index in items)
+
+
+def _number_columns(lanes):
+    """
+    Número de columna de cada franja (id -> (x0, x1)), de izquierda a derecha
+    en toda la página. Barrido por x0: una franja abre columna nueva si
+    empieza a la derecha del borde derecho más estrecho de la columna en
+    curso; si no, se solapa con ella y comparte número. Las franjas de un
+    mismo corte no se solapan, así que siempre reciben números distintos.
+    """
+    numbers = {}
+    column = -1
+    reach = None
+    for lane, (x0, x1) in sorted(lanes.items(), key=lambda item: item[1]):
+        if reach is None or x0 >= reach:
+            column += 1
+            reach = x1
+        else:
+            reach = min(reach, x1)
+        numbers[lane] = column
+    return numbers
+
+
+def _split(boxes, items, axis, gap):
+    """
+    Barrido por un eje: grupos de cajas separados por un hueco mayor que `gap`
+    que ninguna caja atraviesa, en orden a lo largo del eje
+    """
+    start, end = (0, 2) if axis == _X else (1, 3)
+    ordered = sorted(items, key=lambda index: boxes[index][start])
+    groups = [[ordered[0]]]
+    reach = boxes[ordered[0]][end]
+    for index in ordered[1:]:
+        if boxes[index][start] - reach > gap:
+            groups.append([index])
+        else:
+            groups[-1].append(index)
+        reach = max(reach, boxes[index][end])
+    return groups
+
+
+class LayoutAnalyzer:
+    """
+    Agrupa cajas en líneas, párrafos y columnas en orden de lectura.
+
+    - line_overlap: solape vertical mínimo, en fracción de la menor de las
+      dos alturas, para que una caja entre en una línea
+    - column_gap: canal vertical mínimo entre columnas
+    - block_gap: hueco horizontal mínimo entre bloques
+    - paragraph_gap: interlineado, por encima del habitual del bloque, que
+      separa dos párrafos
+
+    Los huecos se miden en alturas de caja.
+    """
+
+    def __init__(self, line_overlap=0.5, column_gap=1.5, block_gap=1.5, paragraph_gap=0.5):
+        self.line_overlap = line_overlap
+        self.column_gap = column_gap
+        self.block_gap = block_gap
+        self.paragraph_gap = paragraph_gap
+
+    @classmethod
+    def from_env(cls):
+        """
+        None con OCR_LAYOUT=0: el texto se une en el orden del motor, como antes
+        """
+        if os.getenv("OCR_LAYOUT", "1") == "0":
+            return None
+        return cls()
+
+    @property
+    def cache_params(self):
+        return {
+            "version": LAYOUT_VERSION,
+            "line_overlap": self.line_overlap,
+            "column_gap": self.column_gap,
+            "block_gap": self.block_gap,
+            "paragraph_gap": self.paragraph_gap,
+        }
+
+    def analyze(self, boxes):
+        """
+        Párrafos en orden de lectura a partir de cajas (x0, y0, x1, y1)
+        """
+        if not boxes:
+            return []
+        height = _median(box[3] - box[1] for box in boxes) or 1.0
+
+        paragraphs = []
+        # Franja horizontal (x0, x1) de cada columna: la página entera y cada
+        # trozo de un corte vertical. Los bloques de un corte horizontal
+        # siguen en la columna de su padre
+        lanes = [_span(boxes, range(len(boxes)))]
+        # Pila de (cajas, columna); los trozos se apilan al revés para
+        # sacarlos en orden de lectura
+        pending = [(list(range(len(boxes))), 0)]
+        while pending:
+            items, lane = pending.pop()
+            groups = None
+            # Una sola línea no se parte en columnas (campos de un formulario)
+            top = min(boxes[index][1] for index in items)
+            bottom = max(boxes[index][3] for index in items)
+            if len(items) > 1 and bottom - top >= 2 * height:
+                groups = _split(boxes, items, _X, self.column_gap * height)
+                if len(groups) > 1:
+                    split = []
+                    for group in groups:
+                        split.append((group, len(lanes)))
+                        lanes.append(_span(boxes, group))
+                    pending.extend(reversed(split))
+                    continue
+            if len(items) > 1:
+                groups = _split(boxes, items, _Y, self.block_gap * height)
+                if len(groups) > 1:
+                    pending.extend((group, lane) for group in reversed(groups))
+                    continue
+            paragraphs.extend(self._paragraphs(boxes, items, height, lane))
+
+        columns = _number_columns({paragraph.column: lanes[paragraph.column] for paragraph in paragraphs})
+        return [paragraph._replace(column=columns[paragraph.column]) for paragraph in paragraphs]
+
+    def _lines(self, boxes, items):
+        """
+        Líneas de un bloque: barrido por el centro vertical de las cajas
+        """
+        lines = []
+        # Franja de la línea en curso: medias de y0 e y1 de sus cajas
+        top = bottom = 0.0
+        for index in sorted(items, key=lambda index: boxes[index][1] + boxes[index][3]):
+            x0, y0, x1, y1 = boxes[index]
+            if lines:
+                overlap = min(y1, bottom) - max(y0, top)
+                if overlap >= self.line_overlap * min(y1 - y0, bottom - top):
+                    line = lines[-1]
+                    line.append(index)
+                    top += (y0 - top) / len(line)
+                    bottom += (y1 - bottom) / len(line)
+                    continue
+            lines.append([index])
+            top, bottom = y0, y1
+        return [sorted(line, key=lambda index: boxes[index][0]) for line in lines]
+
+    def _paragraphs(self, boxes, items, height, column):
+        lines = self._lines(boxes, items)
+        spans = [
+            (min(boxes[index][1] for index in line), max(boxes[index][3] for index in line))
+            for line in lines
+        ]
+        gaps = [spans[number + 1][0] - spans[number][1] for number in range(len(lines) - 1)]
+        if not gaps:
+            return [Paragraph(lines, column)]
+        limit = max(0.0, _median(gaps)) + self.paragraph_gap * height
+        paragraphs = [Paragraph([lines[0]], column)]
+        for line, gap in zip(lines[1:], gaps):
+            if gap > limit:
+                paragraphs.append(Paragraph([line], column))
+            else:
+                paragraphs[-1].lines.append(line)
+        return paragraphs
+
+
+def reading_order(paragraphs):
+    """
+    Índices de las cajas en orden de lectura
+    """
+    return [index for paragraph in paragraphs for line in paragraph.lines for index in line]
+
+
+def paragraph_dicts(paragraphs, texts):
+    """
+    Párrafos serializables (respuestas JSON y caché): columna y texto de cada línea
+    """
+    return [
+        {"column": paragraph.column, "lines": [" ".join(texts[index] for index in line) for line in paragraph.lines]}
+        for paragraph in paragraphs
+    ]
+
+
+def layout_text(paragraphs):
+    """
+    Texto plano: una línea por línea y una línea en blanco entre párrafos
+    """
+    return "\n\n".join("\n".join(paragraph["lines"]) for paragraph in paragraphs)
+
+
+def paragraph_text(paragraph):
+    """
+    Texto de un párrafo seguido, para que Word lo reparta en líneas
+    """
+    return " ".join(paragraph["lines"])
+
+
+def split_paragraphs(text):
+    """
+    Párrafos de un texto plano separados por líneas en blanco
+    """
+    return [paragraph for paragraph in re.split(r"\n\s*\n", text.strip()) if paragraph.strip()] or [text]
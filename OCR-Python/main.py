@@ -1,133 +1,1352 @@
+import time
+
+# Instante de arranque, para medir el tiempo de import y hasta estar listo
+_process_started = time.perf_counter()
+
 import os
-import uuid
+import mimetypes
+from functools import partial
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import threading
+from collections import deque, namedtuple
 from typing import List
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-import easyocr
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from ocr_pool import OCRWorkerPool, PoolSaturated
+from admission import AdmissionMiddleware, BodyLimit, Overloaded, PixelBudget, TokenBuckets
+from ocr_batching import RecognitionBatcher
+from ocr_cache import OCRResultCache, make_cache_key
+from preprocessing import PROFILES, DEFAULT_PROFILE, preprocess_image, thread_buffers
+from resolution import ResolutionGovernor
+from image_decode import DecodedImage, ImageDecodeError, ImageTooLarge, decode_gray, image_size, map_upload
+from page_crop import PageCropper, frame_transform, map_points
+from tiling import TiledOCR
+from layout import LayoutAnalyzer, layout_text, paragraph_dicts, paragraph_text, points_bounds, reading_order, split_paragraphs
+from ocr_cascade import (
+    CHEAP_ENGINES, ENGINES, CascadeOptions, CascadeStats, EngineUnavailable, available_cheap_engines,
+    run_cascade, tesseract_available, tesseract_read,
+)
+from ocr_engines import (
+    CachedEngine, EngineBusy, EngineInputError, EngineRouter, FunctionEngine, OCRLine, OCRResult, TextractEngine,
+)
+from ocr_models import ModelLoader, ModelNotReady
+from memory_stats import process_memory
+from ocr_metrics import PIXEL_BUCKETS, SIZE_BUCKETS, MetricsRegistry
+from documents import (
+    DEFAULT_PDF_DPI, PDF, TIFF, UnsupportedDocument, document_kind, is_archive, is_multipage,
+    open_archive, page_count, read_member, render_page,
+)
+from jobs import PRIORITIES, JobFailed, JobStore, JobWorkerPool
+from docx_writer import DOCX_MEDIA_TYPE, HEADING_1, TITLE, DocxTemplate, file_size, iter_file
+from document_store import DocumentNotFound, DocumentSweeper, document_store_from_env
 import cv2
-import numpy as np
-from PIL import Image
-from docx import Document
-from docx.shared import Inches
-import io
+import json
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("ocr_api")
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Arranca en segundo plano la carga de los modelos, los workers de
+    trabajos y la limpieza de documentos, y los detiene al cerrar
+    """
+    logger.info("Aplicación importada en %.2fs", APP_IMPORT_SECONDS)
+    models.start()
+    if job_workers.processes > 0:
+        job_workers.start()
+    elif not JOB_WORKERS_EXTERNAL:
+        logger.warning(
+            "Nadie atiende la cola de trabajos: POST /jobs responderá 503 "
+            "(OCR_JOB_WORKERS o, con workers aparte, OCR_JOBS_EXTERNAL=1)"
+        )
+    document_sweeper.start()
+    try:
+        yield
+    finally:
+        ocr_pool.shutdown(wait=False)
+        job_workers.shutdown()
+        document_sweeper.shutdown()
+        if batcher is not None:
+            batcher.shutdown()
+        textract.shutdown()
+        models.shutdown()
+        ocr_cache.close()
 
-app = FastAPI(title="OCR API", description="API para OCR de texto manuscrito")
+app = FastAPI(title="OCR API", description="API para OCR de texto manuscrito", lifespan=lifespan)
 
-# Configurar CORS para permitir conexiones desde React Native
+# Control de admisión antes de leer el cuerpo: tamaño máximo de las subidas
+# (OCR_MAX_UPLOAD_MB) y peticiones por segundo por clave de API o IP
+# (OCR_RATE_LIMIT, desactivado por defecto)
+body_limit = BodyLimit.from_env()
+rate_limiter = TokenBuckets.from_env()
+app.add_middleware(AdmissionMiddleware, body_limit=body_limit, rate_limiter=rate_limiter)
+
+# Configurar CORS para permitir conexiones desde React Native. OCR_CORS_ORIGINS
+# restringe los orígenes (separados por comas); por defecto, cualquiera
+CORS_ORIGINS = [origin.strip() for origin in os.getenv("OCR_CORS_ORIGINS", "*").split(",") if origin.strip()]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # En producción, especificar dominios específicos
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_time(request, call_next):
+    """
+    Duración de cada petición por ruta y código de estado (en las respuestas
+    en streaming, hasta que empieza el envío)
+    """
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    request_seconds.observe(
+        time.perf_counter() - start,
+        route=route.path if route is not None else "unmatched",
+        status=response.status_code,
+    )
+    return response
+
 # Inicializar EasyOCR (soporta múltiples idiomas incluyendo español)
-# EasyOCR es especialmente bueno para texto manuscrito
-reader = easyocr.Reader(['es', 'en'])  # Español e Inglés
+# EasyOCR es especialmente bueno para texto manuscrito.
+# Con OCR_MODEL_LOADING=background (por defecto) los modelos se cargan en un
+# hilo al arrancar y el servidor responde desde el primer momento;
+# con OCR_MODEL_LOADING=eager se cargan durante el import, como antes.
+OCR_LANGUAGES = ['es', 'en']  # Español e Inglés
+models = ModelLoader.from_env(OCR_LANGUAGES, started_at=_process_started)
+if os.getenv("OCR_MODEL_LOADING", "background") == "eager":
+    models.load()
+
+def get_reader():
+    return models.reader
+
+# Pool acotado donde corren preprocesado e inferencia, fuera del event loop
+ocr_pool = OCRWorkerPool.from_env()
+
+# Agrupa el reconocimiento de peticiones concurrentes en lotes (OCR_BATCHING=0 lo desactiva)
+batcher = RecognitionBatcher.from_env(get_reader)
+
+# Umbral mínimo de confianza para aceptar un texto detectado
+CONFIDENCE_THRESHOLD = 0.3
+
+# Reduce las fotos grandes antes de detectar sin bajar el texto de una altura mínima
+# (OCR_DOWNSCALE=0 lo desactiva)
+governor = ResolutionGovernor.from_env()
 
-# Crear directorios necesarios
-os.makedirs("uploads", exist_ok=True)
-os.makedirs("output", exist_ok=True)
+# Recorta los márgenes y el fondo alrededor del contenido antes de detectar
+# (OCR_CROP=off lo desactiva, OCR_CROP=page corrige también la perspectiva de la hoja)
+cropper = PageCropper.from_env()
 
-def preprocess_image(image_array):
+# Las imágenes que siguen siendo muy grandes tras reducirlas se detectan por
+# teselas con memoria acotada (OCR_TILING=0 lo desactiva). Los hilos de
+# teselas son los mismos para todos los workers del pool y no pasan de
+# OCR_POOL_WORKERS; con procesos, cada worker procesa sus teselas en serie
+tiler = TiledOCR.from_env(max_workers=ocr_pool.max_workers if ocr_pool.mode == "thread" else 1)
+
+# Presupuesto global de píxeles de las imágenes en curso: cada imagen reserva
+# los píxeles de su cabecera antes de decodificarse y, si no caben, se
+# responde 503 (OCR_INFLIGHT_MEGAPIXELS=0 lo desactiva). Las imágenes de más
+# de OCR_MAX_IMAGE_MEGAPIXELS se rechazan con 413.
+pixel_budget = PixelBudget.from_env()
+MAX_IMAGE_PIXELS = int(float(os.getenv("OCR_MAX_IMAGE_MEGAPIXELS", "100")) * 1_000_000)
+# Coste que se supone a una imagen cuya cabecera PIL no reconoce (una foto de 12 MP)
+UNKNOWN_IMAGE_PIXELS = 12_000_000
+
+# Agrupa los textos reconocidos en líneas, párrafos y columnas en orden de
+# lectura (OCR_LAYOUT=0 los une en el orden del motor)
+layout = LayoutAnalyzer.from_env()
+
+# Versión del formato de las entradas de la caché de resultados (forma parte
+# de la clave): 2 añade las cajas de cada texto en el encuadre original
+CACHE_FORMAT = 2
+
+# Imagen sin preprocesar que recognize_image procesa por teselas
+PendingTiles = namedtuple("PendingTiles", "image profile")
+
+# Cascada de motores: un motor barato (tesseract o easyocr-lite) lee primero y
+# solo las regiones con confianza menor que OCR_CASCADE_ESCALATE_BELOW pasan a
+# EasyOCR. OCR_ENGINE fija el motor por defecto; se puede elegir por petición.
+OCR_ENGINE = os.getenv("OCR_ENGINE", "easyocr")
+CASCADE_CHEAP_ENGINE = os.getenv("OCR_CASCADE_CHEAP", "tesseract")
+CASCADE_ESCALATE_BELOW = float(os.getenv("OCR_CASCADE_ESCALATE_BELOW", "0.6"))
+cascade_stats = CascadeStats()
+
+# Documentos multipágina (PDF/TIFF): resolución de rasterizado y límite de páginas
+PDF_DPI = int(os.getenv("OCR_PDF_DPI", str(DEFAULT_PDF_DPI)))
+MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "500"))
+
+# Número máximo de imágenes por petición en /extract-text/batch (contando las de los zip)
+MAX_BATCH_FILES = int(os.getenv("OCR_BATCH_MAX_FILES", "100"))
+
+# Cola persistente de trabajos. Cada worker de la cola carga sus propios
+# modelos, así que al importar main no se lanza ninguno (cada worker de
+# `uvicorn --workers` lanzaría el suyo): los lanzan `python main.py`,
+# server.py o `python jobs.py`. OCR_JOB_WORKERS fija cuántos
+job_store = JobStore.from_env()
+job_workers = JobWorkerPool(
+    job_store, "main:process_job", processes=int(os.getenv("OCR_JOB_WORKERS", "0"))
+)
+JOB_MAX_ATTEMPTS = int(os.getenv("OCR_JOB_MAX_ATTEMPTS", "3"))
+# OCR_JOBS_EXTERNAL=1: la cola la atienden procesos de fuera (`python jobs.py`).
+# Sin esto ni workers propios, POST /jobs responde 503 en lugar de aceptar
+# trabajos que nadie va a reclamar
+JOB_WORKERS_EXTERNAL = os.getenv("OCR_JOBS_EXTERNAL", "0") == "1"
+
+def jobs_served():
+    return job_workers.running or JOB_WORKERS_EXTERNAL
+
+# Caché de resultados por contenido (OCR_CACHE_DB activa el nivel en disco)
+ocr_cache = OCRResultCache.from_env()
+
+# Métricas en formato Prometheus (GET /metrics). Son de este proceso: con
+# OCR_POOL_MODE=process las etapas que corren en los workers no se registran
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    "ocr_stage_seconds", "Duración de cada etapa del pipeline de OCR", labelnames=("stage",)
+)
+backend_seconds = metrics.histogram(
+    "ocr_backend_seconds", "Duración del OCR de una imagen por motor, con los respaldos incluidos",
+    labelnames=("backend",),
+)
+request_seconds = metrics.histogram(
+    "ocr_http_request_seconds", "Duración de las peticiones HTTP hasta la respuesta",
+    labelnames=("route", "status"),
+)
+upload_bytes = metrics.histogram("ocr_upload_bytes", "Tamaño de los ficheros subidos", SIZE_BUCKETS)
+image_pixels = metrics.histogram("ocr_image_pixels", "Píxeles de cada imagen decodificada", PIXEL_BUCKETS)
+crop_kept_ratio = metrics.histogram(
+    "ocr_crop_kept_ratio", "Fracción de los píxeles que conserva el recorte de página",
+    (0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+metrics.gauge("ocr_models_ready", "1 si los modelos de OCR están cargados", lambda: int(models.ready))
+metrics.gauge("ocr_pool_in_flight", "Tareas ejecutándose en el pool de OCR", lambda: ocr_pool.stats()["in_flight"])
+metrics.gauge("ocr_pool_queue_depth", "Tareas esperando en la cola del pool", lambda: ocr_pool.stats()["queue_depth"])
+metrics.gauge("ocr_pool_rejected", "Tareas rechazadas con la cola llena", lambda: ocr_pool.stats()["rejected"])
+metrics.gauge(
+    "ocr_cascade_regions", "Regiones leídas por el motor barato de la cascada, aceptadas o escaladas a EasyOCR",
+    lambda: {
+        "accepted": cascade_stats.stats()["regions"] - cascade_stats.stats()["escalated"],
+        "escalated": cascade_stats.stats()["escalated"],
+    },
+    labelname="result",
+)
+metrics.gauge("ocr_cascade_fallbacks", "Imágenes en las que el motor barato no encontró texto",
+              lambda: cascade_stats.stats()["fallbacks"])
+metrics.gauge(
+    "ocr_admission_rejected", "Peticiones rechazadas por el control de admisión",
+    lambda: {
+        "body_too_large": body_limit.rejected if body_limit is not None else 0,
+        "rate_limited": rate_limiter.stats()["rejected"] if rate_limiter is not None else 0,
+        "overloaded": pixel_budget.stats()["rejected"] if pixel_budget is not None else 0,
+    },
+    labelname="reason",
+)
+metrics.gauge("ocr_inflight_pixels", "Píxeles reservados por las imágenes en curso",
+              lambda: pixel_budget.stats()["in_flight_pixels"] if pixel_budget is not None else 0)
+metrics.gauge(
+    "ocr_cache_lookups", "Consultas a la caché de resultados por tipo",
+    lambda: {key: ocr_cache.stats()[key] for key in ("hits", "disk_hits", "misses")}, labelname="result",
+)
+
+# Documentos Word generados: almacén con caducidad y límite de tamaño (local o S3)
+document_store = document_store_from_env()
+document_sweeper = DocumentSweeper(document_store, float(os.getenv("OCR_OUTPUT_SWEEP_SECONDS", "300")))
+metrics.gauge("ocr_documents_stored", "Documentos Word guardados tras el último barrido",
+              lambda: document_store.stats()["files"])
+metrics.gauge("ocr_documents_bytes", "Bytes ocupados por los documentos Word tras el último barrido",
+              lambda: document_store.stats()["bytes"])
+metrics.gauge(
+    "ocr_documents_removed", "Documentos Word borrados por caducidad o por tamaño",
+    lambda: {"expired": document_store.stats()["expired"], "evicted": document_store.stats()["evicted"]},
+    labelname="reason",
+)
+
+# Plantilla Word cargada una sola vez (OCR_DOCX_TEMPLATE para usar una propia)
+docx_template = DocxTemplate.from_env()
+
+def word_paragraphs(title, paragraphs, *extra):
     """
-    Preprocesa la imagen para mejorar la precisión del OCR
+    Título, encabezado y párrafos del documento, con párrafos adicionales opcionales
     """
-    # Convertir a escala de grises
-    if len(image_array.shape) == 3:
-        gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = image_array
-    
-    # Aplicar filtro Gaussiano para reducir ruido
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    
-    # Binarización adaptativa para mejorar el contraste
-    binary = cv2.adaptiveThreshold(
-        blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+    return (
+        [(TITLE, title), (HEADING_1, 'Texto extraído por OCR')]
+        + [(None, paragraph) for paragraph in paragraphs]
+        + [(None, line) for line in extra]
     )
-    
-    # Operaciones morfológicas para limpiar la imagen
-    kernel = np.ones((2, 2), np.uint8)
-    cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-    
-    return cleaned
+
+def save_document(document):
+    """
+    Guarda el documento en el almacén y devuelve su nombre
+    """
+    try:
+        return document_store.put(document)
+    finally:
+        document.close()
+
+def docx_response(document, filename, headers=None):
+    """
+    Envía el documento en la respuesta directamente desde el buffer
+    """
+    headers = dict(headers or {})
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    headers["Content-Length"] = str(file_size(document))
+    return StreamingResponse(iter_file(document), media_type=DOCX_MEDIA_TYPE, headers=headers)
+
+def recognize_regions(processed_image, horizontal_list, free_list):
+    """
+    Reconoce las regiones detectadas; pasa por el batcher si está activo
+    """
+    if batcher is None:
+        return get_reader().recognize(processed_image, horizontal_list, free_list)
+    return batcher.recognize(processed_image, horizontal_list, free_list)
+
+def read_text(processed_image):
+    """
+    Detecta y reconoce texto en una imagen ya preprocesada
+    """
+    if batcher is None:
+        with stage_seconds.time(stage="readtext"):
+            return get_reader().readtext(processed_image)
+    with stage_seconds.time(stage="detect"):
+        horizontal_list, free_list = get_reader().detect(processed_image)
+    with stage_seconds.time(stage="recognize"):
+        return recognize_regions(processed_image, horizontal_list[0], free_list[0])
+
+def read_text_tiled(image_array, profile=DEFAULT_PROFILE):
+    """
+    Detección por teselas y reconocimiento por ventanas. Cada tesela o
+    ventana se preprocesa en los buffers de su hilo, nunca la imagen entera
+    """
+    def detect_tile(tile):
+        processed_tile = preprocess(tile, profile, buffers=thread_buffers())
+        with stage_seconds.time(stage="detect"):
+            horizontal_list, free_list = get_reader().detect(processed_tile)
+        return horizontal_list[0], free_list[0]
+
+    def recognize_window(window, horizontal_list, free_list):
+        processed_window = preprocess(window, profile, buffers=thread_buffers())
+        with stage_seconds.time(stage="recognize"):
+            return recognize_regions(processed_window, horizontal_list, free_list)
+
+    return tiler.read_text(image_array, detect_tile, recognize_window)
+
+def cheap_read(processed_image, engine):
+    """
+    Primera lectura de la cascada con el motor barato
+    """
+    if engine == "tesseract":
+        with stage_seconds.time(stage="tesseract"):
+            return tesseract_read(processed_image, OCR_LANGUAGES)
+    # easyocr-lite: la imagen a la mitad, con las cajas devueltas a escala completa
+    with stage_seconds.time(stage="easyocr_lite"):
+        small = cv2.resize(processed_image, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+        return [
+            ([[x * 2, y * 2] for x, y in bbox], text, confidence)
+            for bbox, text, confidence in get_reader().readtext(small)
+        ]
+
+def read_text_cascade(processed_image, options):
+    """
+    Cascada de dos motores sobre una imagen preprocesada
+    """
+    def escalate(image, horizontal_list):
+        with stage_seconds.time(stage="escalate"):
+            return recognize_regions(image, horizontal_list, [])
+
+    results, report = run_cascade(
+        processed_image, options, partial(cheap_read, engine=options.cheap), escalate, read_text,
+    )
+    cascade_stats.record(report)
+    return results
+
+def decode_image(contents):
+    """
+    Decodifica los bytes subidos (o su mmap) directamente a un array en gris,
+    con la orientación EXIF aplicada; los JPEG grandes, ya reducidos si el
+    gobernador de resolución lo permite
+    """
+    with stage_seconds.time(stage="decode"):
+        decoded = decode_gray(contents, governor)
+    # Píxeles de la imagen original, aunque se haya decodificado reducida
+    image_pixels.observe(int(decoded.image.shape[0] * decoded.image.shape[1] / decoded.scale ** 2))
+    return decoded
+
+def crop_page(image_array):
+    """
+    Aplica el recorte de página; devuelve (imagen, matriz al encuadre original o None)
+    """
+    if cropper is None:
+        return image_array, None
+    with stage_seconds.time(stage="crop"):
+        cropped, matrix = cropper.apply(image_array)
+    crop_kept_ratio.observe(cropped.shape[0] * cropped.shape[1] / (image_array.shape[0] * image_array.shape[1]))
+    return cropped, matrix
+
+def fit_image(image):
+    """
+    Recorta y reduce la imagen (un array o un DecodedImage); devuelve
+    (imagen, transformación que lleva puntos de la imagen resultante al
+    encuadre original)
+    """
+    if not isinstance(image, DecodedImage):
+        image = DecodedImage(image, 1.0, None)
+    image_array, matrix = crop_page(image.image)
+    image_array, scale = downscale(image_array, image.text_height)
+    return image_array, frame_transform(matrix, scale, image.scale)
+
+def downscale(image_array, text_height=None):
+    """
+    Aplica el gobernador de resolución; devuelve (imagen, escala)
+    """
+    if governor is None:
+        return image_array, 1.0
+    with stage_seconds.time(stage="downscale"):
+        return governor.apply(image_array, text_height)
+
+def preprocess(image_array, profile=DEFAULT_PROFILE, buffers=None):
+    with stage_seconds.time(stage="preprocess"):
+        return preprocess_image(image_array, profile, buffers=buffers)
+
+def detect_regions(contents, profile=DEFAULT_PROFILE):
+    """
+    Decodifica, preprocesa y detecta regiones de texto sin reconocerlas todavía.
+    Devuelve la imagen preprocesada, las regiones en orden de lectura y la
+    transformación al encuadre original (recorte y reducción).
+    """
+    image_array, transform = fit_image(decode_image(contents))
+    # Sin buffers compartidos: la imagen se sigue usando en llamadas posteriores
+    processed_image = preprocess(image_array, profile)
+    with stage_seconds.time(stage="detect"):
+        horizontal_list, free_list = get_reader().detect(processed_image)
+
+    regions = [("horizontal", box) for box in horizontal_list[0]]
+    regions += [("free", box) for box in free_list[0]]
+    regions.sort(key=lambda region: (region_top_left(region)[1], region_top_left(region)[0]))
+    return processed_image, regions, transform
+
+def region_top_left(region):
+    kind, box = region
+    if kind == "horizontal":
+        return box[0], box[2]
+    return min(point[0] for point in box), min(point[1] for point in box)
+
+def region_points(region, transform=None):
+    """
+    Convierte una región de EasyOCR en una lista de 4 puntos [x, y] en
+    coordenadas de la imagen original
+    """
+    kind, box = region
+    if kind == "horizontal":
+        x_min, x_max, y_min, y_max = box
+        box = [[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]]
+    return map_points(box, transform)
+
+def recognize_region(processed_image, region):
+    kind, box = region
+    with stage_seconds.time(stage="recognize"):
+        if kind == "horizontal":
+            return recognize_regions(processed_image, [box], [])
+        return recognize_regions(processed_image, [], [box])
+
+def run_ocr(contents, profile=DEFAULT_PROFILE, cascade=None):
+    """
+    Decodifica, preprocesa y ejecuta EasyOCR (o la cascada) sobre los bytes
+    de una imagen. Es bloqueante: se ejecuta siempre dentro de ocr_pool.
+    """
+    return ocr_array(decode_image(contents), profile, cascade)
+
+def run_page_ocr(contents, kind, index, profile=DEFAULT_PROFILE, cascade=None):
+    """
+    Rasteriza una página de un PDF/TIFF y ejecuta el OCR sobre ella
+    """
+    with stage_seconds.time(stage="render_page"):
+        image_array = render_page(contents, kind, index, PDF_DPI)
+    image_pixels.observe(image_array.shape[0] * image_array.shape[1])
+    return ocr_array(image_array, profile, cascade)
+
+def ocr_array(image_array, profile=DEFAULT_PROFILE, cascade=None):
+    """
+    Recorta, reduce, preprocesa y ejecuta EasyOCR (o la cascada) sobre una
+    imagen ya decodificada (array o DecodedImage); devuelve los textos
+    aceptados y sus confianzas.
+    Las imágenes que se procesan por teselas usan siempre EasyOCR.
+    """
+    image_array, transform = fit_image(image_array)
+    if tiler is not None and tiler.applies(image_array):
+        return recognize_image(PendingTiles(image_array, profile), transform=transform)
+    processed_image = preprocess(image_array, profile, buffers=thread_buffers())
+    return recognize_image(processed_image, cascade, transform)
+
+def prepare_image(contents, profile=DEFAULT_PROFILE):
+    """
+    Decodifica, recorta, reduce y preprocesa una imagen sin reconocerla;
+    primera etapa del pipeline de /extract-text/batch. Devuelve también la
+    transformación al encuadre original
+    """
+    image_array, transform = fit_image(decode_image(contents))
+    if tiler is not None and tiler.applies(image_array):
+        # Se preprocesa tesela a tesela al reconocerla
+        return PendingTiles(image_array, profile), transform
+    # Sin buffers compartidos: la imagen pasa a otra tarea del pool
+    return preprocess(image_array, profile), transform
+
+def recognize_image(processed_image, cascade=None, transform=None):
+    """
+    Detecta y reconoce texto en una imagen preprocesada (o pendiente de
+    procesar por teselas); devuelve los textos aceptados, sus confianzas y
+    sus cajas (llevadas al encuadre original con `transform`) en orden de
+    lectura, y los párrafos
+    """
+    if isinstance(processed_image, PendingTiles):
+        results = read_text_tiled(processed_image.image, processed_image.profile)
+    elif cascade is not None:
+        results = read_text_cascade(processed_image, cascade)
+    else:
+        results = read_text(processed_image)
+    with stage_seconds.time(stage="filter"):
+        results = [(map_points(bbox, transform), text, confidence) for bbox, text, confidence in filter_results(results)]
+    return layout_results(results)
+
+def filter_results(results):
+    """
+    Resultados de EasyOCR (caja, texto, confianza) por encima del umbral
+    """
+    return [result for result in results if result[2] > CONFIDENCE_THRESHOLD]
+
+def layout_results(results):
+    """
+    Textos, confianzas y cajas en orden de lectura y párrafos (None sin
+    análisis de maquetación) a partir de resultados ya filtrados
+    """
+    if layout is None:
+        return (
+            [text for _, text, _ in results],
+            [float(confidence) for _, _, confidence in results],
+            None,
+            [bbox for bbox, _, _ in results],
+        )
+    with stage_seconds.time(stage="layout"):
+        paragraphs = layout.analyze([points_bounds(bbox) for bbox, _, _ in results])
+        order = reading_order(paragraphs)
+        return (
+            [results[index][1] for index in order],
+            [float(results[index][2]) for index in order],
+            paragraph_dicts(paragraphs, [text for _, text, _ in results]),
+            [results[index][0] for index in order],
+        )
+
+def pipeline_params(profile=DEFAULT_PROFILE, cascade=None):
+    """
+    Todo lo que cambia el resultado del OCR además de los bytes subidos
+    """
+    return {
+        "engine": "easyocr" if cascade is None else {"cascade": cascade.cache_params},
+        "languages": OCR_LANGUAGES,
+        "preprocess": profile,
+        "confidence_threshold": CONFIDENCE_THRESHOLD,
+        "downscale": governor.cache_params if governor is not None else None,
+        "crop": cropper.cache_params if cropper is not None else None,
+        "tiling": tiler.cache_params if tiler is not None else None,
+        "layout": layout.cache_params if layout is not None else None,
+        "format": CACHE_FORMAT,
+    }
+
+def ocr_cache_key(contents, profile=DEFAULT_PROFILE, cascade=None, stream=False):
+    """
+    Clave de caché: bytes subidos + parámetros del pipeline
+    """
+    params = pipeline_params(profile, cascade)
+    if stream:
+        # /extract-text/stream detecta la imagen entera aunque sea grande: su
+        # resultado no vale para el pipeline por teselas ni al revés
+        params.update(tiling=None, pipeline="stream")
+    return make_cache_key(contents, **params)
+
+def cache_entry(extracted_text, confidence_scores, paragraphs, boxes):
+    return {
+        "individual_texts": extracted_text,
+        "confidence_scores": confidence_scores,
+        "paragraphs": paragraphs,
+        "boxes": boxes,
+    }
+
+def cached_results(entry):
+    """
+    (textos, confianzas, párrafos, cajas) de una entrada de la caché
+    """
+    return entry["individual_texts"], entry["confidence_scores"], entry["paragraphs"], entry["boxes"]
+
+async def cached_ocr(contents, profile=DEFAULT_PROFILE, cascade=None):
+    """
+    Devuelve el OCR de la caché si existe; si no, lo ejecuta en el pool y lo guarda
+    """
+    key = ocr_cache_key(contents, profile, cascade)
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        return cached_results(cached)
+
+    async with admitted(upload_pixels(contents)):
+        results = await run_in_pool(run_ocr, contents, profile, cascade)
+    ocr_cache.put(key, cache_entry(*results))
+    return results
+
+def full_text(extracted_text, paragraphs=None):
+    """
+    Texto completo: líneas y párrafos si hay maquetación, si no los textos seguidos
+    """
+    if paragraphs is None:
+        return " ".join(extracted_text)
+    return layout_text(paragraphs)
+
+def text_response(extracted_text, confidence_scores, paragraphs=None, boxes=None):
+    """
+    Respuesta de /extract-text/ para una imagen
+    """
+    response = {
+        "text": full_text(extracted_text, paragraphs),
+        "individual_texts": extracted_text,
+        "confidence_scores": confidence_scores,
+        "total_words": len(extracted_text),
+    }
+    if boxes is not None:
+        response["boxes"] = boxes
+    if paragraphs is not None:
+        response["paragraphs"] = paragraphs
+    return response
+
+def document_response(pages):
+    """
+    Respuesta de /extract-text/ para un documento multipágina
+    """
+    extracted_text = [text for page in pages for text in page["individual_texts"]]
+    response = {
+        "text": "\n\n".join(page["text"] for page in pages),
+        "individual_texts": extracted_text,
+        "confidence_scores": [score for page in pages for score in page["confidence_scores"]],
+        "total_words": len(extracted_text),
+        "page_count": len(pages),
+        "pages": pages,
+    }
+    if layout is not None:
+        response["paragraphs"] = [
+            {"page": page["page"], **paragraph} for page in pages for paragraph in page.get("paragraphs", ())
+        ]
+    return response
+
+def page_result(number, extracted_text, confidence_scores, paragraphs=None, boxes=None):
+    return {"page": number, **text_response(extracted_text, confidence_scores, paragraphs, boxes)}
+
+def process_job(contents, job, check_cancelled):
+    """
+    Manejador de la cola de trabajos; se ejecuta en un proceso worker y
+    comprueba la cancelación entre páginas. Un fichero que no se puede
+    decodificar falla sin reintentos
+    """
+    try:
+        return run_job(contents, job, check_cancelled)
+    except (ImageDecodeError, UnsupportedDocument) as e:
+        raise JobFailed(str(e))
+
+def run_job(contents, job, check_cancelled):
+    profile = job["params"].get("profile", DEFAULT_PROFILE)
+    cascade = job["params"].get("cascade")
+    if cascade is not None:
+        cascade = CascadeOptions(**cascade)
+    kind = document_kind(job["content_type"], contents)
+    if kind is None:
+        return text_response(*run_ocr(contents, profile, cascade))
+
+    pages = []
+    for index in range(page_count(contents, kind)):
+        check_cancelled()
+        pages.append(page_result(index + 1, *run_page_ocr(contents, kind, index, profile, cascade)))
+    return document_response(pages)
+
+async def ocr_document(contents, kind, profile=DEFAULT_PROFILE, cascade=None):
+    """
+    OCR de un documento multipágina. Las páginas se rasterizan y procesan en
+    paralelo en el pool, con como mucho tantas páginas en curso como workers,
+    y los resultados se devuelven en orden.
+    """
+    total = await run_in_pool(page_count, contents, kind)
+    if total > MAX_PAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El documento tiene {total} páginas; el máximo es {MAX_PAGES}",
+        )
+
+    async def process(index):
+        # Con la cola llena, las páginas siguientes esperan turno en lugar de fallar
+        if index == 0:
+            return await run_in_pool(run_page_ocr, contents, kind, index, profile, cascade)
+        return await run_in_pool_waiting(run_page_ocr, contents, kind, index, profile, cascade)
+
+    window = max(1, ocr_pool.max_workers)
+    pending = deque()
+    pages = []
+    next_index = 0
+    try:
+        while next_index < total or pending:
+            while next_index < total and len(pending) < window:
+                pending.append(asyncio.ensure_future(process(next_index)))
+                next_index += 1
+            pages.append(page_result(len(pages) + 1, *await pending.popleft()))
+    finally:
+        for task in pending:
+            task.cancel()
+    return pages
+
+async def cached_document_ocr(contents, kind, profile=DEFAULT_PROFILE, cascade=None, wait=False):
+    key = make_cache_key(contents, document=kind, dpi=PDF_DPI, **pipeline_params(profile, cascade))
+    pages = ocr_cache.get(key)
+    if pages is None:
+        async with admitted(upload_pixels(contents, kind), wait):
+            pages = await ocr_document(contents, kind, profile, cascade)
+        ocr_cache.put(key, pages)
+    return pages
+
+async def batch_item_ocr(contents, content_type, profile=DEFAULT_PROFILE):
+    """
+    OCR de una imagen de un lote. Decodificación/preprocesado e inferencia
+    van en tareas separadas del pool, de modo que mientras una imagen se
+    reconoce la siguiente ya se está preparando.
+    """
+    kind = document_kind(content_type, contents)
+    if kind is not None:
+        return document_response(await cached_document_ocr(contents, kind, profile, wait=True))
+
+    key = ocr_cache_key(contents, profile)
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        return text_response(*cached_results(cached))
+
+    async with admitted(upload_pixels(contents), wait=True):
+        processed_image, transform = await run_in_pool_waiting(prepare_image, contents, profile)
+        results = await run_in_pool_waiting(recognize_image, processed_image, None, transform)
+        del processed_image
+    ocr_cache.put(key, cache_entry(*results))
+    return text_response(*results)
+
+async def read_upload(file, mappable=False):
+    """
+    Lee el fichero subido registrando su tamaño y el tiempo de lectura. Con
+    mappable=True y el pool en hilos, si el servidor ya ha volcado la subida
+    a disco se usa un mmap de solo lectura en lugar de copiarla a memoria
+    """
+    with stage_seconds.time(stage="read"):
+        contents = map_upload(file.file) if mappable and ocr_pool.mode == "thread" else None
+        if contents is None:
+            contents = await file.read()
+    upload_bytes.observe(len(contents))
+    return contents
+
+def upload_pixels(contents, kind=None):
+    """
+    Píxeles que ocupará la subida decodificada, leídos de la cabecera sin
+    decodificarla; un documento cuenta las páginas que se rasterizan a la
+    vez. Responde 413 si la imagen pasa de MAX_IMAGE_PIXELS
+    """
+    window = max(1, ocr_pool.max_workers)
+    if kind == PDF:
+        # Páginas A4 rasterizadas a PDF_DPI
+        return window * int(8.27 * PDF_DPI * 11.69 * PDF_DPI)
+    try:
+        size = image_size(contents)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"La imagen es demasiado grande: {e}")
+    if size is None:
+        return UNKNOWN_IMAGE_PIXELS
+    pixels = size[0] * size[1]
+    if MAX_IMAGE_PIXELS and pixels > MAX_IMAGE_PIXELS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"La imagen tiene {pixels / 1e6:.1f} megapíxeles; el máximo es {MAX_IMAGE_PIXELS / 1e6:g}",
+        )
+    return window * pixels if kind == TIFF else pixels
+
+async def admit(pixels, wait=False):
+    """
+    Reserva los píxeles en el presupuesto global. Si no caben responde 503
+    con Retry-After o, con wait=True, espera turno (imágenes de un lote que
+    ya está en marcha). Devuelve la reserva para release_admission
+    """
+    if pixel_budget is None:
+        return None
+    while True:
+        try:
+            return pixel_budget.acquire(pixels)
+        except Overloaded as e:
+            if not wait:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Servidor ocupado, inténtalo de nuevo más tarde",
+                    headers={"Retry-After": str(e.retry_after)},
+                )
+            await asyncio.sleep(0.25)
+
+def release_admission(reservation):
+    if reservation is not None:
+        pixel_budget.release(reservation)
+
+@asynccontextmanager
+async def admitted(pixels, wait=False):
+    reservation = await admit(pixels, wait)
+    try:
+        yield
+    finally:
+        release_admission(reservation)
+
+def local_busy():
+    """
+    El pool de OCR tiene la cola llena o el presupuesto de píxeles está agotado
+    """
+    stats = ocr_pool.stats()
+    if stats["queue_depth"] >= stats["max_queue"]:
+        return True
+    return pixel_budget is not None and pixel_budget.stats()["in_flight_pixels"] >= pixel_budget.max_pixels
+
+def router_backend(read):
+    """
+    Adapta una lectura de la API al router: sus 503 (cola llena, modelos
+    cargando, presupuesto de píxeles) pasan a EngineBusy para que pruebe el
+    siguiente motor
+    """
+    async def read_or_busy(contents, **options):
+        try:
+            return await read(contents, **options)
+        except HTTPException as e:
+            if e.status_code != 503:
+                raise
+            retry_after = (e.headers or {}).get("Retry-After")
+            raise EngineBusy(e.detail, int(retry_after) if retry_after is not None else None)
+
+    return read_or_busy
+
+async def easyocr_backend(contents, profile=DEFAULT_PROFILE, cascade=None):
+    """
+    EasyOCR (o la cascada) con su caché. Las líneas llevan su caja en el
+    encuadre original, como las de los otros motores, y van ya en orden de
+    lectura y con los párrafos
+    """
+    started = time.perf_counter()
+    extracted_text, confidence_scores, paragraphs, boxes = await cached_ocr(contents, profile, cascade)
+    lines = [OCRLine(*line) for line in zip(boxes, extracted_text, confidence_scores)]
+    return OCRResult("easyocr", lines, paragraphs, {"easyocr": time.perf_counter() - started})
+
+def run_tesseract(contents, profile=DEFAULT_PROFILE):
+    """
+    Tesseract sobre la imagen recortada, reducida y preprocesada, con las
+    cajas en el encuadre original. Es bloqueante: se ejecuta dentro de ocr_pool.
+    """
+    image_array, transform = fit_image(decode_image(contents))
+    processed_image = preprocess(image_array, profile, buffers=thread_buffers())
+    with stage_seconds.time(stage="tesseract"):
+        results = tesseract_read(processed_image, OCR_LANGUAGES)
+    return [OCRLine(map_points(bbox, transform), text, confidence) for bbox, text, confidence in results]
+
+async def tesseract_backend(contents, profile=DEFAULT_PROFILE, cascade=None):
+    """
+    Tesseract en el pool de OCR; no necesita los modelos de EasyOCR
+    """
+    started = time.perf_counter()
+    async with admitted(upload_pixels(contents)):
+        try:
+            lines = await ocr_pool.run(run_tesseract, contents, profile)
+        except PoolSaturated as e:
+            raise EngineBusy("Servidor ocupado, inténtalo de nuevo más tarde", e.retry_after)
+    return OCRResult("tesseract", lines, None, {"tesseract": time.perf_counter() - started})
+
+def tesseract_cache_params(profile=DEFAULT_PROFILE, cascade=None):
+    return {
+        "languages": OCR_LANGUAGES,
+        "preprocess": profile,
+        "downscale": governor.cache_params if governor is not None else None,
+        "crop": cropper.cache_params if cropper is not None else None,
+    }
+
+def textract_cache_params(profile=DEFAULT_PROFILE, cascade=None):
+    return {"api": "detect_document_text"}
+
+# Motores entre los que elige el router en /extract-text/ y
+# /process-image-to-word/ (parámetro backend). OCR_BACKENDS fija los
+# habilitados, en orden de respaldo; por defecto solo EasyOCR, como antes.
+# Textract usa las variables TEXTRACT_* de la Lambda; en pruebas se sustituye
+# su cliente con textract.set_client(fake_textract.StubTextractClient())
+textract = TextractEngine.from_env()
+router = EngineRouter.from_env({
+    "easyocr": FunctionEngine(
+        "easyocr", router_backend(easyocr_backend), available=lambda: models.ready, busy=local_busy,
+    ),
+    "tesseract": CachedEngine(
+        FunctionEngine("tesseract", router_backend(tesseract_backend), available=tesseract_available, busy=local_busy),
+        ocr_cache, tesseract_cache_params,
+    ),
+    "textract": CachedEngine(textract, ocr_cache, textract_cache_params),
+})
+OCR_BACKEND = router.default
+metrics.gauge(
+    "ocr_backend_served", "Imágenes atendidas por cada motor del router",
+    lambda: {name: engine["served"] for name, engine in router.stats()["engines"].items()}, labelname="backend",
+)
+metrics.gauge(
+    "ocr_backend_failed_over", "Veces que un motor estaba saturado o caído y se pasó al siguiente",
+    lambda: {name: engine["failed_over"] for name, engine in router.stats()["engines"].items()}, labelname="backend",
+)
+
+def result_texts(result):
+    """
+    Textos, confianzas y cajas en orden de lectura y párrafos de un
+    OCRResult. Las líneas de los motores que no hacen la maquetación se
+    filtran por confianza y se ordenan aquí; sin cajas, quedan en el orden
+    del motor
+    """
+    if result.paragraphs is not None:
+        return (
+            [line.text for line in result.lines], [line.confidence for line in result.lines], result.paragraphs,
+            [line.box for line in result.lines],
+        )
+    lines = filter_results(result.lines)
+    if any(line.box is None for line in lines):
+        return [line.text for line in lines], [float(line.confidence) for line in lines], None, [line.box for line in lines]
+    return layout_results(lines)
+
+async def routed_ocr(contents, backend=None, profile=DEFAULT_PROFILE, cascade=None):
+    """
+    OCR de una imagen con el motor que elija el router (backend es la
+    preferencia del cliente); si ninguno puede atenderla responde 503 y si
+    el motor rechaza la imagen, 400 o 413
+    """
+    try:
+        result = await router.read(contents, hint=backend, pixels=upload_pixels(contents), profile=profile, cascade=cascade)
+    except EngineBusy as e:
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after is not None else None
+        raise HTTPException(status_code=503, detail=str(e), headers=headers)
+    except EngineUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except EngineInputError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    backend_seconds.observe(result.timings["total"], backend=result.engine)
+    return result
+
+def processed_with(backend, cascade=None):
+    """
+    Motor con el que se ha procesado la imagen, para el pie del documento Word
+    """
+    if backend == "tesseract":
+        return "Tesseract"
+    if backend == "textract":
+        return "AWS Textract"
+    return "EasyOCR" if cascade is None else f"{cascade.cheap} y EasyOCR"
+
+def check_profile(profile):
+    if profile not in PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Perfil de preprocesado no válido. Opciones: {', '.join(PROFILES)}",
+        )
+
+def check_engine(engine, cheap_engine, escalate_below):
+    """
+    Valida el motor pedido; devuelve las opciones de la cascada o None para EasyOCR
+    """
+    if engine not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Motor de OCR no válido. Opciones: {', '.join(ENGINES)}")
+    if engine == "easyocr":
+        return None
+    if cheap_engine not in CHEAP_ENGINES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Motor barato no válido. Opciones: {', '.join(CHEAP_ENGINES)}",
+        )
+    if cheap_engine not in available_cheap_engines():
+        raise HTTPException(
+            status_code=400,
+            detail=f"El motor {cheap_engine} no está instalado en el servidor. "
+                   f"Disponibles: {', '.join(available_cheap_engines())}",
+        )
+    if not 0.0 <= escalate_below <= 1.0:
+        raise HTTPException(status_code=400, detail="escalate_below debe estar entre 0 y 1")
+    return CascadeOptions(cheap_engine, escalate_below)
+
+def check_backend(backend):
+    if backend not in router.choices:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Motor no válido o no habilitado. Opciones: {', '.join(router.choices)}",
+        )
+
+async def run_in_pool(fn, *args):
+    """
+    Envía una tarea al pool de OCR; si la cola está llena o los modelos aún
+    no están cargados responde 503 con Retry-After
+    """
+    if not models.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Los modelos de OCR se están cargando, inténtalo de nuevo en unos segundos",
+            headers={"Retry-After": "5"},
+        )
+    try:
+        return await ocr_pool.run(fn, *args)
+    except PoolSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado, inténtalo de nuevo más tarde",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except EngineUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+async def run_in_pool_waiting(fn, *args):
+    """
+    Como run_in_pool, pero si la cola está llena espera turno en lugar de
+    responder 503. Para tareas de una petición que ya está en marcha.
+    """
+    while True:
+        try:
+            return await run_in_pool(fn, *args)
+        except HTTPException as e:
+            if e.status_code != 503 or not models.ready:
+                raise
+            await asyncio.sleep(0.25)
+
+APP_IMPORT_SECONDS = time.perf_counter() - _process_started
 
 @app.get("/")
 async def root():
     return {"message": "OCR API está funcionando correctamente"}
 
+@app.get("/health/live")
+async def liveness():
+    """
+    El proceso está vivo y el event loop responde
+    """
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Los modelos están cargados y se pueden atender peticiones de OCR
+    """
+    status = {**models.status(), "import_seconds": round(APP_IMPORT_SECONDS, 3)}
+    if not models.ready:
+        return JSONResponse(status_code=503, content=status, headers={"Retry-After": "5"})
+    return status
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Tiempos por etapa, tamaños de subida, píxeles por imagen y estado del
+    pool en formato de texto de Prometheus
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/pool")
+async def pool_metrics():
+    """
+    Profundidad de cola y tiempos de espera del pool de OCR
+    """
+    return ocr_pool.stats()
+
+@app.get("/metrics/batching")
+async def batching_metrics():
+    """
+    Tamaño medio de lote y tiempo de inferencia del batcher de reconocimiento
+    """
+    if batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **batcher.stats()}
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+    """
+    Aciertos, fallos y ocupación de la caché de resultados de OCR
+    """
+    return ocr_cache.stats()
+
+@app.get("/metrics/cascade")
+async def cascade_metrics():
+    """
+    Regiones leídas por el motor barato, tasa de escalado a EasyOCR e
+    imágenes que se procesaron enteras con EasyOCR
+    """
+    return {
+        "default_engine": OCR_ENGINE,
+        "cheap_engine": CASCADE_CHEAP_ENGINE,
+        "escalate_below": CASCADE_ESCALATE_BELOW,
+        "available_cheap_engines": list(available_cheap_engines()),
+        **cascade_stats.stats(),
+    }
+
+@app.get("/metrics/backends")
+async def backend_metrics():
+    """
+    Motores del router: disponibilidad, saturación, imágenes atendidas y
+    veces que se pasó al siguiente
+    """
+    return {**router.stats(), "textract": textract.stats()}
+
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """
+    Control de admisión: límite de tamaño, límite por cliente y presupuesto
+    de píxeles en curso, con sus rechazos
+    """
+    return {
+        "body_limit": body_limit.stats() if body_limit is not None else None,
+        "rate_limit": rate_limiter.stats() if rate_limiter is not None else None,
+        "pixel_budget": pixel_budget.stats() if pixel_budget is not None else None,
+        "max_image_pixels": MAX_IMAGE_PIXELS,
+    }
+
+@app.get("/metrics/memory")
+async def memory_metrics():
+    """
+    Memoria de este worker (RSS, PSS, compartida y privada)
+    """
+    return {"pid": os.getpid(), **process_memory()}
+
 @app.post("/extract-text/")
-async def extract_text(file: UploadFile = File(...)):
+async def extract_text(
+    file: UploadFile = File(...),
+    profile: str = DEFAULT_PROFILE,
+    engine: str = OCR_ENGINE,
+    cheap_engine: str = CASCADE_CHEAP_ENGINE,
+    escalate_below: float = CASCADE_ESCALATE_BELOW,
+    backend: str = OCR_BACKEND,
+):
     """
-    Extrae texto de una imagen usando OCR
+    Extrae texto de una imagen usando OCR. Acepta también PDF y TIFF
+    multipágina, en cuyo caso se añade el resultado de cada página en "pages".
+    Con engine=cascade lee primero con cheap_engine y solo pasa a EasyOCR las
+    regiones con confianza menor que escalate_below. backend elige el motor
+    de las imágenes (easyocr, tesseract, textract o auto) entre los habilitados;
+    los documentos multipágina usan siempre EasyOCR.
     """
     try:
-        # Verificar que el archivo sea una imagen
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
+        # Verificar que el archivo sea una imagen o un PDF
+        if not (file.content_type.startswith('image/') or file.content_type == 'application/pdf'):
+            raise HTTPException(status_code=400, detail="El archivo debe ser una imagen o un PDF")
+        check_profile(profile)
+        cascade = check_engine(engine, cheap_engine, escalate_below)
+        check_backend(backend)
         
         # Leer la imagen
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        # Convertir a array numpy
-        image_array = np.array(image)
-        
-        # Preprocesar la imagen
-        processed_image = preprocess_image(image_array)
+        contents = await read_upload(file, mappable=True)
         
-        # Realizar OCR con EasyOCR
-        results = reader.readtext(processed_image)
+        kind = document_kind(file.content_type, contents)
+        # pypdfium2 y PIL necesitan bytes, no un mmap
+        if kind is not None and await asyncio.to_thread(is_multipage, bytes(contents), kind):
+            return document_response(await cached_document_ocr(bytes(contents), kind, profile, cascade))
         
-        # Extraer solo el texto
-        extracted_text = []
-        confidence_scores = []
-        
-        for (bbox, text, confidence) in results:
-            if confidence > 0.3:  # Filtrar resultados con baja confianza
-                extracted_text.append(text)
-                confidence_scores.append(confidence)
-        
-        # Unir todo el texto
-        full_text = " ".join(extracted_text)
-        
-        return {
-            "text": full_text,
-            "individual_texts": extracted_text,
-            "confidence_scores": confidence_scores,
-            "total_words": len(extracted_text)
-        }
+        # OCR con el motor que elija el router (EasyOCR en el pool de workers,
+        # Tesseract o Textract, o desde la caché); el texto se une por líneas y
+        # párrafos en orden de lectura
+        result = await routed_ocr(contents, backend, profile, cascade)
+        return {**text_response(*result_texts(result)), "backend": result.engine}
         
+    except HTTPException:
+        raise
+    except UnsupportedDocument as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error procesando la imagen: {str(e)}")
 
+@app.post("/extract-text/stream")
+async def extract_text_stream(file: UploadFile = File(...), profile: str = DEFAULT_PROFILE):
+    """
+    Igual que /extract-text/ pero responde en NDJSON a medida que avanza el OCR:
+    primero las cajas detectadas, luego cada línea reconocida y al final el resumen
+    """
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
+    check_profile(profile)
+
+    contents = await read_upload(file, mappable=True)
+    key = ocr_cache_key(contents, profile, stream=True)
+    cached = ocr_cache.get(key)
+
+    reservation = None
+    if cached is None:
+        # La detección se hace antes de abrir el stream para poder responder 503/500 con normalidad.
+        # Los píxeles quedan reservados hasta que termina el stream
+        reservation = await admit(upload_pixels(contents))
+        try:
+            processed_image, regions, transform = await run_in_pool(detect_regions, contents, profile)
+        except Exception as e:
+            release_admission(reservation)
+            if isinstance(e, HTTPException):
+                raise
+            if isinstance(e, ImageDecodeError):
+                raise HTTPException(status_code=400, detail=str(e))
+            raise HTTPException(status_code=500, detail=f"Error procesando la imagen: {str(e)}")
+
+    def event(payload):
+        return json.dumps(payload, ensure_ascii=False) + "\n"
+
+    async def events():
+        if cached is not None:
+            # Los mismos eventos que sin caché: las cajas y luego cada línea,
+            # en orden de lectura
+            extracted_text, confidence_scores, paragraphs, boxes = cached_results(cached)
+            yield event({"type": "boxes", "boxes": boxes})
+            for index, (text, confidence, box) in enumerate(zip(extracted_text, confidence_scores, boxes)):
+                yield event({"type": "line", "index": index, "text": text, "confidence": confidence, "box": box})
+        else:
+            accepted = []
+            try:
+                yield event({
+                    "type": "boxes",
+                    "boxes": [region_points(region, transform) for region in regions],
+                })
+                # La respuesta ya ha empezado: si el pool se llena se espera
+                # turno en lugar de cortar el stream con un error
+                for index, region in enumerate(regions):
+                    for (bbox, text, confidence) in await run_in_pool_waiting(recognize_region, processed_image, region):
+                        if confidence > CONFIDENCE_THRESHOLD:
+                            accepted.append((region_points(region, transform), text, confidence))
+                            yield event({
+                                "type": "line",
+                                "index": index,
+                                "text": text,
+                                "confidence": float(confidence),
+                                "box": region_points(region, transform),
+                            })
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                yield event({"type": "error", "detail": f"Error procesando la imagen: {detail}"})
+                return
+            finally:
+                # También si el cliente se desconecta a mitad del stream
+                release_admission(reservation)
+
+            # El resumen va en orden de lectura, no en el de detección
+            extracted_text, confidence_scores, paragraphs, boxes = layout_results(accepted)
+            ocr_cache.put(key, cache_entry(extracted_text, confidence_scores, paragraphs, boxes))
+
+        yield event({"type": "summary", **text_response(extracted_text, confidence_scores, paragraphs, boxes)})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/extract-text/batch")
+async def extract_text_batch(files: List[UploadFile] = File(...), profile: str = DEFAULT_PROFILE):
+    """
+    OCR de varias imágenes, o de un zip con imágenes, en una sola petición.
+    Responde en NDJSON una línea por imagen, en el orden de subida, en cuanto
+    cada una termina.
+    """
+    check_profile(profile)
+    if not models.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Los modelos de OCR se están cargando, inténtalo de nuevo en unos segundos",
+            headers={"Retry-After": "5"},
+        )
+
+    # (nombre, tipo, lector de bytes): las entradas de los zip se descomprimen al procesarlas
+    items = []
+    archives = []
+    try:
+        for file in files:
+            contents = await read_upload(file)
+            if is_archive(file.content_type, contents):
+                archive, names = open_archive(contents)
+                archives.append(archive)
+                archive_lock = threading.Lock()
+                for name in names:
+                    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                    items.append((name, content_type, partial(read_member, archive, name, archive_lock)))
+            elif file.content_type.startswith('image/') or file.content_type == 'application/pdf':
+                items.append((file.filename, file.content_type, lambda data=contents: data))
+            else:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{file.filename}: el archivo debe ser una imagen, un PDF o un zip",
+                )
+            if len(items) > MAX_BATCH_FILES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"El lote tiene más de {MAX_BATCH_FILES} imágenes",
+                )
+    except UnsupportedDocument as e:
+        for archive in archives:
+            archive.close()
+        raise HTTPException(status_code=415, detail=str(e))
+    except HTTPException:
+        for archive in archives:
+            archive.close()
+        raise
+
+    def event(payload):
+        return json.dumps(payload, ensure_ascii=False) + "\n"
+
+    async def process(index):
+        name, content_type, read = items[index]
+        # Una entrada de un zip puede ocupar decenas de MB descomprimida: se
+        # descomprime en un hilo para no bloquear el event loop
+        return await batch_item_ocr(await asyncio.to_thread(read), content_type, profile)
+
+    async def events():
+        started = time.perf_counter()
+        # Imágenes en curso a la vez: mientras una se reconoce, la siguiente se
+        # decodifica y preprocesa, y la anterior se serializa en el event loop
+        window = max(2, ocr_pool.max_workers)
+        pending = deque()
+        next_index = 0
+        failed = 0
+        try:
+            while next_index < len(items) or pending:
+                while next_index < len(items) and len(pending) < window:
+                    pending.append(asyncio.ensure_future(process(next_index)))
+                    next_index += 1
+                index = next_index - len(pending)
+                name = items[index][0]
+                try:
+                    result = await pending.popleft()
+                except Exception as e:
+                    failed += 1
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    yield event({"type": "error", "index": index, "filename": name,
+                                 "detail": f"Error procesando la imagen: {detail}"})
+                    continue
+                yield event({"type": "result", "index": index, "filename": name, **result})
+        finally:
+            for task in pending:
+                task.cancel()
+            for archive in archives:
+                archive.close()
+
+        yield event({
+            "type": "summary",
+            "total": len(items),
+            "succeeded": len(items) - failed,
+            "failed": failed,
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @app.post("/create-word-document/")
-async def create_word_document(text: str, title: str = "Documento OCR"):
+async def create_word_document(text: str, title: str = "Documento OCR", download: bool = False):
     """
-    Crea un documento Word con el texto extraído
+    Crea un documento Word con el texto extraído. Con download=true el
+    documento se devuelve en la respuesta en lugar de guardarse
     """
     try:
-        # Crear un nuevo documento
-        doc = Document()
-        
-        # Agregar título
-        doc.add_heading(title, 0)
-        
-        # Agregar información de metadatos
-        doc.add_heading('Texto extraído por OCR', level=1)
-        
-        # Agregar el texto
-        paragraph = doc.add_paragraph(text)
-        
-        # Generar nombre único para el archivo
-        filename = f"documento_{uuid.uuid4().hex[:8]}.docx"
-        filepath = os.path.join("output", filename)
-        
-        # Guardar el documento
-        doc.save(filepath)
+        with stage_seconds.time(stage="docx"):
+            document = docx_template.render(word_paragraphs(title, split_paragraphs(text)), title=title)
+            if download:
+                return docx_response(document, "documento.docx")
+            filename = await asyncio.to_thread(save_document, document)
         
         return {
             "message": "Documento creado exitosamente",
@@ -143,69 +1362,172 @@ async def download_file(filename: str):
     """
     Descarga un documento Word generado
     """
-    filepath = os.path.join("output", filename)
-    
-    if not os.path.exists(filepath):
+    try:
+        document, size = await asyncio.to_thread(document_store.open, filename)
+    except DocumentNotFound:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
     
-    return FileResponse(
-        path=filepath,
-        filename=filename,
-        media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    return StreamingResponse(
+        iter_file(document),
+        media_type=DOCX_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Content-Length": str(size)},
+    )
+
+def job_view(job):
+    """
+    Campos públicos de un trabajo
+    """
+    view = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "attempts": job["attempts"],
+        "max_attempts": job["max_attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+    if job["result"] is not None:
+        view["result"] = job["result"]
+    if job["error"]:
+        view["error"] = job["error"]
+    return view
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    priority: str = Form("normal"),
+    profile: str = Form(DEFAULT_PROFILE),
+    engine: str = Form(OCR_ENGINE),
+    cheap_engine: str = Form(CASCADE_CHEAP_ENGINE),
+    escalate_below: float = Form(CASCADE_ESCALATE_BELOW),
+):
+    """
+    Encola un trabajo de OCR y devuelve su id sin esperar al resultado.
+    Responde 503 si ningún worker atiende la cola (ver jobs_served)
+    """
+    if not jobs_served():
+        raise HTTPException(status_code=503, detail="La cola de trabajos no está atendida por ningún worker")
+    if not (file.content_type.startswith('image/') or file.content_type == 'application/pdf'):
+        raise HTTPException(status_code=400, detail="El archivo debe ser una imagen o un PDF")
+    if priority not in PRIORITIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Prioridad no válida. Opciones: {', '.join(PRIORITIES)}",
+        )
+    check_profile(profile)
+    cascade = check_engine(engine, cheap_engine, escalate_below)
+
+    contents = await read_upload(file)
+    # Las imágenes demasiado grandes o que no se pueden abrir se rechazan ya,
+    # no cuando las coja un worker
+    kind = document_kind(file.content_type, contents)
+    upload_pixels(contents, kind)
+    if kind is None:
+        if image_size(contents) is None:
+            raise HTTPException(status_code=400, detail="El archivo no es una imagen válida")
+    else:
+        try:
+            await asyncio.to_thread(page_count, contents, kind)
+        except UnsupportedDocument as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        except Exception:
+            raise HTTPException(status_code=400, detail="El archivo no es un PDF o TIFF válido")
+    job_id = job_store.submit(
+        contents,
+        params={"profile": profile, "cascade": cascade._asdict() if cascade is not None else None},
+        priority=PRIORITIES[priority],
+        max_attempts=JOB_MAX_ATTEMPTS,
+        content_type=file.content_type,
     )
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Estado de un trabajo y, cuando termina, su resultado
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job_view(job)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancela un trabajo en cola o en ejecución
+    """
+    job = job_store.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job_view(job)
+
+@app.get("/metrics/jobs")
+async def jobs_metrics():
+    """
+    Trabajos por estado y procesos worker activos
+    """
+    return {"jobs": job_store.stats(), "workers": job_workers.stats()}
 
 @app.post("/process-image-to-word/")
 async def process_image_to_word(
     file: UploadFile = File(...),
-    title: str = "Documento OCR"
+    title: str = "Documento OCR",
+    profile: str = DEFAULT_PROFILE,
+    download: bool = False,
+    engine: str = OCR_ENGINE,
+    cheap_engine: str = CASCADE_CHEAP_ENGINE,
+    escalate_below: float = CASCADE_ESCALATE_BELOW,
+    backend: str = OCR_BACKEND,
 ):
     """
-    Procesa una imagen completa: extrae texto y crea documento Word
+    Procesa una imagen completa: extrae texto y crea documento Word. Con
+    download=true se devuelve el documento directamente
     """
     try:
+        check_profile(profile)
+        cascade = check_engine(engine, cheap_engine, escalate_below)
+        check_backend(backend)
+
         # Extraer texto
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        image_array = np.array(image)
-        processed_image = preprocess_image(image_array)
+        contents = await read_upload(file, mappable=True)
+        result = await routed_ocr(contents, backend, profile, cascade)
+        extracted_text, _, paragraphs, _ = result_texts(result)
         
-        results = reader.readtext(processed_image)
+        text = full_text(extracted_text, paragraphs)
         
-        extracted_text = []
-        for (bbox, text, confidence) in results:
-            if confidence > 0.3:
-                extracted_text.append(text)
-        
-        full_text = " ".join(extracted_text)
-        
-        if not full_text.strip():
+        if not text.strip():
             raise HTTPException(status_code=400, detail="No se pudo extraer texto de la imagen")
         
-        # Crear documento Word
-        doc = Document()
-        doc.add_heading(title, 0)
-        doc.add_heading('Texto extraído por OCR', level=1)
-        doc.add_paragraph(full_text)
-        
-        # Agregar información adicional
-        doc.add_paragraph(f"\nNúmero de palabras detectadas: {len(extracted_text)}")
-        doc.add_paragraph(f"Procesado con EasyOCR")
-        
-        filename = f"documento_{uuid.uuid4().hex[:8]}.docx"
-        filepath = os.path.join("output", filename)
-        doc.save(filepath)
+        # Crear documento Word, con un párrafo por cada párrafo reconstruido
+        with stage_seconds.time(stage="docx"):
+            document = docx_template.render(word_paragraphs(
+                title, [paragraph_text(paragraph) for paragraph in paragraphs] if paragraphs is not None else [text],
+                f"\nNúmero de palabras detectadas: {len(extracted_text)}",
+                f"Procesado con {processed_with(result.engine, cascade)}",
+            ), title=title)
+            if download:
+                return docx_response(document, "documento.docx", {"X-OCR-Word-Count": str(len(extracted_text))})
+            filename = await asyncio.to_thread(save_document, document)
         
         return {
-            "text": full_text,
+            "text": text,
             "word_count": len(extracted_text),
+            "backend": result.engine,
             "filename": filename,
             "download_url": f"/download/{filename}",
             "message": "Procesamiento completado exitosamente"
         }
         
+    except HTTPException:
+        raise
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en el procesamiento: {str(e)}")
 
 if __name__ == "__main__":
     import uvicorn
+    # Un solo proceso: atiende también la cola de trabajos
+    job_workers.processes = int(os.getenv("OCR_JOB_WORKERS", "1"))
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,63 @@
+"""
+Uso de memoria por proceso (RSS, PSS, compartida y privada).
+
+Con varios workers que comparten los pesos de los modelos por copy-on-write
+el RSS de cada uno cuenta las páginas compartidas; el PSS las reparte entre
+los procesos y es la cifra útil para saber cuántos workers caben en un nodo.
+"""
+import os
+import resource
+import sys
+
+_SMAPS_FIELDS = {
+    "Rss": "rss_bytes",
+    "Pss": "pss_bytes",
+    "Shared_Clean": "shared_clean_bytes",
+    "Shared_Dirty": "shared_dirty_bytes",
+    "Private_Clean": "private_clean_bytes",
+    "Private_Dirty": "private_dirty_bytes",
+}
+
+
+def process_memory(pid=None):
+    """
+    Memoria de un proceso leída de /proc/<pid>/smaps_rollup (Linux).
+    En otros sistemas solo se devuelve el RSS máximo del proceso actual.
+    """
+    path = f"/proc/{pid or 'self'}/smaps_rollup"
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except OSError:
+        if pid not in (None, os.getpid()):
+            return {}
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"max_rss_bytes": maxrss if sys.platform == "darwin" else maxrss * 1024}
+
+    stats = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].rstrip(":") in _SMAPS_FIELDS:
+            stats[_SMAPS_FIELDS[parts[0].rstrip(":")]] = int(parts[1]) * 1024
+    if stats:
+        stats["shared_bytes"] = stats.get("shared_clean_bytes", 0) + stats.get("shared_dirty_bytes", 0)
+        stats["private_bytes"] = stats.get("private_clean_bytes", 0) + stats.get("private_dirty_bytes", 0)
+    return stats
+
+
+def peak_rss(pid=None):
+    """
+    RSS máximo que ha alcanzado un proceso (VmHWM), en bytes
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid in (None, os.getpid()):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+    return None
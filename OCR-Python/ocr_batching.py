@@ -0,0 +1,215 @@
+"""
+Micro-batching del reconocimiento de EasyOCR entre peticiones concurrentes
+"""
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _RecognitionJob:
+    """
+    Recortes de texto de una petición pendientes de reconocer
+    """
+
+    def __init__(self, image_list, ignore_char):
+        self.image_list = image_list
+        self.ignore_char = ignore_char
+        self.future = Future()
+
+
+class RecognitionBatcher:
+    """
+    Agrupa los recortes detectados por varias peticiones y los pasa por el
+    reconocedor en un único lote.
+
+    Un hilo dedicado espera como mucho `window_ms` desde la llegada del
+    primer trabajo, o hasta juntar `max_batch` recortes, antes de lanzar la
+    inferencia. Cada llamante recibe solo los resultados de sus recortes,
+    en el mismo formato que `reader.readtext`.
+    """
+
+    def __init__(self, get_reader, window_ms=15, max_batch=32):
+        # Se recibe una función y no el reader para no depender de que los
+        # modelos estén cargados al crear el batcher
+        self.get_reader = get_reader
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._jobs = 0
+        self._crops = 0
+        self._inference_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, get_reader):
+        """
+        Devuelve el batcher configurado con OCR_BATCH_WINDOW_MS y
+        OCR_BATCH_MAX_SIZE, o None si OCR_BATCHING=0
+        """
+        if os.getenv("OCR_BATCHING", "1") == "0":
+            return None
+        return cls(
+            get_reader,
+            window_ms=float(os.getenv("OCR_BATCH_WINDOW_MS", "15")),
+            max_batch=int(os.getenv("OCR_BATCH_MAX_SIZE", "32")),
+        )
+
+    def _ensure_started(self):
+        # Tras un fork el hilo no existe en el proceso hijo: se arranca de nuevo
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._loop, name="ocr-batcher", daemon=True
+            )
+            self._thread.start()
+
+    def recognize(self, img_cv_grey, horizontal_list, free_list, allowlist=None):
+        """
+        Reconoce las cajas detectadas en una imagen en escala de grises.
+        Bloquea al llamante hasta que su lote termina.
+        """
+        from easyocr.config import imgH
+        from easyocr.utils import get_image_list
+
+        image_list, _ = get_image_list(
+            horizontal_list, free_list, img_cv_grey, model_height=imgH
+        )
+        if not image_list:
+            return []
+
+        reader = self.get_reader()
+        if allowlist:
+            ignore_char = "".join(set(reader.character) - set(allowlist))
+        else:
+            ignore_char = "".join(set(reader.character) - set(reader.lang_char))
+
+        job = _RecognitionJob(image_list, ignore_char)
+        self._ensure_started()
+        self._queue.put(job)
+        return job.future.result()
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            crops = len(first.image_list)
+            deadline = time.monotonic() + self.window
+            stop = False
+            while crops < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+                crops += len(job.image_list)
+
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch):
+        # Los trabajos con distinta lista de caracteres ignorados no pueden
+        # compartir la decodificación, así que se agrupan por ese valor
+        groups = {}
+        for job in batch:
+            groups.setdefault(job.ignore_char, []).append(job)
+
+        started = time.perf_counter()
+        for ignore_char, jobs in groups.items():
+            try:
+                results = self._recognize_crops(
+                    [item for job in jobs for item in job.image_list], ignore_char
+                )
+            except Exception as e:
+                for job in jobs:
+                    job.future.set_exception(e)
+                continue
+
+            offset = 0
+            for job in jobs:
+                size = len(job.image_list)
+                job.future.set_result(
+                    [tuple(item) for item in results[offset:offset + size]]
+                )
+                offset += size
+
+        with self._stats_lock:
+            self._batches += 1
+            self._jobs += len(batch)
+            self._crops += sum(len(job.image_list) for job in batch)
+            self._inference_seconds += time.perf_counter() - started
+
+    def _recognize_crops(self, image_list, ignore_char):
+        """
+        Pasa los recortes por el reconocedor agrupándolos por anchura, para
+        no rellenar recortes estrechos hasta el ancho del más largo
+        """
+        from easyocr.config import imgH
+        from easyocr.recognition import get_text
+
+        reader = self.get_reader()
+        widths = [
+            max(math.ceil(crop.shape[1] / imgH), 1) * imgH for _, crop in image_list
+        ]
+        order = sorted(range(len(image_list)), key=lambda i: widths[i])
+
+        results = [None] * len(image_list)
+        start = 0
+        while start < len(order):
+            end = start + 1
+            # Un grupo no mezcla recortes con más del doble de diferencia de ancho
+            while (
+                end < len(order)
+                and end - start < self.max_batch
+                and widths[order[end]] <= 2 * widths[order[start]]
+            ):
+                end += 1
+            indices = order[start:end]
+            group = get_text(
+                reader.character, imgH, widths[indices[-1]],
+                reader.recognizer, reader.converter,
+                [image_list[i] for i in indices],
+                ignore_char, batch_size=len(indices), workers=0, device=reader.device,
+            )
+            for i, item in zip(indices, group):
+                results[i] = item
+            start = end
+        return results
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                "window_ms": self.window * 1000.0,
+                "max_batch": self.max_batch,
+                "batches": batches,
+                "jobs": self._jobs,
+                "crops": self._crops,
+                "avg_jobs_per_batch": self._jobs / batches if batches else 0.0,
+                "avg_crops_per_batch": self._crops / batches if batches else 0.0,
+                "inference_seconds": self._inference_seconds,
+            }
+
+    def shutdown(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
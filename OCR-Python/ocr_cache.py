@@ -0,0 +1,151 @@
+"""
+Caché de resultados de OCR direccionada por contenido.
+
+La clave es un hash de los bytes subidos más los parámetros del pipeline
+(preprocesado, idiomas, umbral de confianza...), de modo que un reenvío de
+la misma foto no vuelve a decodificar, preprocesar ni ejecutar inferencia.
+
+Tiene dos niveles: un LRU en memoria limitado por bytes y, opcionalmente,
+una base SQLite en disco que sobrevive a reinicios.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(contents, **params):
+    """
+    Clave de caché: sha256 de los bytes + parámetros del pipeline ordenados
+    """
+    digest = hashlib.sha256(contents)
+    digest.update(b"\0")
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class OCRResultCache:
+    """
+    LRU en memoria con presupuesto en bytes y nivel SQLite opcional.
+    Los valores deben ser serializables a JSON.
+    """
+
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, db_path=None):
+        self.max_memory_bytes = max_memory_bytes
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        self.db_path = db_path
+        self._db = None
+        self._db_pid = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._connection()
+
+    def _connection(self):
+        """
+        Conexión SQLite del proceso actual. Una conexión no puede cruzar un
+        fork, así que cada worker abre la suya.
+        """
+        if not self.db_path:
+            return None
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db_pid = os.getpid()
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    @classmethod
+    def from_env(cls, default_db_path=None):
+        """
+        Configura la caché con OCR_CACHE_MEMORY_MB y OCR_CACHE_DB
+        """
+        return cls(
+            max_memory_bytes=int(float(os.getenv("OCR_CACHE_MEMORY_MB", "64")) * 1024 * 1024),
+            db_path=os.getenv("OCR_CACHE_DB", default_db_path) or None,
+        )
+
+    def get(self, key):
+        """
+        Devuelve el resultado almacenado o None
+        """
+        with self._lock:
+            raw = self._entries.get(key)
+            if raw is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return json.loads(raw)
+
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    "SELECT value FROM ocr_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._disk_hits += 1
+                    self._store_memory(key, bytes(row[0]))
+                    return json.loads(row[0])
+
+            self._misses += 1
+            return None
+
+    def put(self, key, value):
+        raw = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._store_memory(key, raw)
+            db = self._connection()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO ocr_cache (key, value, created) VALUES (?, ?, ?)",
+                    (key, raw, time.time()),
+                )
+                db.commit()
+
+    def _store_memory(self, key, raw):
+        # Las entradas mayores que todo el presupuesto solo van a disco
+        if len(raw) > self.max_memory_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._entries[key] = raw
+        self._memory_bytes += len(raw)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_ratio": (self._hits + self._disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "evictions": self._evictions,
+                "disk_enabled": bool(self.db_path),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None and self._db_pid == os.getpid():
+                self._db.close()
+            self._db = None
+            self.db_path = None
@@ -0,0 +1,172 @@
+"""
+Cascada de dos motores de OCR.
+
+Un motor barato lee primero la imagen entera y solo las regiones con
+confianza por debajo de `escalate_below` pasan al reconocedor de EasyOCR:
+
+- tesseract: pytesseract (image_to_data) agrupado por líneas; muy rápido en
+  texto impreso con buena luz.
+- easyocr-lite: EasyOCR sobre la imagen a la mitad de resolución, con un
+  cuarto de los píxeles para el detector.
+
+Si el motor barato no encuentra nada (manuscrito, fotos difíciles) la
+imagen se procesa entera con EasyOCR. Las funciones de lectura las pone
+quien llama; aquí solo se decide qué se escala y se cuentan los resultados.
+"""
+import shutil
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+ENGINES = ("easyocr", "cascade")
+CHEAP_ENGINES = ("tesseract", "easyocr-lite")
+
+# Códigos de idioma de EasyOCR -> Tesseract
+TESSERACT_LANGUAGES = {"es": "spa", "en": "eng", "fr": "fra", "de": "deu", "it": "ita", "pt": "por"}
+
+# Margen que se añade a las líneas de Tesseract antes de reconocerlas con
+# EasyOCR, igual que el add_margin por defecto de su detector
+_LINE_MARGIN = 0.1
+
+
+class EngineUnavailable(Exception):
+    """
+    El motor pedido no está instalado
+    """
+
+
+class CascadeOptions(namedtuple("CascadeOptions", "cheap escalate_below")):
+    """
+    Motor barato y confianza por debajo de la cual una región se escala
+    """
+
+    @property
+    def cache_params(self):
+        return {"cheap": self.cheap, "escalate_below": self.escalate_below}
+
+
+@lru_cache(maxsize=None)
+def tesseract_available():
+    """
+    pytesseract instalado y el ejecutable de tesseract en el PATH
+    """
+    try:
+        import pytesseract
+    except ImportError:
+        return False
+    return shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
+
+def available_cheap_engines():
+    return tuple(engine for engine in CHEAP_ENGINES if engine != "tesseract" or tesseract_available())
+
+
+def tesseract_read(image, languages, config="--psm 3"):
+    """
+    Líneas leídas por Tesseract con el formato de readtext: (caja de cuatro
+    puntos, texto, confianza 0-1). La confianza de una línea es la de su
+    peor palabra.
+    """
+    try:
+        import pytesseract
+    except ImportError:
+        raise EngineUnavailable("Para usar Tesseract es necesario instalar pytesseract")
+
+    lang = "+".join(TESSERACT_LANGUAGES.get(language, language) for language in languages)
+    try:
+        data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+    except pytesseract.TesseractNotFoundError:
+        raise EngineUnavailable("No se encuentra el ejecutable de tesseract")
+
+    lines = {}
+    for index, text in enumerate(data["text"]):
+        confidence = float(data["conf"][index])
+        if confidence < 0 or not text.strip():
+            continue
+        key = (data["block_num"][index], data["par_num"][index], data["line_num"][index])
+        lines.setdefault(key, []).append((
+            data["left"][index], data["top"][index],
+            data["left"][index] + data["width"][index], data["top"][index] + data["height"][index],
+            text.strip(), confidence / 100.0,
+        ))
+
+    results = []
+    for words in lines.values():
+        x0 = min(word[0] for word in words)
+        y0 = min(word[1] for word in words)
+        x1 = max(word[2] for word in words)
+        y1 = max(word[3] for word in words)
+        results.append((
+            [[x0, y0], [x1, y0], [x1, y1], [x0, y1]],
+            " ".join(word[4] for word in words),
+            min(word[5] for word in words),
+        ))
+    return results
+
+
+def _region(bbox, width, height):
+    """
+    Caja horizontal [x_min, x_max, y_min, y_max] con margen a partir de cuatro puntos
+    """
+    xs = [point[0] for point in bbox]
+    ys = [point[1] for point in bbox]
+    margin = int(_LINE_MARGIN * (max(ys) - min(ys)))
+    return [
+        max(0, int(min(xs)) - margin), min(width, int(max(xs)) + margin),
+        max(0, int(min(ys)) - margin), min(height, int(max(ys)) + margin),
+    ]
+
+
+def run_cascade(image, options, cheap_read, recognize, full_read):
+    """
+    - cheap_read(imagen) -> resultados del motor barato
+    - recognize(imagen, horizontal_list) -> resultados de EasyOCR para esas cajas
+    - full_read(imagen) -> resultados de EasyOCR sobre la imagen entera
+
+    Devuelve (resultados, informe) con el número de regiones, las escaladas
+    y si se recurrió a la imagen entera
+    """
+    first = cheap_read(image)
+    if not first:
+        return full_read(image), {"regions": 0, "escalated": 0, "fallback": True}
+
+    height, width = image.shape[:2]
+    accepted = [result for result in first if result[2] >= options.escalate_below]
+    doubtful = [result for result in first if result[2] < options.escalate_below]
+    results = accepted
+    if doubtful:
+        results = accepted + list(recognize(image, [_region(bbox, width, height) for bbox, _, _ in doubtful]))
+        # Orden de lectura aproximado, como readtext
+        results.sort(key=lambda result: (min(point[1] for point in result[0]), min(point[0] for point in result[0])))
+    return results, {"regions": len(first), "escalated": len(doubtful), "fallback": False}
+
+
+class CascadeStats:
+    """
+    Regiones leídas por el motor barato, escaladas y recursos a la imagen entera
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._regions = 0
+        self._escalated = 0
+        self._fallbacks = 0
+
+    def record(self, report):
+        with self._lock:
+            self._requests += 1
+            self._regions += report["regions"]
+            self._escalated += report["escalated"]
+            self._fallbacks += int(report["fallback"])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "regions": self._regions,
+                "escalated": self._escalated,
+                "fallbacks": self._fallbacks,
+                "escalation_rate": self._escalated / self._regions if self._regions else 0.0,
+                "fallback_rate": self._fallbacks / self._requests if self._requests else 0.0,
+            }
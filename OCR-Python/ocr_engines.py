@@ -0,0 +1,399 @@
+"""
+Motores de OCR intercambiables y router entre ellos.
+
+Cada motor (EasyOCR, Tesseract, Textract) implementa OCREngine: read()
+devuelve un OCRResult con las líneas leídas (caja, texto, confianza 0-1) y
+lo que ha tardado, y available()/busy() le dicen al router si puede
+atender. EngineRouter elige el motor de cada petición:
+
+- el que pide el cliente o, con "auto", el de las imágenes grandes si la
+  imagen pasa de `large_pixels` y si no el primero de la lista;
+- los motores saturados pasan detrás de los libres y los no disponibles
+  (sin instalar, modelos cargando) solo se intentan como último recurso;
+- si un motor responde EngineBusy o EngineUnavailable se prueba el
+  siguiente; si fallan todos, se responde que están saturados. Con
+  EngineInputError (el motor rechaza la imagen) no se prueba ningún otro.
+
+TextractEngine llama a detect_document_text con el cliente de boto3 o con
+cualquier objeto con la misma interfaz (fake_textract.StubTextractClient
+en pruebas); EasyOCR y Tesseract los pone la API con FunctionEngine.
+"""
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from image_decode import ImageDecodeError, image_size
+from layout import textract_bounds
+from ocr_cache import make_cache_key
+from ocr_cascade import EngineUnavailable
+
+# Motores que conoce la API y valor para dejar la elección al router
+BACKENDS = ("easyocr", "tesseract", "textract")
+AUTO = "auto"
+
+# Una línea leída: caja de cuatro puntos [[x, y], ...] en píxeles de la
+# imagen subida (None si el motor no la conserva), texto y confianza 0-1
+OCRLine = namedtuple("OCRLine", "box text confidence")
+
+# Resultado de un motor: las líneas (en orden de lectura si trae párrafos),
+# los párrafos si el motor ya ha hecho la maquetación y los segundos por etapa
+OCRResult = namedtuple("OCRResult", "engine lines paragraphs timings")
+
+# Códigos de error de Textract que indican saturación y no un fallo
+_THROTTLING_ERRORS = {
+    "ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException",
+}
+
+# Códigos de error de Textract por la imagen y no por el servicio, con el
+# estado HTTP con que los devuelve la API
+_INPUT_ERRORS = {
+    "InvalidImageFormatException": 400, "UnsupportedDocumentException": 400, "BadDocumentException": 400,
+    "InvalidParameterException": 400, "DocumentTooLargeException": 413,
+}
+
+
+class EngineBusy(Exception):
+    """
+    El motor está saturado; otro puede atender la petición o se reintenta más tarde
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class EngineInputError(Exception):
+    """
+    El motor rechaza la imagen (formato, documento dañado, tamaño); no se
+    reintenta con otro motor y la API la devuelve con `status_code`
+    """
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OCREngine(ABC):
+    """
+    Interfaz común de los motores; las subclases implementan read()
+    """
+
+    name = None
+
+    def available(self):
+        """
+        El motor está instalado y listo
+        """
+        return True
+
+    def busy(self):
+        """
+        Una petición más tendría que esperar turno o se rechazaría
+        """
+        return False
+
+    @abstractmethod
+    async def read(self, contents, **options):
+        """
+        OCRResult de los bytes de una imagen; lanza EngineBusy o EngineUnavailable
+        para que el router pase al siguiente motor
+        """
+
+
+class FunctionEngine(OCREngine):
+    """
+    Motor a partir de funciones: la lectura (asíncrona) y, opcionalmente,
+    las comprobaciones de disponibilidad y saturación
+    """
+
+    def __init__(self, name, read, available=None, busy=None):
+        self.name = name
+        self._read = read
+        self._available = available
+        self._busy = busy
+
+    def available(self):
+        return self._available is None or self._available()
+
+    def busy(self):
+        return self._busy is not None and self._busy()
+
+    async def read(self, contents, **options):
+        return await self._read(contents, **options)
+
+
+class CachedEngine(OCREngine):
+    """
+    Caché de resultados delante de un motor. La clave son los bytes, el
+    nombre del motor y lo que devuelva params(**options)
+    """
+
+    def __init__(self, engine, cache, params):
+        self.engine = engine
+        self.name = engine.name
+        self.cache = cache
+        self.params = params
+
+    def available(self):
+        return self.engine.available()
+
+    def busy(self):
+        return self.engine.busy()
+
+    async def read(self, contents, **options):
+        key = make_cache_key(contents, engine=self.name, **self.params(**options))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return OCRResult(self.name, [OCRLine(*line) for line in cached["lines"]], cached["paragraphs"], {})
+        result = await self.engine.read(contents, **options)
+        self.cache.put(key, {"lines": [list(line) for line in result.lines], "paragraphs": result.paragraphs})
+        return result
+
+
+def textract_lines(response, size=None):
+    """
+    Líneas de una respuesta de detect_document_text en el orden de Textract;
+    las cajas, en píxeles si se conoce el tamaño (ancho, alto) de la imagen
+    """
+    width, height = size or (1, 1)
+    lines = []
+    for block in response["Blocks"]:
+        if block["BlockType"] != "LINE":
+            continue
+        bounds = textract_bounds(block)
+        box = None
+        if bounds is not None:
+            x0, y0, x1, y1 = bounds[0] * width, bounds[1] * height, bounds[2] * width, bounds[3] * height
+            box = [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+        lines.append(OCRLine(box, block["Text"], block.get("Confidence", 0.0) / 100.0))
+    return lines
+
+
+class TextractEngine(OCREngine):
+    """
+    AWS Textract (detect_document_text) con los bytes de la imagen, sin S3.
+
+    Las llamadas van en hilos propios, fuera del event loop y del pool de
+    OCR, como mucho `max_in_flight` a la vez. Los errores de cuota de
+    Textract se señalan con EngineBusy, las imágenes que Textract rechaza
+    con EngineInputError y el resto (credenciales, red, errores 5xx) con
+    EngineUnavailable.
+    """
+
+    name = "textract"
+    # Tamaño máximo de Document.Bytes en las operaciones síncronas
+    MAX_BYTES = 10 * 2**20
+
+    def __init__(self, client=None, region=None, endpoint_url=None, max_in_flight=10,
+                 connect_timeout=2.0, read_timeout=20.0, max_attempts=2):
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self.max_in_flight = max_in_flight
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max_attempts
+        self._client = client
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="textract")
+
+    @classmethod
+    def from_env(cls):
+        """
+        Mismas variables TEXTRACT_* que la Lambda; TEXTRACT_ENDPOINT_URL apunta
+        a un Textract local (fake_textract.FakeTextractServer)
+        """
+        return cls(
+            region=os.getenv("TEXTRACT_REGION", "us-east-1"),
+            endpoint_url=os.getenv("TEXTRACT_ENDPOINT_URL") or None,
+            max_in_flight=int(os.getenv("TEXTRACT_MAX_CONNECTIONS", "10")),
+            connect_timeout=float(os.getenv("TEXTRACT_CONNECT_TIMEOUT", "2")),
+            read_timeout=float(os.getenv("TEXTRACT_READ_TIMEOUT", "20")),
+            max_attempts=int(os.getenv("TEXTRACT_MAX_ATTEMPTS", "2")),
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    try:
+                        import boto3
+                        from botocore.config import Config
+                    except ImportError:
+                        raise EngineUnavailable("Para usar Textract es necesario instalar boto3")
+                    self._client = boto3.client("textract", endpoint_url=self.endpoint_url, config=Config(
+                        region_name=self.region,
+                        max_pool_connections=self.max_in_flight,
+                        connect_timeout=self.connect_timeout,
+                        read_timeout=self.read_timeout,
+                        # Pocos reintentos: si Textract no responde, mejor otro motor
+                        retries={"max_attempts": self.max_attempts, "mode": "standard"},
+                    ))
+        return self._client
+
+    def set_client(self, client):
+        """
+        Sustituye el cliente (p.ej. por fake_textract.StubTextractClient en
+        pruebas). Con None se vuelve a crear el de boto3 en la siguiente llamada
+        """
+        self._client = client
+
+    def available(self):
+        return self._client is not None or importlib.util.find_spec("boto3") is not None
+
+    def busy(self):
+        with self._lock:
+            return self._in_flight >= self.max_in_flight
+
+    async def read(self, contents, **options):
+        if len(contents) > self.MAX_BYTES:
+            raise EngineUnavailable(f"Textract no acepta imágenes de más de {self.MAX_BYTES // 2**20} MB")
+        with self._lock:
+            self._in_flight += 1
+        try:
+            started = time.perf_counter()
+            response = await asyncio.get_running_loop().run_in_executor(self._executor, self._detect, bytes(contents))
+            seconds = time.perf_counter() - started
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        try:
+            size = image_size(contents)
+        except ImageDecodeError:
+            size = None
+        return OCRResult(self.name, textract_lines(response, size), None, {"textract": seconds})
+
+    def _detect(self, contents):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            return self.client.detect_document_text(Document={"Bytes": contents})
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code in _THROTTLING_ERRORS:
+                raise EngineBusy(f"Textract saturado ({code})", retry_after=1)
+            if code in _INPUT_ERRORS:
+                message = e.response.get("Error", {}).get("Message") or code
+                raise EngineInputError(f"Textract rechaza la imagen: {message}", _INPUT_ERRORS[code])
+            raise EngineUnavailable(f"Error de Textract: {e}")
+        except BotoCoreError as e:
+            raise EngineUnavailable(f"Textract no responde: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self._in_flight, "max_in_flight": self.max_in_flight}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class EngineRouter:
+    """
+    Elige el motor de cada petición entre `engines` (en orden de respaldo)
+    y pasa al siguiente si el elegido está saturado o caído.
+
+    - default: motor por defecto o AUTO
+    - large_engine, large_pixels: con AUTO, motor para las imágenes de más
+      de large_pixels (p.ej. textract, para no ocupar el pool local)
+    """
+
+    def __init__(self, engines, default=AUTO, large_engine=None, large_pixels=None):
+        self.engines = OrderedDict((engine.name, engine) for engine in engines)
+        if not self.engines:
+            raise ValueError("El router necesita al menos un motor")
+        if default != AUTO and default not in self.engines:
+            raise ValueError(f"El motor por defecto {default} no está entre los habilitados")
+        self.default = default
+        self.large_engine = large_engine
+        self.large_pixels = large_pixels
+        self._lock = threading.Lock()
+        self._served = {name: 0 for name in self.engines}
+        self._failed_over = {name: 0 for name in self.engines}
+
+    @classmethod
+    def from_env(cls, engines):
+        """
+        De `engines` (nombre -> motor): OCR_BACKENDS, los habilitados en orden
+        de respaldo (por defecto, solo el primero); OCR_BACKEND, el motor por
+        defecto o auto; OCR_LARGE_IMAGE_BACKEND y OCR_LARGE_IMAGE_MEGAPIXELS
+        """
+        names = [
+            name.strip() for name in os.getenv("OCR_BACKENDS", next(iter(engines))).split(",") if name.strip()
+        ]
+        unknown = [name for name in names if name not in engines]
+        if unknown:
+            raise ValueError(f"Motores desconocidos en OCR_BACKENDS: {', '.join(unknown)}")
+        return cls(
+            [engines[name] for name in names],
+            default=os.getenv("OCR_BACKEND", names[0]),
+            large_engine=os.getenv("OCR_LARGE_IMAGE_BACKEND") or None,
+            large_pixels=int(float(os.getenv("OCR_LARGE_IMAGE_MEGAPIXELS", "24")) * 1_000_000),
+        )
+
+    @property
+    def choices(self):
+        return (AUTO, *self.engines)
+
+    def candidates(self, hint=None, pixels=None):
+        """
+        Motores en el orden en que se intentan para una petición
+        """
+        preferred = hint or self.default
+        if preferred == AUTO:
+            preferred = next(iter(self.engines))
+            if self.large_engine in self.engines and pixels is not None and pixels > self.large_pixels:
+                preferred = self.large_engine
+        engines = [self.engines[preferred]] + [engine for name, engine in self.engines.items() if name != preferred]
+        ready = [engine for engine in engines if engine.available()]
+        idle = [engine for engine in ready if not engine.busy()]
+        return (
+            idle
+            + [engine for engine in ready if engine not in idle]
+            + [engine for engine in engines if engine not in ready]
+        )
+
+    async def read(self, contents, hint=None, pixels=None, **options):
+        """
+        OCRResult del primer motor que lo consigue, con el tiempo total en
+        timings["total"]. Si fallan todos se propaga el primer EngineBusy,
+        con su Retry-After, o si no el error del último
+        """
+        started = time.perf_counter()
+        busy = error = None
+        for engine in self.candidates(hint, pixels):
+            try:
+                result = await engine.read(contents, **options)
+            except (EngineBusy, EngineUnavailable) as e:
+                with self._lock:
+                    self._failed_over[engine.name] += 1
+                if busy is None and isinstance(e, EngineBusy):
+                    busy = e
+                error = e
+                continue
+            with self._lock:
+                self._served[engine.name] += 1
+            return result._replace(timings={**result.timings, "total": time.perf_counter() - started})
+        raise busy or error
+
+    def stats(self):
+        with self._lock:
+            return {
+                "default": self.default,
+                "large_engine": self.large_engine,
+                "large_pixels": self.large_pixels,
+                "engines": {
+                    name: {
+                        "available": engine.available(),
+                        "busy": engine.busy(),
+                        "served": self._served[name],
+                        "failed_over": self._failed_over[name],
+                    }
+                    for name, engine in self.engines.items()
+                },
+            }
@@ -0,0 +1,285 @@
+"""
+Métricas del pipeline de OCR: tiempos por etapa e histogramas.
+
+- MetricsRegistry/Histogram: histogramas acumulativos y gauges que se
+  exponen en formato de texto de Prometheus (GET /metrics de la API).
+- StageTimings + emf_record: tiempos de una sola petición, que la Lambda
+  escribe como una línea JSON en formato EMF de CloudWatch.
+- RequestLogger: registro estructurado de peticiones con metadatos acotados
+  (tamaños, huellas, tiempos); los payloads solo se escriben en una muestra
+  de las peticiones y recortados.
+
+Solo usa la biblioteca estándar para poder empaquetarse en la Lambda.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites de los histogramas (Prometheus añade siempre +Inf)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(2**exponent * 1024 for exponent in range(4, 16))  # 16 KB .. 32 MB
+PIXEL_BUCKETS = (250_000, 500_000, 1_000_000, 2_000_000, 4_000_000, 8_000_000,
+                 12_000_000, 16_000_000, 24_000_000, 50_000_000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """
+    Histograma con etiquetas, seguro entre hilos
+    """
+
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observa la duración del bloque en segundos
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, dict(values, counts=list(values["counts"]))) for key, values in self._series.items()]
+        for key, values in sorted(series):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values["counts"]):
+                cumulative += count
+                bucket_labels = _format_labels(labels + [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(values['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {values['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Histogramas y gauges de un proceso. Los gauges se leen al exportar, a
+    partir de una función que devuelve un número o {etiqueta: número}.
+    """
+
+    def __init__(self):
+        self._histograms = []
+        self._gauges = []
+
+    def histogram(self, name, help, buckets=STAGE_BUCKETS, labelnames=()):
+        histogram = Histogram(name, help, buckets, labelnames)
+        self._histograms.append(histogram)
+        return histogram
+
+    def gauge(self, name, help, read, labelname=None):
+        self._gauges.append((name, help, read, labelname))
+
+    def render(self):
+        """
+        Texto en formato de exposición de Prometheus (text/plain; version=0.0.4)
+        """
+        lines = []
+        for histogram in self._histograms:
+            lines += histogram.render()
+        for name, help, read, labelname in self._gauges:
+            try:
+                value = read()
+            except Exception:
+                continue
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            if isinstance(value, dict):
+                for label, item in sorted(value.items()):
+                    lines.append(f"{name}{_format_labels([(labelname, label)])} {_format_value(item)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimings:
+    """
+    Tiempos y contadores de una petición. Si una etapa se repite (varias
+    imágenes en paralelo) se suman sus duraciones. `properties` guarda datos
+    descriptivos (tipo de entrada...) que acompañan a las métricas.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.counters = {}
+        self.properties = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+
+def emf_record(namespace, metrics, dimensions=None, properties=None):
+    """
+    Registro en formato EMF (Embedded Metric Format) de CloudWatch.
+    `metrics` es {nombre: (valor, unidad)}; al escribirlo como una sola línea
+    JSON en stdout, CloudWatch lo convierte en métricas sin PutMetricData.
+    """
+    dimensions = dimensions or {}
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": namespace,
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (value, unit) in metrics.items()],
+            }],
+        },
+    }
+    record.update(dimensions)
+    record.update(properties or {})
+    record.update({name: value for name, (value, unit) in metrics.items()})
+    return record
+
+
+def emf_line(*args, **kwargs):
+    return json.dumps(emf_record(*args, **kwargs), separators=(",", ":"))
+
+
+# Bytes del principio de un payload que entran en su huella
+FINGERPRINT_BYTES = 64 * 1024
+
+
+def fingerprint(data):
+    """
+    Huella corta de un payload: tamaño + blake2b de los primeros 64 KB. No
+    identifica el contenido completo, pero permite relacionar peticiones
+    repetidas sin hashear megas en cada invocación.
+    """
+    if data is None:
+        return None
+    if isinstance(data, str):
+        data = data[:FINGERPRINT_BYTES].encode("utf-8", "replace")
+    digest = hashlib.blake2b(data[:FINGERPRINT_BYTES], digest_size=8)
+    return digest.hexdigest()
+
+
+def preview(value, max_chars):
+    """
+    Texto recortado a `max_chars` caracteres con el tamaño de lo omitido
+    """
+    if isinstance(value, (bytes, bytearray)):
+        text = bytes(value[:max_chars]).decode("utf-8", "replace")
+        total = len(value)
+    else:
+        text = str(value)[:max_chars] if value is not None else ""
+        total = len(value) if value is not None else 0
+    if total > max_chars:
+        return f"{text}... ({total - max_chars} más)"
+    return text
+
+
+def event_summary(event, max_keys=20, max_chars=64):
+    """
+    Metadatos acotados de un evento de API Gateway: método, ruta, tipo y
+    tamaño del cuerpo y su huella. Sin cabeceras (Authorization) ni contenido.
+    """
+    request_context = event.get("requestContext") or {}
+    http = request_context.get("http") or {}
+    headers = {str(name).lower(): value for name, value in (event.get("headers") or {}).items()}
+    body = event.get("body")
+    summary = {
+        "method": http.get("method") or event.get("httpMethod"),
+        "path": preview(http.get("path") or event.get("path") or "", max_chars),
+        "content_type": preview(headers.get("content-type", ""), max_chars),
+        "body_bytes": len(body) if body is not None else 0,
+        "base64": bool(event.get("isBase64Encoded", False)),
+        "body_fingerprint": fingerprint(body),
+    }
+    keys = [key for key in event if key != "body"]
+    summary["event_keys"] = [preview(key, max_chars) for key in keys[:max_keys]]
+    return summary
+
+
+class RequestLogger:
+    """
+    Escribe una línea JSON por mensaje con campos acotados. Los payloads
+    (cuerpos, eventos) solo se registran en una fracción `sample_rate` de
+    las llamadas y recortados a `max_chars`.
+    """
+
+    def __init__(self, logger, sample_rate=0.0, max_chars=256, rng=random.random):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+        self._rng = rng
+
+    @classmethod
+    def from_env(cls, logger):
+        """
+        OCR_LOG_SAMPLE_RATE (0-1, por defecto 0) y OCR_LOG_MAX_CHARS (256)
+        """
+        return cls(
+            logger,
+            sample_rate=float(os.environ.get("OCR_LOG_SAMPLE_RATE", "0")),
+            max_chars=int(os.environ.get("OCR_LOG_MAX_CHARS", "256")),
+        )
+
+    def log(self, message, level=logging.INFO, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, json.dumps({"message": message, **fields}, ensure_ascii=False, default=str))
+
+    def sampled(self):
+        return self.sample_rate > 0 and self._rng() < self.sample_rate
+
+    def payload(self, message, payload, level=logging.INFO, **fields):
+        """
+        Registra un payload recortado solo si la llamada entra en la muestra
+        """
+        if self.sampled():
+            self.log(message, level, sampled=True, payload=preview(payload, self.max_chars), **fields)
@@ -0,0 +1,164 @@
+"""
+Carga de los modelos de EasyOCR en segundo plano.
+
+Importar easyocr arrastra torch y los pesos del detector y del reconocedor,
+lo que puede tardar varios segundos. El servidor HTTP arranca sin esperar y
+los modelos se cargan en un hilo aparte; /health/ready indica cuándo están
+listos.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReady(Exception):
+    """
+    Los modelos todavía se están cargando (o la carga falló)
+    """
+
+
+class ModelLoader:
+    """
+    Crea el easyocr.Reader una sola vez por proceso, opcionalmente con una
+    inferencia de precalentamiento sobre una imagen sintética.
+    """
+
+    def __init__(self, languages, prewarm=True, gpu=None, started_at=None):
+        self.languages = languages
+        # Instante (perf_counter) en que arrancó el proceso, para medir el tiempo hasta estar listo
+        self.started_at = started_at
+        self.prewarm = prewarm
+        self.gpu = gpu
+        self._reader = None
+        self._error = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loader_pid = None
+        self.timings = {}
+
+    @classmethod
+    def from_env(cls, languages, started_at=None):
+        """
+        OCR_PREWARM=0 desactiva la inferencia de precalentamiento
+        """
+        return cls(languages, prewarm=os.getenv("OCR_PREWARM", "1") != "0", started_at=started_at)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        """
+        Lanza la carga en un hilo de fondo y devuelve inmediatamente
+        """
+        with self._lock:
+            if self._thread is None and not self.ready:
+                self._loader_pid = os.getpid()
+                self._thread = threading.Thread(target=self.load, name="ocr-model-loader", daemon=True)
+                self._thread.start()
+
+    def load(self):
+        """
+        Carga los modelos de forma síncrona en el proceso actual
+        """
+        started = time.perf_counter()
+        try:
+            import easyocr
+            imported = time.perf_counter()
+
+            kwargs = {} if self.gpu is None else {"gpu": self.gpu}
+            reader = easyocr.Reader(self.languages, **kwargs)
+            loaded = time.perf_counter()
+
+            if self.prewarm:
+                self.warm(reader)
+            warmed = time.perf_counter()
+        except Exception as e:
+            self._error = e
+            logger.exception("Error cargando los modelos de OCR")
+            return
+
+        self._reader = reader
+        self.timings = {
+            "import_seconds": round(imported - started, 3),
+            "model_load_seconds": round(loaded - imported, 3),
+            "prewarm_seconds": round(warmed - loaded, 3),
+            "total_seconds": round(warmed - started, 3),
+        }
+        if self.started_at is not None:
+            self.timings["time_to_ready_seconds"] = round(warmed - self.started_at, 3)
+        self._ready.set()
+        logger.info(
+            "Modelos de OCR listos en %.2fs (import %.2fs, carga %.2fs, precalentamiento %.2fs)",
+            self.timings["total_seconds"], self.timings["import_seconds"],
+            self.timings["model_load_seconds"], self.timings["prewarm_seconds"],
+        )
+        if self.started_at is not None:
+            logger.info("Tiempo hasta estar listo: %.2fs", self.timings["time_to_ready_seconds"])
+
+    @property
+    def reader(self):
+        """
+        Reader listo para usar; lanza ModelNotReady si aún se está cargando.
+
+        Un proceso hijo creado con fork después de la carga hereda el reader
+        ya construido. Si el fork ocurrió antes (o nunca se llamó a start),
+        el hilo de carga no existe en este proceso y se carga aquí mismo.
+        """
+        if self._ready.is_set():
+            return self._reader
+        if self._error is None and self._loader_pid != os.getpid():
+            with self._lock:
+                if not self._ready.is_set():
+                    self.load()
+            if self._ready.is_set():
+                return self._reader
+        if self._error is not None:
+            raise ModelNotReady(f"Error cargando los modelos: {self._error}")
+        raise ModelNotReady("Los modelos de OCR se están cargando")
+
+    def warm(self, reader=None):
+        """
+        Inferencia sobre una imagen sintética para que la primera petición
+        real no pague la inicialización perezosa de torch
+        """
+        (reader or self.reader).readtext(_prewarm_image())
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def shutdown(self, timeout=5):
+        """
+        Espera (como mucho `timeout` segundos) a que termine una carga en
+        curso, para no cerrar el intérprete a mitad de importar torch
+        """
+        thread = self._thread
+        if thread is None or self._loader_pid != os.getpid():
+            return
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("La carga de los modelos de OCR sigue en curso al cerrar")
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "languages": self.languages,
+            "error": str(self._error) if self._error else None,
+            "timings": self.timings,
+        }
+
+
+def _prewarm_image():
+    """
+    Imagen sintética con texto para la primera inferencia
+    """
+    import cv2
+    import numpy as np
+
+    image = np.full((96, 480), 255, dtype=np.uint8)
+    cv2.putText(image, "Hola OCR 123", (12, 64), cv2.FONT_HERSHEY_SIMPLEX, 1.6, 0, 3)
+    return image
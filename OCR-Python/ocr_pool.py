@@ -0,0 +1,170 @@
+"""
+Pool de workers acotado para ejecutar el OCR fuera del event loop de uvicorn
+"""
+import asyncio
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class PoolSaturated(Exception):
+    """
+    La cola del pool está llena; el cliente debe reintentar más tarde
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"Cola de OCR llena, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _timed_call(fn, args, kwargs):
+    """
+    Ejecuta la tarea en el worker y devuelve el instante en que empezó
+    (time.time es comparable entre procesos)
+    """
+    started_at = time.time()
+    return started_at, fn(*args, **kwargs)
+
+
+class OCRWorkerPool:
+    """
+    Ejecuta tareas bloqueantes (preprocesado, inferencia) en un pool de
+    hilos o procesos con una cola de espera de tamaño fijo.
+
+    Cuando hay más de `max_workers + max_queue` tareas pendientes se lanza
+    PoolSaturated en lugar de encolar sin límite.
+    """
+
+    def __init__(self, mode="thread", max_workers=2, max_queue=8, window=1024):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Modo de pool no soportado: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        if mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="ocr-worker"
+            )
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_sum = 0.0
+        self._wait_max = 0.0
+        self._service_sum = 0.0
+        self._recent_waits = deque(maxlen=window)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Construye el pool a partir de OCR_POOL_MODE, OCR_POOL_WORKERS y OCR_POOL_QUEUE
+        """
+        return cls(
+            mode=os.getenv("OCR_POOL_MODE", "thread"),
+            max_workers=int(os.getenv("OCR_POOL_WORKERS", "2")),
+            max_queue=int(os.getenv("OCR_POOL_QUEUE", "8")),
+        )
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    def _retry_after(self):
+        """
+        Estima cuántos segundos tardará en liberarse un hueco en la cola
+        """
+        if self._completed:
+            avg_service = self._service_sum / self._completed
+        else:
+            avg_service = 1.0
+        waiting = max(self._pending - self.max_workers, 0) + 1
+        return max(1, math.ceil(avg_service * waiting / self.max_workers))
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) en el pool y espera su resultado sin
+        bloquear el event loop
+        """
+        with self._lock:
+            if self._pending >= self.capacity:
+                self._rejected += 1
+                raise PoolSaturated(self._retry_after())
+            self._pending += 1
+
+        submitted_at = time.time()
+        try:
+            future = self._executor.submit(functools.partial(_timed_call, fn, args, kwargs))
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        # La tarea deja de contar al terminar en el executor, no cuando
+        # termina quien la espera: si el cliente se desconecta y se cancela
+        # la corrutina, el hilo o proceso sigue ocupado hasta acabarla
+        future.add_done_callback(functools.partial(self._finished, submitted_at))
+        started_at, result = await asyncio.wrap_future(future)
+        return result
+
+    def _finished(self, submitted_at, future):
+        finished_at = time.time()
+        if future.cancelled() or future.exception() is not None:
+            self._record(submitted_at, None, finished_at, ok=False)
+        else:
+            self._record(submitted_at, future.result()[0], finished_at, ok=True)
+
+    def _record(self, submitted_at, started_at, finished_at, ok):
+        with self._lock:
+            self._pending -= 1
+            if not ok:
+                self._failed += 1
+                return
+            wait = max(started_at - submitted_at, 0.0)
+            self._completed += 1
+            self._wait_sum += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._service_sum += max(finished_at - started_at, 0.0)
+            self._recent_waits.append(wait)
+
+    def stats(self):
+        """
+        Métricas del pool para dimensionar réplicas
+        """
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            in_flight = min(self._pending, self.max_workers)
+            completed = self._completed
+
+            def percentile(p):
+                if not waits:
+                    return 0.0
+                return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+            return {
+                "mode": self.mode,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": in_flight,
+                "queue_depth": self._pending - in_flight,
+                "completed": completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "wait_seconds": {
+                    "avg": self._wait_sum / completed if completed else 0.0,
+                    "max": self._wait_max,
+                    "p50": percentile(0.50),
+                    "p95": percentile(0.95),
+                    "p99": percentile(0.99),
+                },
+                "service_seconds_avg": self._service_sum / completed if completed else 0.0,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,273 @@
+"""
+Recorte de la zona útil de la imagen antes de la detección.
+
+Las fotos de cuadernos y folios suelen tener márgenes en blanco o fondo
+alrededor de la página, y el detector procesa igualmente todo el encuadre.
+Con una pasada barata sobre una versión reducida se localiza:
+
+- content: el rectángulo que contiene la tinta (componentes con forma de
+  letra), con un margen; el recorte es una vista del array, sin copias.
+- page: además, el contorno de la hoja; si se encuentra un cuadrilátero se
+  corrige la perspectiva antes de buscar el contenido.
+
+Opcionalmente se endereza el texto inclinado (deskew). Cada paso devuelve la
+matriz 3x3 que lleva las coordenadas de la imagen recortada a las del
+encuadre original, para informar de las cajas en la foto subida.
+"""
+import os
+
+import cv2
+import numpy as np
+
+MODES = ("off", "content", "page")
+
+
+def _gray(image_array):
+    if image_array.dtype != np.uint8:
+        image_array = cv2.normalize(image_array, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+    if image_array.ndim == 2:
+        return image_array
+    if image_array.shape[2] == 4:
+        return cv2.cvtColor(image_array, cv2.COLOR_RGBA2GRAY)
+    return cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+
+
+def _order_corners(points):
+    """
+    Esquinas en orden: superior izquierda, superior derecha, inferior derecha, inferior izquierda
+    """
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([
+        points[np.argmin(sums)], points[np.argmin(diffs)],
+        points[np.argmax(sums)], points[np.argmax(diffs)],
+    ], dtype=np.float32)
+
+
+def _homogeneous(affine):
+    return np.vstack([affine, [0.0, 0.0, 1.0]])
+
+
+class PageCropper:
+    """
+    Localiza y recorta la zona con contenido. Solo recorta si se ahorra al
+    menos `min_gain` de los píxeles; si no encuentra `min_components`
+    componentes con forma de letra deja la imagen como está.
+    """
+
+    def __init__(self, mode="content", deskew=False, probe_long_side=1000, margin=0.02,
+                 min_gain=0.1, min_components=8, min_page_area=0.25, max_skew=15.0):
+        if mode not in MODES[1:]:
+            raise ValueError(f"Modo de recorte desconocido: {mode}")
+        self.mode = mode
+        self.deskew = deskew
+        self.probe_long_side = probe_long_side
+        self.margin = margin
+        self.min_gain = min_gain
+        self.min_components = min_components
+        self.min_page_area = min_page_area
+        self.max_skew = max_skew
+
+    @classmethod
+    def from_env(cls):
+        """
+        Devuelve el recortador configurado con OCR_CROP (content, page) y
+        OCR_DESKEW, o None si OCR_CROP=off
+        """
+        mode = os.getenv("OCR_CROP", "content")
+        if mode == "off":
+            return None
+        return cls(mode=mode, deskew=os.getenv("OCR_DESKEW", "0") == "1")
+
+    @property
+    def cache_params(self):
+        return {"mode": self.mode, "deskew": self.deskew}
+
+    def _probe(self, image_array):
+        height, width = image_array.shape[:2]
+        scale = min(1.0, self.probe_long_side / max(height, width))
+        if scale < 1.0:
+            # INTER_LINEAR muestrea en lugar de promediar: basta para localizar
+            # tinta y bordes y cuesta ~3 ms frente a ~30 ms de INTER_AREA en 12 MP
+            image_array = cv2.resize(image_array, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        return _gray(image_array), scale
+
+    def _ink(self, gray):
+        """
+        Estadísticas de los componentes con forma de letra de la imagen reducida
+        """
+        binary = cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15
+        )
+        count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        stats = stats[1:]
+        height, width = gray.shape
+        # Sin ruido, bordes de la hoja ni sombras que cruzan el encuadre
+        glyphs = stats[
+            (stats[:, cv2.CC_STAT_AREA] >= 6)
+            & (stats[:, cv2.CC_STAT_HEIGHT] <= height / 3)
+            & (stats[:, cv2.CC_STAT_WIDTH] <= width / 2)
+        ]
+        if len(glyphs) < self.min_components:
+            return binary, None
+        # Motas sueltas mucho menores que una letra típica
+        glyphs = glyphs[glyphs[:, cv2.CC_STAT_AREA] >= 0.1 * np.median(glyphs[:, cv2.CC_STAT_AREA])]
+        return binary, glyphs
+
+    def content_box(self, image_array):
+        """
+        (x0, y0, x1, y1) de la zona con contenido en la imagen original, o
+        None si no compensa recortar
+        """
+        gray, scale = self._probe(image_array)
+        _, glyphs = self._ink(gray)
+        if glyphs is None:
+            return None
+
+        height, width = gray.shape
+        pad = max(self.margin * max(height, width), 2 * np.median(glyphs[:, cv2.CC_STAT_HEIGHT]))
+        x0 = max(0.0, glyphs[:, cv2.CC_STAT_LEFT].min() - pad)
+        y0 = max(0.0, glyphs[:, cv2.CC_STAT_TOP].min() - pad)
+        x1 = min(width, (glyphs[:, cv2.CC_STAT_LEFT] + glyphs[:, cv2.CC_STAT_WIDTH]).max() + pad)
+        y1 = min(height, (glyphs[:, cv2.CC_STAT_TOP] + glyphs[:, cv2.CC_STAT_HEIGHT]).max() + pad)
+        if (x1 - x0) * (y1 - y0) > (1 - self.min_gain) * width * height:
+            return None
+
+        original_height, original_width = image_array.shape[:2]
+        return (
+            int(x0 / scale), int(y0 / scale),
+            min(original_width, int(np.ceil(x1 / scale))), min(original_height, int(np.ceil(y1 / scale))),
+        )
+
+    def page_corners(self, image_array):
+        """
+        Esquinas de la hoja en la imagen original, o None si no se encuentra
+        un cuadrilátero claro o la hoja ya ocupa todo el encuadre
+        """
+        gray, scale = self._probe(image_array)
+        edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+        edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        frame_area = gray.shape[0] * gray.shape[1]
+        for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+            hull = cv2.convexHull(contour)
+            approx = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True)
+            area = cv2.contourArea(approx)
+            if len(approx) != 4 or area < self.min_page_area * frame_area:
+                continue
+            if area > (1 - self.min_gain) * frame_area:
+                return None
+            return _order_corners(approx.reshape(4, 2).astype(np.float32) / scale)
+        return None
+
+    def skew_angle(self, image_array):
+        """
+        Inclinación de las líneas de texto en grados (positiva en el sentido
+        de las agujas del reloj), o None si no se puede estimar
+        """
+        gray, _ = self._probe(image_array)
+        binary, glyphs = self._ink(gray)
+        if glyphs is None:
+            return None
+
+        # Une las letras de cada línea en una mancha alargada
+        glyph_height = int(np.median(glyphs[:, cv2.CC_STAT_HEIGHT]))
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, glyph_height * 2), 1))
+        lines = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+        contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        angles = []
+        for contour in contours:
+            (_, _), (rect_width, rect_height), angle = cv2.minAreaRect(contour)
+            if rect_width < rect_height:
+                rect_width, rect_height = rect_height, rect_width
+                angle -= 90
+            if rect_width < max(4 * rect_height, gray.shape[1] * 0.1):
+                continue
+            angles.append((angle + 45) % 90 - 45)
+        if len(angles) < 2:
+            return None
+        angle = float(np.median(angles))
+        if abs(angle) > self.max_skew:
+            return None
+        return angle
+
+    def _warp_page(self, image_array, corners):
+        top_left, top_right, bottom_right, bottom_left = corners
+        width = int(max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left)))
+        height = int(max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right)))
+        target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+        forward = cv2.getPerspectiveTransform(corners, target)
+        warped = cv2.warpPerspective(image_array, forward, (width, height), flags=cv2.INTER_LINEAR,
+                                     borderMode=cv2.BORDER_REPLICATE)
+        return warped, np.linalg.inv(forward)
+
+    def _rotate(self, image_array, angle):
+        height, width = image_array.shape[:2]
+        rotation = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        cos, sin = abs(rotation[0, 0]), abs(rotation[0, 1])
+        new_width = int(np.ceil(height * sin + width * cos))
+        new_height = int(np.ceil(height * cos + width * sin))
+        # El lienzo crece para no cortar las esquinas
+        rotation[0, 2] += new_width / 2 - width / 2
+        rotation[1, 2] += new_height / 2 - height / 2
+        rotated = cv2.warpAffine(image_array, rotation, (new_width, new_height), flags=cv2.INTER_LINEAR,
+                                 borderMode=cv2.BORDER_REPLICATE)
+        return rotated, np.linalg.inv(_homogeneous(rotation))
+
+    def apply(self, image_array):
+        """
+        Devuelve (imagen recortada, matriz). La matriz lleva puntos de la
+        imagen recortada al encuadre original; es None si no se ha tocado
+        """
+        matrix = None
+
+        def chain(step):
+            return step if matrix is None else matrix @ step
+
+        if self.mode == "page":
+            corners = self.page_corners(image_array)
+            if corners is not None:
+                image_array, step = self._warp_page(image_array, corners)
+                matrix = chain(step)
+
+        box = self.content_box(image_array)
+        if box is not None:
+            x0, y0, x1, y1 = box
+            image_array = image_array[y0:y1, x0:x1]
+            matrix = chain(np.array([[1.0, 0.0, x0], [0.0, 1.0, y0], [0.0, 0.0, 1.0]]))
+
+        if self.deskew:
+            angle = self.skew_angle(image_array)
+            if angle is not None and abs(angle) >= 0.5:
+                image_array, step = self._rotate(image_array, angle)
+                matrix = chain(step)
+
+        return image_array, matrix
+
+
+def frame_transform(matrix, scale=1.0, decode_scale=1.0):
+    """
+    Combina la matriz del recorte con la escala del gobernador de resolución
+    y la de decodificación (JPEG decodificado reducido): lleva puntos de la
+    imagen procesada al encuadre original
+    """
+    if matrix is None and scale == 1.0 and decode_scale == 1.0:
+        return None
+    transform = np.diag([1.0 / scale, 1.0 / scale, 1.0])
+    if matrix is not None:
+        transform = matrix @ transform
+    if decode_scale != 1.0:
+        transform = np.diag([1.0 / decode_scale, 1.0 / decode_scale, 1.0]) @ transform
+    return transform
+
+
+def map_points(points, transform):
+    """
+    Lleva una lista de puntos [x, y] al encuadre original
+    """
+    if transform is None:
+        return [[int(x), int(y)] for x, y in points]
+    mapped = cv2.perspectiveTransform(np.asarray(points, dtype=np.float64).reshape(-1, 1, 2), transform)
+    return [[int(round(x)), int(round(y))] for x, y in mapped.reshape(-1, 2)]
@@ -0,0 +1,145 @@
+"""
+Reducción adaptativa de la resolución antes de la detección.
+
+Las fotos de móvil llegan a 3000-4000 px y el coste del detector CRAFT
+crece con el número de píxeles. El gobernador estima la altura del texto
+con una pasada barata sobre una versión reducida y escala la imagen al
+tamaño mínimo que mantiene los caracteres por encima de una altura objetivo.
+"""
+import os
+
+import cv2
+import numpy as np
+
+
+class ResolutionGovernor:
+    """
+    Decide cuánto reducir una imagen sin que el texto baje de
+    `target_text_height` píxeles. Nunca amplía la imagen ni reduce su lado
+    mayor por debajo de `min_long_side`.
+    """
+
+    def __init__(self, target_text_height=24, min_long_side=1600, probe_long_side=1600,
+                 percentile=25, min_components=12):
+        self.target_text_height = target_text_height
+        self.min_long_side = min_long_side
+        self.probe_long_side = probe_long_side
+        self.percentile = percentile
+        self.min_components = min_components
+
+    @classmethod
+    def from_env(cls):
+        """
+        Devuelve el gobernador configurado con OCR_TARGET_TEXT_HEIGHT y
+        OCR_MIN_LONG_SIDE, o None si OCR_DOWNSCALE=0
+        """
+        if os.getenv("OCR_DOWNSCALE", "1") == "0":
+            return None
+        return cls(
+            target_text_height=int(os.getenv("OCR_TARGET_TEXT_HEIGHT", "24")),
+            min_long_side=int(os.getenv("OCR_MIN_LONG_SIDE", "1600")),
+        )
+
+    @property
+    def cache_params(self):
+        return {"target_text_height": self.target_text_height, "min_long_side": self.min_long_side}
+
+    def estimate_text_height(self, image_array):
+        """
+        Altura típica de los caracteres en píxeles de la imagen original,
+        o None si no se encuentran suficientes componentes con forma de letra
+        """
+        height, width = image_array.shape[:2]
+        probe_scale = min(1.0, self.probe_long_side / max(height, width))
+        probe = cv2.resize(
+            image_array, None, fx=probe_scale, fy=probe_scale, interpolation=cv2.INTER_AREA
+        )
+        if probe.ndim == 3:
+            probe = cv2.cvtColor(probe, cv2.COLOR_RGB2GRAY)
+
+        binary = cv2.adaptiveThreshold(
+            probe, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15
+        )
+        count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        if count <= 1:
+            return None
+
+        # Se descartan el fondo, el ruido y los bloques demasiado grandes o alargados
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        glyphs = (
+            (heights >= 3)
+            & (heights <= probe.shape[0] / 4)
+            & (areas >= 6)
+            & (widths <= heights * 8)
+            & (heights <= widths * 8)
+        )
+        if np.count_nonzero(glyphs) < self.min_components:
+            return None
+
+        return float(np.percentile(heights[glyphs], self.percentile)) / probe_scale
+
+    def plan(self, image_array, text_height=None):
+        """
+        Factor de escala (<= 1) a aplicar a la imagen. `text_height`, si ya
+        se conoce (en píxeles de esta imagen), evita volver a estimarla
+        """
+        long_side = max(image_array.shape[:2])
+        if long_side <= self.min_long_side:
+            return 1.0
+        if text_height is None:
+            text_height = self.estimate_text_height(image_array)
+        return self.scale_for(text_height, long_side)
+
+    def scale_for(self, text_height, long_side):
+        """
+        Factor de escala (<= 1) para una imagen de lado mayor `long_side` con
+        texto de `text_height` píxeles
+        """
+        if long_side <= self.min_long_side or not text_height:
+            return 1.0
+        scale = self.target_text_height / text_height
+        scale = max(scale, self.min_long_side / long_side)
+        return min(scale, 1.0)
+
+    def probe_reduction(self, long_side, reductions=(8, 4, 2)):
+        """
+        Mayor reducción entera con la que la imagen sigue teniendo al menos
+        `probe_long_side` píxeles: basta para estimar la altura del texto
+        """
+        for reduction in reductions:
+            if long_side / reduction >= self.probe_long_side:
+                return reduction
+        return 1
+
+    def decode_reduction(self, text_height, long_side, reductions=(8, 4, 2)):
+        """
+        Mayor reducción entera (1/2, 1/4, 1/8, las que admite el decodificador
+        de JPEG) que no baja de la escala que se aplicaría después
+        """
+        scale = self.scale_for(text_height, long_side)
+        for reduction in reductions:
+            if 1.0 / reduction >= scale:
+                return reduction
+        return 1
+
+    def apply(self, image_array, text_height=None):
+        """
+        Devuelve (imagen reducida, escala). Las coordenadas obtenidas sobre la
+        imagen reducida se pasan a la original con to_original
+        """
+        scale = self.plan(image_array, text_height)
+        if scale >= 0.95:
+            return image_array, 1.0
+        resized = cv2.resize(image_array, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return resized, scale
+
+
+def to_original(points, scale):
+    """
+    Lleva una lista de puntos [x, y] de la imagen reducida a la original
+    """
+    if scale == 1.0:
+        return [[int(x), int(y)] for x, y in points]
+    return [[int(round(x / scale)), int(round(y / scale))] for x, y in points]
@@ -0,0 +1,180 @@
+"""
+Arranque con varios workers que comparten los pesos de los modelos.
+
+`uvicorn --workers N` crea cada worker desde cero y cada uno carga su propia
+copia del detector y del reconocedor de EasyOCR. Aquí el proceso maestro
+carga los modelos una sola vez, abre el socket y hace fork de los workers:
+los tensores de solo lectura se comparten por copy-on-write.
+
+Uso:
+    python server.py --workers 4 --port 8000
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+# El maestro carga los modelos explícitamente (sin precalentar) antes del fork
+os.environ["OCR_MODEL_LOADING"] = "background"
+# La cola de trabajos la atiende el maestro; los workers HTTP no lanzan la suya
+JOB_WORKERS = int(os.environ.get("OCR_JOB_WORKERS", "1"))
+os.environ["OCR_JOB_WORKERS"] = "0"
+
+logger = logging.getLogger("ocr_server")
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app_module, sock, args, index):
+    """
+    Cuerpo del proceso hijo: sirve la app sobre el socket heredado
+    """
+    import uvicorn
+
+    # Repartir los hilos de torch entre los workers para no sobresuscribir la CPU
+    if "torch" in sys.modules:
+        threads = args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers)
+        sys.modules["torch"].set_num_threads(threads)
+
+    if os.getenv("OCR_PREWARM", "1") != "0":
+        app_module.models.warm()
+
+    config = uvicorn.Config(app_module.app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    server = uvicorn.Server(config)
+    logger.info("Worker %d (pid %d) atendiendo peticiones", index, os.getpid())
+    server.run(sockets=[sock])
+
+
+def spawn(app_module, sock, args, index):
+    pid = os.fork()
+    if pid == 0:
+        # En el hijo se restauran las señales por defecto; uvicorn instala las suyas
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            run_worker(app_module, sock, args, index)
+        except Exception:
+            logger.exception("El worker %d terminó con error", index)
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def report_memory(workers):
+    from memory_stats import process_memory
+
+    total_pss = 0
+    for pid, index in sorted(workers.items(), key=lambda item: item[1]):
+        stats = process_memory(pid)
+        total_pss += stats.get("pss_bytes", 0)
+        logger.info(
+            "Worker %d (pid %d): RSS %.0f MB, PSS %.0f MB, compartida %.0f MB, privada %.0f MB",
+            index, pid,
+            stats.get("rss_bytes", 0) / 2**20, stats.get("pss_bytes", 0) / 2**20,
+            stats.get("shared_bytes", 0) / 2**20, stats.get("private_bytes", 0) / 2**20,
+        )
+    master = process_memory()
+    total_pss += master.get("pss_bytes", 0)
+    logger.info(
+        "Maestro (pid %d): PSS %.0f MB. Total PSS del servicio: %.0f MB",
+        os.getpid(), master.get("pss_bytes", 0) / 2**20, total_pss / 2**20,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor OCR con modelos precargados y fork de workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--torch-threads", type=int, default=0,
+                        help="Hilos de torch por worker (por defecto CPUs / workers)")
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--job-workers", type=int, default=JOB_WORKERS,
+                        help="Procesos que atienden la cola de /jobs (0 la desactiva)")
+    parser.add_argument("--report-interval", type=float, default=60.0,
+                        help="Segundos entre informes de memoria por worker (0 lo desactiva)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    # Carga de modelos en el maestro, sin precalentar: la inferencia de prueba
+    # se hace en cada worker para no arrancar hilos de OpenMP antes del fork
+    started = time.perf_counter()
+    import main as app_module
+    # La cola la atienden los workers que lanza el maestro, no los HTTP
+    app_module.JOB_WORKERS_EXTERNAL = args.job_workers > 0
+    app_module.models.prewarm = False
+    app_module.models.load()
+    if not app_module.models.ready:
+        logger.error("No se pudieron cargar los modelos; abortando")
+        sys.exit(1)
+    logger.info("Modelos precargados en el maestro en %.2fs", time.perf_counter() - started)
+
+    # Los objetos creados hasta aquí pasan a la generación permanente del GC:
+    # así las recolecciones de los hijos no escriben en sus cabeceras y las
+    # páginas siguen compartidas
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(args.host, args.port)
+    logger.info("Escuchando en %s:%d con %d workers", args.host, args.port, args.workers)
+
+    workers = {}
+    for index in range(args.workers):
+        workers[spawn(app_module, sock, args, index)] = index
+
+    # Los workers de la cola se crean con spawn, después del fork de los HTTP
+    if args.job_workers > 0:
+        app_module.job_workers.processes = args.job_workers
+        app_module.job_workers.start()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    next_report = time.monotonic() + min(args.report_interval, 15) if args.report_interval else None
+    while workers:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.5)
+            if next_report is not None and time.monotonic() >= next_report:
+                report_memory(workers)
+                next_report = time.monotonic() + args.report_interval
+            continue
+
+        index = workers.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning("El worker %d (pid %d) terminó (estado %d); relanzando", index, pid, status)
+        workers[spawn(app_module, sock, args, index)] = index
+
+    app_module.job_workers.shutdown()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""
+Los módulos de OCR-Python están en la raíz del proyecto, sin paquete
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sin las líneas EMF de cada invocación ni caché en disco
+os.environ.setdefault("OCR_EMF", "0")
+os.environ.pop("OCR_CACHE_DB", None)
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
@@ -0,0 +1,118 @@
+"""
+Varias imágenes por invocación ({"images": [...]}) contra el Textract simulado
+"""
+import base64
+import json
+import os
+import time
+
+import pytest
+
+import lambda_function
+from fake_textract import StubTextractClient
+
+
+class ReversedLatencyClient(StubTextractClient):
+    """
+    Las primeras imágenes de la lista son las que más tardan: los resultados
+    terminan en orden inverso al de la petición
+    """
+
+    def __init__(self, latencies):
+        super().__init__()
+        self.latencies = latencies
+
+    def detect_document_text(self, Document):
+        time.sleep(self.latencies.get(len(Document["Bytes"]), 0))
+        return super().detect_document_text(Document)
+
+
+@pytest.fixture
+def stub():
+    client = StubTextractClient()
+    lambda_function.set_textract_client(client)
+    yield client
+    lambda_function.set_textract_client(None)
+
+
+def image(size):
+    # Bytes aleatorios: cada imagen es distinta y no sale de la caché
+    return base64.b64encode(os.urandom(size)).decode("ascii")
+
+
+def invoke(body):
+    response = lambda_function.lambda_handler({"httpMethod": "POST", "body": json.dumps(body)}, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def test_results_keep_request_order():
+    sizes = [1000 + index for index in range(6)]
+    client = ReversedLatencyClient({size: 0.05 * (len(sizes) - index) for index, size in enumerate(sizes)})
+    lambda_function.set_textract_client(client)
+    try:
+        status, body = invoke({"images": [image(size) for size in sizes]})
+    finally:
+        lambda_function.set_textract_client(None)
+
+    assert status == 200
+    assert body["status"] == "success"
+    assert body["metadata"] == {"image_count": len(sizes), "failed_count": 0}
+    assert [result["text"].split("\n")[0] for result in body["results"]] == [
+        f"Linea 1 de una imagen de {size} bytes" for size in sizes
+    ]
+    assert client.calls == len(sizes)
+
+
+def test_errors_are_reported_per_item(stub):
+    status, body = invoke({"images": [
+        image(1200),
+        "data:image/png;base64",
+        "no es base64!",
+        {"image": image(1300)},
+        {},
+        image(1400),
+    ]})
+
+    assert status == 200
+    assert body["status"] == "partial"
+    assert body["metadata"] == {"image_count": 6, "failed_count": 3}
+    statuses = [result["status"] for result in body["results"]]
+    assert statuses == ["success", "error", "error", "success", "error", "success"]
+    assert body["results"][1]["message"] == "La data URL no contiene datos"
+    assert body["results"][2]["error"] == "Error decodificando imagen"
+    assert body["results"][4]["error"] == "No se proporcionó imagen"
+    assert "1300 bytes" in body["results"][3]["text"]
+    assert stub.calls == 3
+
+
+@pytest.mark.parametrize("item", [5, None, [1, 2], 1.5, True])
+def test_non_string_items_fail_alone(stub, item):
+    status, body = invoke({"images": [image(1500), item]})
+
+    assert status == 200
+    assert body["status"] == "partial"
+    assert body["results"][0]["status"] == "success"
+    assert body["results"][1]["status"] == "error"
+    assert body["results"][1]["error"] in ("Imagen no válida", "No se proporcionó imagen")
+    assert stub.calls == 1
+
+
+def test_non_string_image_in_object_is_rejected(stub):
+    status, body = invoke({"images": [{"image": 7}]})
+    assert status == 200
+    assert body["results"][0] == {
+        "status": "error", "error": "Imagen no válida", "message": "La imagen debe ser una cadena en base64",
+    }
+
+    status, body = invoke({"image": 7})
+    assert status == 400
+    assert body["error"] == "Imagen no válida"
+    assert stub.calls == 0
+
+
+@pytest.mark.parametrize("images", [[], "abc", [image(10)] * (lambda_function.MAX_IMAGES + 1)])
+def test_invalid_image_lists_are_rejected(stub, images):
+    status, body = invoke({"images": images})
+    assert status == 400
+    assert body["error"] == "Lista de imágenes no válida"
+    assert stub.calls == 0
@@ -0,0 +1,35 @@
+"""
+Numeración de columnas del corte XY
+"""
+from layout import LayoutAnalyzer
+
+
+def column(x0, x1, rows, top=0):
+    return [(x0, top + row * 12, x1, top + row * 12 + 10) for row in range(rows)]
+
+
+def test_columns_are_numbered_across_the_page():
+    # Cabecera a todo lo ancho y dos bandas de dos columnas
+    boxes = (
+        [(0, 0, 300, 10)]
+        + column(0, 120, 3, 40) + column(0, 120, 3, 120)
+        + column(180, 300, 3, 40) + column(180, 300, 3, 120)
+    )
+    paragraphs = LayoutAnalyzer().analyze(boxes)
+    assert [(paragraph.column, paragraph.lines[0][0]) for paragraph in paragraphs] == [
+        (0, 0), (0, 1), (1, 7), (0, 4), (1, 10),
+    ]
+
+
+def test_nested_columns_get_distinct_numbers():
+    # Dos columnas; la derecha tiene su propia cabecera y debajo se parte en dos
+    boxes = column(0, 100, 8) + [(150, 0, 300, 10)] + column(150, 200, 6, 30) + column(240, 300, 6, 30)
+    assert [paragraph.column for paragraph in LayoutAnalyzer().analyze(boxes)] == [0, 1, 1, 2]
+
+
+def test_sections_with_different_columns():
+    # Dos columnas arriba y tres abajo: cada columna de una sección tiene su número
+    boxes = column(0, 120, 4) + column(180, 300, 4) + column(0, 70, 4, 200) + column(110, 170, 4, 200) + column(220, 300, 4, 200)
+    columns = [paragraph.column for paragraph in LayoutAnalyzer().analyze(boxes)]
+    assert columns[:2] == [0, 2]
+    assert columns[2:] == [0, 1, 2]
@@ -0,0 +1,56 @@
+"""
+Errores de Textract en el router, contra el Textract simulado
+"""
+import asyncio
+
+import pytest
+
+from fake_textract import StubTextractClient
+from ocr_cascade import EngineUnavailable
+from ocr_engines import EngineBusy, EngineInputError, EngineRouter, FunctionEngine, OCRResult, TextractEngine
+
+
+def router(error):
+    """
+    Textract con el error dado y, detrás, un motor local que cuenta sus lecturas
+    """
+    calls = []
+
+    async def local_read(contents, **options):
+        calls.append(contents)
+        return OCRResult("easyocr", [], None, {})
+
+    textract = TextractEngine(client=StubTextractClient(error=error), max_in_flight=1)
+    return EngineRouter([textract, FunctionEngine("easyocr", local_read)], default="textract"), calls
+
+
+@pytest.mark.parametrize("code, status", [
+    ("InvalidImageFormatException", 400),
+    ("UnsupportedDocumentException", 400),
+    ("BadDocumentException", 400),
+    ("InvalidParameterException", 400),
+    ("DocumentTooLargeException", 413),
+])
+def test_input_error_is_not_retried(code, status):
+    engines, calls = router(code)
+    with pytest.raises(EngineInputError) as error:
+        asyncio.run(engines.read(b"imagen"))
+    assert error.value.status_code == status
+    assert calls == []
+    assert engines.stats()["engines"]["textract"]["failed_over"] == 0
+
+
+@pytest.mark.parametrize("code, exception", [
+    ("ThrottlingException", EngineBusy),
+    ("AccessDeniedException", EngineUnavailable),
+    ("InternalServerError", EngineUnavailable),
+])
+def test_service_error_fails_over(code, exception):
+    textract = TextractEngine(client=StubTextractClient(error=code), max_in_flight=1)
+    with pytest.raises(exception):
+        asyncio.run(textract.read(b"imagen"))
+
+    engines, calls = router(code)
+    result = asyncio.run(engines.read(b"imagen"))
+    assert result.engine == "easyocr"
+    assert calls == [b"imagen"]
@@ -0,0 +1,313 @@
+"""
+Detección por teselas para imágenes muy grandes.
+
+Escaneos y panorámicas de decenas de megapíxeles no se preprocesan ni se
+pasan al detector de una vez: se dividen en teselas solapadas que se
+preprocesan y detectan por separado (en paralelo si hay núcleos), con
+buffers del tamaño de la tesela. Las cajas se llevan a coordenadas de la
+imagen completa y se fusionan en las costuras:
+
+- una caja que queda entera dentro del núcleo de su tesela (la parte que no
+  comparte con las vecinas) es única;
+- las demás se agrupan con las de otras teselas que se solapan con ellas en
+  la misma línea. Un grupo que ya cubre una caja única se descarta; si no,
+  se queda la caja del grupo que lo abarca entero o, si ninguna lo hace (la
+  línea cruza la costura), la unión de los fragmentos.
+
+El reconocimiento se hace por ventanas: cada tesela reconoce las cajas
+cuyo centro cae en su núcleo, preprocesando solo el rectángulo que las
+contiene. La memoria del pipeline depende del tamaño de tesela y del número
+de workers, no del de la imagen (salvo la propia imagen decodificada).
+"""
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Ventana de la tesela y su núcleo, en coordenadas de la imagen completa
+Tile = namedtuple("Tile", "x0 y0 x1 y1 core_x0 core_y0 core_x1 core_y1")
+
+# Distancia al borde de la tesela por debajo de la cual una caja se considera cortada
+_EDGE_TOLERANCE = 4
+# Contexto alrededor de cada ventana de reconocimiento para el umbral adaptativo
+_WINDOW_PADDING = 16
+
+
+def _positions(length, size, overlap):
+    """
+    Inicio de cada tesela, repartidas de forma uniforme con al menos `overlap` de solape
+    """
+    if length <= size:
+        return [0]
+    count = -(-(length - overlap) // (size - overlap))
+    stride = (length - size) / (count - 1)
+    return [int(round(index * stride)) for index in range(count)]
+
+
+def _core_bounds(positions, size, length):
+    """
+    Límites de los núcleos: el punto medio de cada solape
+    """
+    bounds = [0]
+    for current, following in zip(positions, positions[1:]):
+        bounds.append((following + current + size) // 2)
+    bounds.append(length)
+    return bounds
+
+
+def tile_grid(height, width, size, overlap):
+    xs = _positions(width, size, overlap)
+    ys = _positions(height, size, overlap)
+    x_bounds = _core_bounds(xs, size, width)
+    y_bounds = _core_bounds(ys, size, height)
+    return [
+        Tile(x, y, min(width, x + size), min(height, y + size),
+             x_bounds[column], y_bounds[row], x_bounds[column + 1], y_bounds[row + 1])
+        for row, y in enumerate(ys)
+        for column, x in enumerate(xs)
+    ]
+
+
+def box_bounds(kind, box):
+    """
+    (x0, y0, x1, y1) de una caja horizontal [x_min, x_max, y_min, y_max] o de cuatro puntos
+    """
+    if kind == "horizontal":
+        x_min, x_max, y_min, y_max = box
+        return x_min, y_min, x_max, y_max
+    xs = [point[0] for point in box]
+    ys = [point[1] for point in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+class _Box:
+    """
+    Caja detectada en una tesela, ya en coordenadas de la imagen completa
+    """
+    __slots__ = ("kind", "box", "x0", "y0", "x1", "y1", "tile", "cut", "interior")
+
+    def __init__(self, kind, box, tile_index, tile, height, width):
+        self.kind = kind
+        self.box = box
+        self.x0, self.y0, self.x1, self.y1 = box_bounds(kind, box)
+        self.tile = tile_index
+        # Cortada: toca un borde de la tesela que no es borde de la imagen
+        self.cut = (
+            (tile.x0 > 0 and self.x0 <= tile.x0 + _EDGE_TOLERANCE)
+            or (tile.y0 > 0 and self.y0 <= tile.y0 + _EDGE_TOLERANCE)
+            or (tile.x1 < width and self.x1 >= tile.x1 - _EDGE_TOLERANCE)
+            or (tile.y1 < height and self.y1 >= tile.y1 - _EDGE_TOLERANCE)
+        )
+        self.interior = not self.cut and (
+            self.x0 >= tile.core_x0 and self.x1 <= tile.core_x1
+            and self.y0 >= tile.core_y0 and self.y1 <= tile.core_y1
+        )
+
+    @property
+    def area(self):
+        return max(0, self.x1 - self.x0) * max(0, self.y1 - self.y0)
+
+
+def _same_line(a, b):
+    """
+    Dos cajas de teselas distintas son la misma (o parte de la misma línea)
+    si se solapan en vertical al menos media altura y en horizontal al menos
+    media altura de letra (o la mitad de la más estrecha, para los
+    fragmentos que asoman por el borde de una tesela)
+    """
+    min_height = max(1, min(a.y1 - a.y0, b.y1 - b.y0))
+    min_width = max(1, min(a.x1 - a.x0, b.x1 - b.x0))
+    vertical = min(a.y1, b.y1) - max(a.y0, b.y0)
+    horizontal = min(a.x1, b.x1) - max(a.x0, b.x0)
+    return vertical >= 0.5 * min_height and horizontal >= 0.5 * min(min_height, min_width)
+
+
+def _shift(kind, box, dx, dy):
+    if kind == "horizontal":
+        x_min, x_max, y_min, y_max = box
+        return [x_min + dx, x_max + dx, y_min + dy, y_max + dy]
+    return [[x + dx, y + dy] for x, y in box]
+
+
+def merge_boxes(boxes):
+    """
+    Elimina los duplicados de las costuras; devuelve [(tipo, caja)]
+    """
+    unique = [box for box in boxes if box.interior]
+    pending = [box for box in boxes if not box.interior]
+
+    # Grupos de cajas de teselas distintas que se solapan (union-find)
+    parent = list(range(len(pending)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    order = sorted(range(len(pending)), key=lambda index: pending[index].x0)
+    for position, first in enumerate(order):
+        a = pending[first]
+        for second in order[position + 1:]:
+            b = pending[second]
+            if b.x0 > a.x1:
+                break
+            if a.tile != b.tile and _same_line(a, b):
+                parent[find(first)] = find(second)
+    groups = {}
+    for index, box in enumerate(pending):
+        groups.setdefault(find(index), []).append(box)
+
+    if unique:
+        unique_bounds = np.array([[box.x0, box.y0, box.x1, box.y1] for box in unique], dtype=np.float64)
+
+    merged = [(box.kind, box.box) for box in unique]
+    for members in groups.values():
+        x0 = min(box.x0 for box in members)
+        y0 = min(box.y0 for box in members)
+        x1 = max(box.x1 for box in members)
+        y1 = max(box.y1 for box in members)
+
+        if unique:
+            # Cajas únicas en la misma línea que el grupo: si cubren casi todo
+            # su ancho, el grupo es una copia
+            heights = np.minimum(unique_bounds[:, 3] - unique_bounds[:, 1], y1 - y0).clip(min=1)
+            vertical = np.minimum(unique_bounds[:, 3], y1) - np.maximum(unique_bounds[:, 1], y0)
+            left = np.maximum(unique_bounds[:, 0], x0)
+            right = np.minimum(unique_bounds[:, 2], x1)
+            matches = (vertical >= 0.5 * heights) & (right > left)
+            if matches.any():
+                covered = np.zeros(max(1, int(np.ceil(x1 - x0))), dtype=bool)
+                for start, end in zip(left[matches], right[matches]):
+                    covered[int(start - x0):int(np.ceil(end - x0))] = True
+                if covered.mean() >= 0.8:
+                    continue
+
+        # Una caja que no toca el borde de su tesela y abarca todo el grupo
+        # es la detección completa; si no, la línea cruza la costura
+        union_area = (x1 - x0) * (y1 - y0)
+        whole = [box for box in members if not box.cut and box.area >= 0.9 * union_area]
+        if whole:
+            best = max(whole, key=lambda box: box.area)
+            merged.append((best.kind, best.box))
+        else:
+            merged.append(("horizontal", [int(x0), int(np.ceil(x1)), int(y0), int(np.ceil(y1))]))
+    return merged
+
+
+class TiledOCR:
+    """
+    Divide en teselas las imágenes cuyo lado mayor supera `min_long_side`.
+    Las funciones de detección y reconocimiento las pone quien llama, de
+    modo que el preprocesado y el motor de OCR no dependen de este módulo.
+    """
+
+    def __init__(self, tile_size=1600, overlap=200, min_long_side=2560, workers=None):
+        if overlap >= tile_size:
+            raise ValueError("El solape debe ser menor que el tamaño de tesela")
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.min_long_side = min_long_side
+        # Hilos compartidos por todas las imágenes del proceso; con 1 las
+        # teselas se procesan en el hilo que llama, sin executor
+        self.workers = workers or max(1, min(4, os.cpu_count() or 1))
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, max_workers=None):
+        """
+        Devuelve el divisor configurado con OCR_TILE_SIZE, OCR_TILE_OVERLAP,
+        OCR_TILE_MIN_SIDE y OCR_TILE_WORKERS, o None si OCR_TILING=0.
+        `max_workers` acota los hilos de teselas (por defecto, los del pool
+        de OCR que lo usa)
+        """
+        if os.getenv("OCR_TILING", "1") == "0":
+            return None
+        workers = int(os.getenv("OCR_TILE_WORKERS", "0")) or max_workers
+        if workers and max_workers:
+            workers = min(workers, max_workers)
+        return cls(
+            tile_size=int(os.getenv("OCR_TILE_SIZE", "1600")),
+            overlap=int(os.getenv("OCR_TILE_OVERLAP", "200")),
+            min_long_side=int(os.getenv("OCR_TILE_MIN_SIDE", "2560")),
+            workers=workers,
+        )
+
+    @property
+    def cache_params(self):
+        return {"tile_size": self.tile_size, "overlap": self.overlap, "min_long_side": self.min_long_side}
+
+    def applies(self, image_array):
+        return max(image_array.shape[:2]) > self.min_long_side
+
+    def _map(self, fn, items):
+        if self.workers == 1:
+            return [fn(item) for item in items]
+        # Un executor por proceso: los hilos no sobreviven a un fork
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="ocr-tile")
+                self._pid = os.getpid()
+        return list(self._executor.map(fn, items))
+
+    def detect(self, image_array, detect_tile):
+        """
+        Detecta por teselas; `detect_tile(vista)` devuelve (horizontal_list,
+        free_list) en coordenadas de la tesela. Devuelve [(tipo, caja)] sin
+        duplicados en coordenadas de la imagen
+        """
+        height, width = image_array.shape[:2]
+        tiles = tile_grid(height, width, self.tile_size, self.overlap)
+
+        def run(indexed):
+            index, tile = indexed
+            horizontal_list, free_list = detect_tile(image_array[tile.y0:tile.y1, tile.x0:tile.x1])
+            return [
+                _Box(kind, _shift(kind, box, tile.x0, tile.y0), index, tile, height, width)
+                for kind, boxes in (("horizontal", horizontal_list), ("free", free_list))
+                for box in boxes
+            ]
+
+        boxes = [box for tile_boxes in self._map(run, list(enumerate(tiles))) for box in tile_boxes]
+        return tiles, merge_boxes(boxes)
+
+    def read_text(self, image_array, detect_tile, recognize_window):
+        """
+        Detección por teselas y reconocimiento por ventanas.
+        `recognize_window(vista, horizontal_list, free_list)` devuelve
+        resultados con el formato de readtext en coordenadas de la ventana
+        """
+        height, width = image_array.shape[:2]
+        tiles, boxes = self.detect(image_array, detect_tile)
+
+        # Cada caja se reconoce en la tesela que contiene su centro
+        assigned = {}
+        for kind, box in boxes:
+            x0, y0, x1, y1 = box_bounds(kind, box)
+            center_x, center_y = (x0 + x1) / 2, (y0 + y1) / 2
+            for index, tile in enumerate(tiles):
+                if tile.core_x0 <= center_x < tile.core_x1 and tile.core_y0 <= center_y < tile.core_y1:
+                    break
+            assigned.setdefault(index, []).append((kind, box))
+
+        def run(members):
+            bounds = np.array([box_bounds(kind, box) for kind, box in members], dtype=np.float64)
+            x0 = max(0, int(bounds[:, 0].min()) - _WINDOW_PADDING)
+            y0 = max(0, int(bounds[:, 1].min()) - _WINDOW_PADDING)
+            x1 = min(width, int(np.ceil(bounds[:, 2].max())) + _WINDOW_PADDING)
+            y1 = min(height, int(np.ceil(bounds[:, 3].max())) + _WINDOW_PADDING)
+            results = recognize_window(
+                image_array[y0:y1, x0:x1],
+                [_shift(kind, box, -x0, -y0) for kind, box in members if kind == "horizontal"],
+                [_shift(kind, box, -x0, -y0) for kind, box in members if kind == "free"],
+            )
+            return [(_shift("free", bbox, x0, y0), text, confidence) for bbox, text, confidence in results]
+
+        results = [result for window in self._map(run, list(assigned.values())) for result in window]
+        # Orden de lectura aproximado, como readtext
+        results.sort(key=lambda result: (min(point[1] for point in result[0]), min(point[0] for point in result[0])))
+        return results